@@ -1,57 +1,128 @@
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, render_template, jsonify, Response, stream_with_context, g
+import uuid
 import os
+import logging
 import mysql.connector
+from mysql.connector import errorcode
 import pandas as pd
-from pymongo import MongoClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from bson import json_util
 from werkzeug.utils import secure_filename
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
+import re
 import random
+import tarfile
+import time
+import zipfile
+from functools import partial
 from flask_cors import CORS
-from space import natural_language_to_sql
+import state
 from state import set_last_uploaded_table, get_last_uploaded_table
+from db import get_db_connection, get_mongo_connection, pool_stats, SQL_BACKEND
+from jobs import (reserve_job, start_job, release_job, wait_job, get_job, list_jobs, cancel_job, submit_batch,
+                  wait_batch, batch_status, SKIPPED, REJECTED, SUCCEEDED)
+import catalog
+import results
+import query_cache
+import translation_cache
+import mongo_pipeline
+import index_advisor
+import cost_guard
+import manifest
+import metrics
+import sql_types
 
 
 app = Flask(__name__)
 CORS(app) 
 
+# Logging: CHATDB_LOG_LEVEL=DEBUG turns on the translator's per-token trace
+LOG_LEVEL = os.environ.get('CHATDB_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = 'ts=%(asctime)s level=%(levelname)s logger=%(name)s msg="%(message)s"'
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+logger = logging.getLogger('chatdb')
+
 # Configure file upload settings
-DB_TYPE=0
+DB_TYPE = SQL_BACKEND  # Backend for CSV tables: 'mysql' or the in-process 'sqlite' (CHATDB_SQL_BACKEND)
 UPLOAD_FOLDER = 'uploads/'
-ALLOWED_EXTENSIONS = {'csv', 'json'}
+ALLOWED_EXTENSIONS = {'csv', 'json', 'ndjson', 'jsonl'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Bulk loading settings for CSV uploads
+INSERT_BATCH_SIZE = 5000  # Rows per multi-row executemany batch
+ENABLE_LOAD_DATA_INFILE = DB_TYPE == 'mysql'  # Try LOAD DATA LOCAL INFILE first when the server allows it
+
+# Streaming ingest settings for large CSV uploads
+CSV_CHUNK_SIZE = 50000  # Rows read from disk per chunk
+SCHEMA_SAMPLE_ROWS = 10000  # Rows used to infer the initial table schema
+EMPTY_COLUMN_TYPE = 'VARCHAR(255)'  # Columns with no values to infer a type from
+STREAMING_THRESHOLD_BYTES = 50 * 1024 * 1024  # Files above this size are streamed automatically
+
+# Multi-file uploads: every file, and every member of a zip/tar archive, becomes its own ingest job
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+MAX_ARCHIVE_MEMBERS = 1000  # Files taken from one archive
+MAX_ARCHIVE_BYTES = 20 * 1024 ** 3  # Uncompressed bytes taken from one archive
+UPLOAD_WAIT_SECONDS = 300  # wait=true uploads answer with the job's status URL once a load runs this long
+
+# Upload write modes: 'replace' drops and reloads; 'append' and 'upsert' merge into what is already loaded
+WRITE_MODES = ('replace', 'append', 'upsert')
+STAGING_TABLE_SUFFIX = '_chatdb_staging'  # Temporary table an append/upsert CSV is streamed into first
+UNIQUE_KEY_PREFIX = 'uq_chatdb_'  # Unique index created on an upsert key that has none
+
+# Streaming ingest settings for JSON uploads
+JSON_READ_BLOCK_SIZE = 1024 * 1024  # Characters read from disk per parser refill
+MONGO_INSERT_BATCH_SIZE = 1000  # Documents per unordered insert_many
+MAX_REPORTED_ERRORS = 5  # Write errors echoed back per failed batch
+LEARN_JSON_FIELD_TYPES = False  # Only date-parse fields that held dates in the first batch
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+# Each client gets its own "current table": API clients send X-ChatDB-Session, browsers get a cookie
+@app.before_request
+def resolve_session():
+    session_id = request.headers.get(state.SESSION_HEADER) or request.cookies.get(state.SESSION_COOKIE)
+    g.new_session = not state.valid_session_id(session_id)
+    g.session_id = uuid.uuid4().hex if g.new_session else session_id
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.observe('request_seconds', time.perf_counter() - started, endpoint=request.endpoint or 'unknown',
+                        method=request.method, status=str(response.status_code))
+    return response
+
+@app.after_request
+def set_session_cookie(response):
+    if g.get('new_session') and not request.headers.get(state.SESSION_HEADER):
+        response.set_cookie(state.SESSION_COOKIE, g.session_id, httponly=True, samesite='Lax')
+    return response
+
+def timed_jsonify(payload, status=200):
+    """jsonify(payload), timed as the request's serialize stage."""
+    with metrics.stage('serialize'):
+        return jsonify(payload), status
+
+def timed_result_response(payload, result_format, status=200):
+    """An execute_query result encoded in the negotiated format, timed as the serialize stage."""
+    with metrics.stage('serialize'):
+        body, mimetype = results.encode_response(payload, result_format)
+    return Response(body, status=status, mimetype=mimetype)
+
 # Function to check allowed file extensions
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# MySQL connection function
-def get_db_connection():
-    conn = mysql.connector.connect(
-        host="localhost",
-        port=3306,
-        user="root",
-        password="",
-        database="dsci551",
-        auth_plugin="mysql_native_password"
-    )
-    return conn
-
-# MongoDB connection function
-def get_mongo_connection():
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client["chatdb"]
-    return db
-
-
 # Route to serve the main page
 @app.route('/')
 def index():
     return render_template('index.html')
 
 # Route to handle file upload
-# Global variable to store the name of the last uploaded table
-last_uploaded_table = None
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -62,151 +133,928 @@ def upload_file():
     if file.filename == '':
         return jsonify({'message': 'No selected file'}), 400
 
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-
-        collection_name = filename.rsplit('.', 1)[0]
-        if filename.endswith('.csv'):
-            table_name = collection_name
-            process_csv_file_and_load_to_db(filepath, table_name)
-            set_last_uploaded_table(table_name)
-        elif filename.endswith('.json'):
-            process_json_file_and_load_to_mongo(filepath, collection_name)
-            set_last_uploaded_table(collection_name)
+    job, response, status = prepare_upload(file.filename, file.stream, request.form)
+    if job is None:
+        return jsonify(response), status
+
+    # wait=true answers with the load's result, as long as it finishes within UPLOAD_WAIT_SECONDS
+    if request.form.get('wait', 'false').lower() == 'true' and wait_job(job, UPLOAD_WAIT_SECONDS):
+        if job.status != SUCCEEDED:
+            return jsonify(job.to_dict()), 500
+        response['load'] = job.result
+        return jsonify(response), 200
+
+    response['job_id'] = job.job_id
+    response['status_url'] = f"/api/jobs/{job.job_id}"
+    return jsonify(response), 202
+
+
+# Several files and/or zip/tar archives in one request; results are reported per file
+@app.route('/api/upload/batch', methods=['POST'])
+def upload_batch():
+    files = [file for file in request.files.getlist('file') if file.filename]
+    if not files:
+        return jsonify({'message': 'No file part'}), 400
+
+    entries = []
 
-        return jsonify({'message': 'File successfully uploaded', 'filename': filename}), 200
+    def dispatch(filename, stream):
+        job, response, status = prepare_upload(filename, stream, request.form)
+        if job is None:
+            entries.append(dict(response, status=SKIPPED if response.get('skipped') else REJECTED))
+            return
+        entries.append(job)
+
+    for file in files:
+        if not is_archive(file.filename):
+            dispatch(file.filename, file.stream)
+            continue
+        try:
+            # Members are loaded while the rest of the archive is still being unpacked
+            for name, member in iter_archive_members(file.filename, file.stream):
+                dispatch(name, member)
+        except ValueError as e:
+            entries.append({'filename': file.filename, 'status': REJECTED, 'message': str(e)})
+        except (zipfile.BadZipFile, tarfile.TarError) as e:
+            entries.append({'filename': file.filename, 'status': REJECTED, 'message': f"Unreadable archive: {e}"})
+
+    batch_id = submit_batch(entries)
+    if request.form.get('wait', 'false').lower() == 'true' and wait_batch(batch_id, UPLOAD_WAIT_SECONDS):
+        return jsonify(batch_status(batch_id)), 200
+    response = batch_status(batch_id)
+    response['status_url'] = f"/api/upload/batch/{batch_id}"
+    return jsonify(response), 202
+
+
+@app.route('/api/upload/batch/<batch_id>', methods=['GET'])
+def upload_batch_status(batch_id):
+    status = batch_status(batch_id)
+    if status is None:
+        return jsonify({'error': 'Unknown batch id'}), 404
+    return jsonify(status), 200
+
+
+def is_archive(filename):
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def archive_data_name(name):
+    """The file name an archive member is loaded under, or None for directories and hidden/metadata files."""
+    base = os.path.basename(name)
+    if not base or base.startswith('.') or name.startswith('__MACOSX/'):
+        return None
+    return base
+
+
+def check_archive_index(filename, index):
+    """Reject an archive before anything in it is written: too many files or declared bytes, or two
+    data files that would be saved and loaded under one name (d1/x.csv and d2/x.csv)."""
+    members = [(name, size) for name, size in index if archive_data_name(name)]
+    if len(members) > MAX_ARCHIVE_MEMBERS or sum(size for _, size in members) > MAX_ARCHIVE_BYTES:
+        raise ValueError(f"{filename} has more than {MAX_ARCHIVE_MEMBERS} files or "
+                         f"{MAX_ARCHIVE_BYTES} uncompressed bytes")
+    targets = {}
+    for name, _ in members:
+        base = archive_data_name(name)
+        if not allowed_file(base):
+            continue
+        target = secure_filename(base)
+        if target in targets:
+            raise ValueError(f"{filename} has more than one file named {target}: {targets[target]} and {name}")
+        targets[target] = name
+
+
+class CappedReader:
+    """An archive member's file object that raises ValueError once more than limit bytes were read from it."""
+
+    def __init__(self, member, limit, filename):
+        self.member = member
+        self.limit = limit
+        self.filename = filename
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        block = self.member.read(size)
+        self.bytes_read += len(block)
+        if self.bytes_read > self.limit:
+            raise ValueError(f"{self.filename} has more than {MAX_ARCHIVE_BYTES} uncompressed bytes")
+        return block
+
+
+def iter_archive_members(filename, stream):
+    """Yield (file name, file object) for each data file in a zip or tar archive, in archive order.
+
+    The archive's file list is checked with check_archive_index before the first member is
+    yielded: a zip's index is at its end, and a tar's names are collected in a first streamed
+    pass over the spooled upload before a second pass unpacks it one member at a time.
+    Directories and hidden/metadata files are skipped. Raises ValueError for a rejected index,
+    or once the members read exceed MAX_ARCHIVE_BYTES, whatever sizes the archive declares.
+    """
+    if filename.lower().endswith('.zip'):
+        archive = zipfile.ZipFile(stream)
+        infos = [info for info in archive.infolist() if not info.is_dir()]
+        check_archive_index(filename, [(info.filename, info.file_size) for info in infos])
+        members = ((info.filename, info) for info in infos)
+        open_member = archive.open
     else:
-        return jsonify({'message': 'Invalid file type'}), 400
+        with tarfile.open(fileobj=stream, mode='r|*') as index:
+            check_archive_index(filename, [(info.name, info.size) for info in index if info.isfile()])
+        stream.seek(0)
+        archive = tarfile.open(fileobj=stream, mode='r|*')
+        members = ((info.name, info) for info in archive if info.isfile())
+        open_member = archive.extractfile
+    total = 0
+    with archive:
+        for name, info in members:
+            base = archive_data_name(name)
+            if base is None:
+                continue
+            with open_member(info) as member:
+                reader = CappedReader(member, MAX_ARCHIVE_BYTES - total, filename)
+                yield base, reader
+                total += reader.bytes_read
+
+
+def prepare_upload(filename, stream, form):
+    """Save one uploaded file and queue its load, with the upload form's options.
+
+    Returns (job, response, status): job is None when the file is rejected or already loaded,
+    with the response and HTTP status to answer; otherwise it is the queued ingest job.
+    """
+    if not allowed_file(filename):
+        return None, {'message': 'Invalid file type', 'filename': filename}, 400
+    filename = secure_filename(filename)
+    collection_name = filename.rsplit('.', 1)[0]
+    # Claim the table before its file is written, so a second upload can't overwrite a file being loaded
+    job, running = reserve_job(filename, collection_name)
+    if running:
+        return None, {'message': f"{collection_name} is already being loaded", 'filename': filename,
+                      'job_id': running.job_id}, 409
+    try:
+        load, response, status = build_upload_load(filename, collection_name, stream, form)
+    except BaseException:
+        release_job(job)
+        raise
+    if load is None:
+        release_job(job)
+        return None, response, status
+    # The job finishes outside this request, so remember whose table it becomes
+    session_id = state.current_session_id()
+    start_job(job, load, on_success=lambda result: set_last_uploaded_table(collection_name, session_id))
+    return job, response, None
+
+
+def build_upload_load(filename, collection_name, stream, form):
+    """Save an upload and build its loader. Returns (load, response, status); load is None if it isn't loaded."""
+    # write_mode=append|upsert merges into the existing table/collection; upsert needs key=col[,col...]
+    write_mode = form.get('write_mode', 'replace').lower()
+    key_columns = parse_key_columns(form.get('key'))
+    if write_mode not in WRITE_MODES:
+        return None, {'message': f"write_mode must be one of {', '.join(WRITE_MODES)}", 'filename': filename}, 400
+    if write_mode == 'upsert' and not key_columns:
+        return None, {'message': 'An upsert needs key: the column(s) that identify a row', 'filename': filename}, 400
+
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    sha256, size = manifest.save_and_hash(stream, filepath)
+    upload = {'filename': filename, 'sha256': sha256, 'bytes': size}
+    target_db = 'mysql' if filename.endswith('.csv') else 'mongodb'
+
+    # The same contents are already loaded the same way: skip the reload unless force=true
+    if form.get('force', 'false').lower() != 'true':
+        loaded = manifest.loaded_file(target_db, collection_name, sha256, write_mode)
+        if loaded:
+            set_last_uploaded_table(collection_name)
+            return None, {'message': 'File already loaded', 'filename': filename, 'skipped': True,
+                          'sha256': sha256, 'loaded': loaded}, 200
+
+    if target_db == 'mysql':
+        batch_size = form.get('batch_size', INSERT_BATCH_SIZE, type=int)
+        mode = form.get('mode', 'auto')
+        if write_mode == 'upsert':
+            try:
+                match_key_columns(key_columns, list(pd.read_csv(filepath, nrows=0).columns))
+            except ValueError as e:
+                return None, {'message': str(e), 'filename': filename}, 400
+        if write_mode != 'replace':
+            load = partial(merge_csv_file_into_table, filepath, collection_name, write_mode=write_mode,
+                           key_columns=key_columns, batch_size=batch_size)
+        elif mode == 'stream' or (mode == 'auto' and size > STREAMING_THRESHOLD_BYTES):
+            sample_method = form.get('sample', 'head')
+            load = partial(stream_csv_file_to_db, filepath, collection_name, batch_size=batch_size,
+                           sample_method=sample_method)
+        else:
+            load = partial(process_csv_file_and_load_to_db, filepath, collection_name, batch_size=batch_size)
+    else:
+        batch_size = form.get('batch_size', MONGO_INSERT_BATCH_SIZE, type=int)
+        load = partial(process_json_file_and_load_to_mongo, filepath, collection_name, batch_size=batch_size,
+                       write_mode=write_mode, key_fields=key_columns)
+    load = partial(load_and_record, load, target_db, collection_name, upload, write_mode)
+    load = partial(load_and_invalidate, load, target_db, collection_name, replaced=write_mode == 'replace')
+    return load, {'message': 'File successfully uploaded', 'filename': filename, 'sha256': sha256}, None
 
 
+def load_and_record(load, db_type, name, upload, write_mode, progress=None):
+    """Run a loader and note the file in the upload manifest; a failed load leaves the table unknown."""
+    try:
+        result = load(progress=progress)
+    except Exception:
+        manifest.forget(db_type, name)
+        raise
+    manifest.record(db_type, name, upload, write_mode, result)
+    return result
+
+
+def load_and_invalidate(load, db_type, name, progress=None, replaced=True):
+    """Run a loader, then drop the table/collection's cached schema and query results either way."""
+    try:
+        with metrics.stage('ingest'):
+            return load(progress=progress)
+    finally:
+        catalog.invalidate(db_type, name)
+        query_cache.bump(db_type, name)
+        # Reloading drops and recreates the table, and its indexes with it; appends and upserts keep them
+        if replaced:
+            index_advisor.forget(db_type, name)
+        translation_cache.bump(name)
+
+
+# Routes to follow and cancel background upload jobs
+@app.route('/api/jobs', methods=['GET'])
+def jobs_index():
+    return jsonify({'jobs': [job.to_dict() for job in list_jobs()]}), 200
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    job = cancel_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+def sql_type_for_series(series):
+    """Smallest MySQL type that holds the column's values (see sql_types)."""
+    return sql_types.infer_sql_type(series) or EMPTY_COLUMN_TYPE
+
 def create_table_from_csv(conn, df, table_name):
+    """Recreate the table with types inferred from the DataFrame. Returns a {column: sql_type} mapping."""
     cursor = conn.cursor()
     cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
     conn.commit()
 
-    column_definitions = []
-    for col in df.columns:
-        col_type = df[col].dtype
-        if col_type == 'int64':
-            sql_type = 'INT'
-        elif col_type == 'float64':
-            sql_type = 'FLOAT'
-        elif col_type == 'bool':
-            sql_type = 'BOOLEAN'
-        elif pd.api.types.is_datetime64_any_dtype(df[col]):
-            sql_type = 'DATETIME'
-        else:
-            sql_type = 'VARCHAR(255)'
-        column_definitions.append(f"{col} {sql_type}")
+    column_types = {col: sql_type_for_series(df[col]) for col in df.columns}
+    column_definitions = [f"{col} {sql_type}" for col, sql_type in column_types.items()]
 
     columns = ", ".join(column_definitions)
     cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns});")
     conn.commit()
+    return column_types
+
+def dataframe_to_rows(df, column_types=None):
+    """Convert a DataFrame into insertable tuples, mapping NaN to NULL one column at a time.
+
+    With column_types, date-like text in DATE/DATETIME/TIME columns is rewritten in ISO form.
+    """
+    columns = []
+    for col in df.columns:
+        values = df[col]
+        if column_types:
+            values = sql_types.convert_for_insert(values, column_types[col])
+        columns.append(values.astype(object).where(values.notna(), None).tolist())
+    return list(zip(*columns))
+
+def insert_rows_batched(conn, table_name, columns, rows, batch_size=INSERT_BATCH_SIZE, progress=None):
+    """Insert rows with multi-row executemany batches. Returns (inserted, failed) counts.
+
+    progress, if given, is called with the rows inserted after every batch.
+    """
+    placeholders = ", ".join(["%s"] * len(columns))
+    insert_query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+
+    inserted = 0
+    failed = 0
+    cursor = conn.cursor()
+    try:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            batch_inserted = 0
+            try:
+                cursor.executemany(insert_query, batch)
+                conn.commit()
+                batch_inserted = len(batch)
+            except mysql.connector.Error as err:
+                logger.warning("Error inserting rows %d-%d into %s: %s", start, start + len(batch) - 1, table_name, err)
+                conn.rollback()
+                failed += len(batch)
+            inserted += batch_inserted
+            if progress:
+                progress(batch_inserted)
+    finally:
+        cursor.close()
+    return inserted, failed
+
+def local_infile_enabled(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SHOW GLOBAL VARIABLES LIKE 'local_infile'")
+        row = cursor.fetchone()
+        return bool(row) and str(row[1]).upper() in ('ON', '1')
+    except mysql.connector.Error:
+        return False
+    finally:
+        cursor.close()
+
+def load_csv_with_infile(conn, filepath, table_name, columns, date_formats=None):
+    """Load a CSV with LOAD DATA LOCAL INFILE, treating empty fields as NULL.
+
+    date_formats maps date-like columns to the strptime format their text uses.
+    """
+    with open(filepath, 'rb') as f:
+        first_line = f.readline()
+    line_terminator = '\\r\\n' if first_line.endswith(b'\r\n') else '\\n'
+
+    variables = [f"@v{i}" for i in range(len(columns))]
+    date_formats = date_formats or {}
+    assignments = ", ".join(
+        f"{col} = STR_TO_DATE(NULLIF({var}, ''), '{sql_types.mysql_date_format(date_formats[col])}')"
+        if col in date_formats else f"{col} = NULLIF({var}, '')"
+        for col, var in zip(columns, variables)
+    )
+    load_query = (
+        f"LOAD DATA LOCAL INFILE %s INTO TABLE {table_name} "
+        f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+        f"LINES TERMINATED BY '{line_terminator}' IGNORE 1 LINES "
+        f"({', '.join(variables)}) SET {assignments}"
+    )
 
-def process_csv_file_and_load_to_db(filepath, table_name):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(load_query, (os.path.abspath(filepath),))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+def process_csv_file_and_load_to_db(filepath, table_name, batch_size=INSERT_BATCH_SIZE, progress=None):
+    start_time = time.perf_counter()
     df = pd.read_csv(filepath)
+    conn = get_db_connection(allow_local_infile=ENABLE_LOAD_DATA_INFILE)
+    try:
+        column_types = create_table_from_csv(conn, df, table_name)
+        columns = list(df.columns)
+
+        method = None
+        inserted = 0
+        failed = 0
+        # LOAD DATA can't parse pandas' bool/datetime representations, so only use it for plain columns
+        infile_compatible = all(
+            pd.api.types.is_integer_dtype(df[col]) or pd.api.types.is_float_dtype(df[col])
+            or pd.api.types.is_string_dtype(df[col]) or df[col].dtype == object
+            for col in columns
+        )
+        if ENABLE_LOAD_DATA_INFILE and infile_compatible and local_infile_enabled(conn):
+            date_formats = {}
+            for col, sql_type in column_types.items():
+                if sql_type in sql_types.TEMPORAL_FORMATS and pd.api.types.is_string_dtype(df[col]):
+                    fmt = sql_types.temporal_format(df[col].dropna().astype(str), sql_type)
+                    if fmt not in sql_types.NATIVE_FORMATS:
+                        date_formats[col] = fmt
+            try:
+                inserted = load_csv_with_infile(conn, filepath, table_name, columns, date_formats)
+                method = 'load_data_infile'
+                if progress:
+                    progress(inserted)
+            except mysql.connector.Error as err:
+                logger.warning("LOAD DATA LOCAL INFILE failed, falling back to batched inserts: %s", err)
+                conn.rollback()
+
+        if method is None:
+            inserted, failed = insert_rows_batched(conn, table_name, columns, dataframe_to_rows(df, column_types),
+                                                   batch_size, progress)
+            method = 'executemany'
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        'method': method,
+        'rows': inserted,
+        'failed_rows': failed,
+        'column_types': column_types,
+        'estimated_row_bytes': sql_types.estimate_row_width(df, column_types),
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(inserted / elapsed, 1) if elapsed > 0 else None
+    }
+
+def observed_sql_type(series):
+    """SQL type needed for the non-null values of one chunk, or None if the chunk has none."""
+    return sql_types.infer_sql_type(series, strict=False)
+
+def widen_columns_for_chunk(conn, table_name, column_types, chunk):
+    """ALTER any column whose sampled type can't hold this chunk. Returns the changes made."""
+    changes = []
+    cursor = conn.cursor()
+    for col in chunk.columns:
+        current = column_types[col]
+        widened = sql_types.widen_sql_type(current, observed_sql_type(chunk[col]))
+        if widened != current:
+            cursor.execute(f"ALTER TABLE {table_name} MODIFY COLUMN {col} {widened}")
+            column_types[col] = widened
+            changes.append({'column': col, 'from': current, 'to': widened})
+    cursor.close()
+    return changes
+
+def reservoir_sample_csv(filepath, sample_size, chunk_size=CSV_CHUNK_SIZE):
+    """Uniform random sample of CSV rows in one pass without holding the whole file."""
+    reservoir = []
+    columns = None
+    seen = 0
+    for chunk in pd.read_csv(filepath, chunksize=chunk_size):
+        columns = list(chunk.columns)
+        fill = max(0, min(sample_size - seen, len(chunk)))
+        if fill:
+            reservoir.extend(chunk.iloc[:fill].to_dict('records'))
+        replacements = {}
+        for pos in range(fill, len(chunk)):
+            slot = random.randrange(seen + pos + 1)
+            if slot < sample_size:
+                replacements[slot] = pos
+        if replacements:
+            rows = chunk.iloc[list(replacements.values())].to_dict('records')
+            for slot, row in zip(replacements.keys(), rows):
+                reservoir[slot] = row
+        seen += len(chunk)
+    return pd.DataFrame(reservoir, columns=columns)
+
+def read_csv_sample(filepath, sample_size=SCHEMA_SAMPLE_ROWS, sample_method='head'):
+    if sample_method == 'reservoir':
+        return reservoir_sample_csv(filepath, sample_size)
+    return pd.read_csv(filepath, nrows=sample_size)
+
+def stream_csv_file_to_db(filepath, table_name, batch_size=INSERT_BATCH_SIZE, chunk_size=CSV_CHUNK_SIZE,
+                          sample_size=SCHEMA_SAMPLE_ROWS, sample_method='head', progress=None):
+    """Load a CSV in fixed-size chunks so memory stays flat regardless of file size."""
+    start_time = time.perf_counter()
+    sample = read_csv_sample(filepath, sample_size, sample_method)
     conn = get_db_connection()
-    create_table_from_csv(conn, df, table_name)
+    inserted = 0
+    failed = 0
+    chunks = 0
+    widened = []
+    try:
+        column_types = create_table_from_csv(conn, sample, table_name)
+        columns = list(sample.columns)
+
+        for chunk in pd.read_csv(filepath, chunksize=chunk_size):
+            widened.extend(widen_columns_for_chunk(conn, table_name, column_types, chunk))
+            chunk_inserted, chunk_failed = insert_rows_batched(conn, table_name, columns,
+                                                               dataframe_to_rows(chunk, column_types),
+                                                               batch_size, progress)
+            inserted += chunk_inserted
+            failed += chunk_failed
+            chunks += 1
+        # The sample stands in for the data; widened columns are sized by their final type
+        row_bytes = sql_types.estimate_row_width(sample, column_types)
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        'method': 'streaming',
+        'rows': inserted,
+        'failed_rows': failed,
+        'chunks': chunks,
+        'column_types': column_types,
+        'estimated_row_bytes': row_bytes,
+        'widened_columns': widened,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(inserted / elapsed, 1) if elapsed > 0 else None
+    }
+
+def parse_key_columns(key):
+    """'a, b' -> ['a', 'b']: the columns/fields an upsert matches existing rows on."""
+    return [column.strip() for column in (key or '').split(',') if column.strip()]
+
+def match_key_columns(key_columns, columns):
+    """The upload's spelling of each key column; raises ValueError for keys it doesn't have."""
+    by_name = {col.lower(): col for col in columns}
+    missing = [key for key in key_columns if key.lower() not in by_name]
+    if not key_columns or missing:
+        raise ValueError(f"Upsert key column(s) not in the upload: {', '.join(missing) or '(none given)'}")
+    return [by_name[key.lower()] for key in key_columns]
+
+def describe_table_types(conn, table_name):
+    """{column: sql_type} for an existing table, or None if there is no such table."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DESCRIBE {table_name}")
+        return {row[0]: sql_types.from_described_type(row[1]) for row in cursor.fetchall()}
+    except mysql.connector.errors.ProgrammingError as err:
+        if err.errno == errorcode.ER_NO_SUCH_TABLE:
+            return None
+        raise
+    finally:
+        cursor.close()
 
-    columns = ", ".join(df.columns)
-    placeholders = ", ".join(["%s"] * len(df.columns))
-    insert_query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+def reconcile_table_schema(conn, table_name, existing_types, column_types):
+    """Add the upload's new columns to the table and widen columns that can't hold its values.
 
+    Columns the upload doesn't have are left alone. Returns the changes made.
+    """
+    existing = {col.lower(): (col, sql_type) for col, sql_type in existing_types.items()}
+    changes = []
     cursor = conn.cursor()
-    for index, row in df.iterrows():
-        try:
-            values = [None if pd.isna(value) else value for value in row]
-            cursor.execute(insert_query, tuple(values))
-        except mysql.connector.Error as err:
-            print(f"Error inserting row {index}: {err}")
-            conn.rollback()
-    conn.commit()
-    conn.close()
+    try:
+        for col, sql_type in column_types.items():
+            if col.lower() not in existing:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {col} {sql_type}")
+                changes.append({'column': col, 'added': sql_type})
+                continue
+            name, current = existing[col.lower()]
+            widened = sql_types.widen_sql_type(current, sql_type)
+            if widened != current:
+                cursor.execute(f"ALTER TABLE {table_name} MODIFY COLUMN {name} {widened}")
+                changes.append({'column': name, 'from': current, 'to': widened})
+    finally:
+        cursor.close()
+    return changes
 
-def preprocess_json_data(data):
-    if isinstance(data, dict):
-        for key, value in data.items():
-            if isinstance(value, dict):
+def ensure_unique_key(conn, table_name, key_columns):
+    """Create a unique index on key_columns unless the table has one; returns its name if created.
+
+    ON DUPLICATE KEY UPDATE finds the existing row through this index.
+    """
+    wanted = sorted(col.lower() for col in key_columns)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SHOW INDEX FROM `{table_name}`")
+        names = [desc[0] for desc in cursor.description]
+        unique = {}
+        for row in cursor.fetchall():
+            info = dict(zip(names, row))
+            if not int(info['Non_unique']):
+                unique.setdefault(info['Key_name'], []).append(info['Column_name'].lower())
+        if any(sorted(columns) == wanted for columns in unique.values()):
+            return None
+        target_types = {col.lower(): sql_type for col, sql_type in describe_table_types(conn, table_name).items()}
+        too_long = [col for col in key_columns if target_types.get(col.lower()) == 'TEXT']
+        if too_long:
+            raise ValueError(f"Upsert key column(s) hold text too long for a unique index: {', '.join(too_long)}")
+        name = index_advisor.index_name([col.lower() for col in key_columns], prefix=UNIQUE_KEY_PREFIX)
+        cursor.execute(f"CREATE UNIQUE INDEX `{name}` ON `{table_name}` ({', '.join(key_columns)})")
+        return name
+    finally:
+        cursor.close()
+
+def merge_csv_file_into_table(filepath, table_name, write_mode='append', key_columns=None,
+                              batch_size=INSERT_BATCH_SIZE, chunk_size=CSV_CHUNK_SIZE,
+                              sample_size=SCHEMA_SAMPLE_ROWS, progress=None):
+    """Append or upsert a CSV into a table without dropping it.
+
+    The file is streamed into a temporary staging table, then merged with one INSERT ... SELECT
+    (ON DUPLICATE KEY UPDATE on key_columns for upserts), so readers see the old rows until
+    that statement commits.
+    """
+    start_time = time.perf_counter()
+    sample = read_csv_sample(filepath, sample_size)
+    columns = list(sample.columns)
+    if write_mode == 'upsert':
+        key_columns = match_key_columns(key_columns or [], columns)
+    staging = f"{table_name}{STAGING_TABLE_SUFFIX}"
+    staged = 0
+    failed = 0
+    matched = None
+    unique_key = None
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        column_types = {col: sql_type_for_series(sample[col]) for col in columns}
+        definitions = ", ".join(f"{col} {sql_type}" for col, sql_type in column_types.items())
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging}")
+        cursor.execute(f"CREATE TEMPORARY TABLE {staging} ({definitions})")
+        for chunk in pd.read_csv(filepath, chunksize=chunk_size):
+            widen_columns_for_chunk(conn, staging, column_types, chunk)
+            chunk_staged, chunk_failed = insert_rows_batched(conn, staging, columns,
+                                                             dataframe_to_rows(chunk, column_types),
+                                                             batch_size, progress)
+            staged += chunk_staged
+            failed += chunk_failed
+
+        existing_types = describe_table_types(conn, table_name)
+        if existing_types is None:
+            definitions = ", ".join(f"{col} {sql_type}" for col, sql_type in column_types.items())
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({definitions})")
+            schema_changes = [{'column': col, 'added': sql_type} for col, sql_type in column_types.items()]
+        else:
+            schema_changes = reconcile_table_schema(conn, table_name, existing_types, column_types)
+
+        column_list = ", ".join(columns)
+        merge = f"INSERT INTO {table_name} ({column_list}) SELECT {column_list} FROM {staging}"
+        if write_mode == 'upsert':
+            unique_key = ensure_unique_key(conn, table_name, key_columns)
+            on_key = " AND ".join(f"s.{col} = t.{col}" for col in key_columns)
+            cursor.execute(f"SELECT COUNT(*) FROM {staging} s JOIN {table_name} t ON {on_key}")
+            matched = cursor.fetchone()[0]
+            updated = [col for col in columns if col not in key_columns] or key_columns[:1]
+            merge += " ON DUPLICATE KEY UPDATE " + ", ".join(f"{col} = VALUES({col})" for col in updated)
+        cursor.execute(merge)
+        conn.commit()
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging}")
+    finally:
+        cursor.close()
+        conn.close()
+
+    elapsed = time.perf_counter() - start_time
+    result = {
+        'method': write_mode,
+        'rows': staged,
+        'failed_rows': failed,
+        'column_types': column_types,
+        'schema_changes': schema_changes,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(staged / elapsed, 1) if elapsed > 0 else None
+    }
+    if write_mode == 'upsert':
+        result.update({'key': key_columns, 'matched_rows': matched, 'unique_key_created': unique_key})
+    return result
+
+# Strings must start like an ISO-8601 date before we pay for fromisoformat
+DATE_SHAPE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+def parse_iso_datetime(value):
+    """Return a datetime for ISO-8601 date strings, or None for anything else."""
+    if len(value) < 10 or value[4] != '-' or not DATE_SHAPE.match(value):
+        return None
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+def parse_extended_date(value):
+    """Convert the payload of a {"$date": ...} wrapper (ISO string or epoch millis)."""
+    if isinstance(value, dict) and '$numberLong' in value:
+        value = int(value['$numberLong'])
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    parsed = parse_iso_datetime(value) if isinstance(value, str) else None
+    return parsed if parsed is not None else value
+
+def normalize_json_document(document, date_fields=None, learned_date_fields=None):
+    """Normalize extended JSON ($oid, $date, $numberLong) and ISO date strings in place.
+
+    Walks the document with an explicit stack instead of recursion. If date_fields
+    is given, plain strings are only date-parsed at those field paths; if
+    learned_date_fields is given, every path where a date string was found is added to it.
+    """
+    track_paths = date_fields is not None or learned_date_fields is not None
+    stack = [(document, ())]
+    while stack:
+        container, path = stack.pop()
+        is_dict = isinstance(container, dict)
+        for key, value in (container.items() if is_dict else enumerate(container)):
+            field = path + (key,) if track_paths and is_dict else path
+            if isinstance(value, str):
+                if date_fields is not None and field not in date_fields:
+                    continue
+                parsed = parse_iso_datetime(value)
+                if parsed is not None:
+                    container[key] = parsed
+                    if learned_date_fields is not None:
+                        learned_date_fields.add(field)
+            elif isinstance(value, dict):
                 if '$oid' in value:
-                    data[key] = value['$oid']
+                    container[key] = value['$oid']
                 elif '$date' in value:
-                    try:
-                        data[key] = datetime.fromisoformat(value['$date'].replace("Z", "+00:00"))
-                    except ValueError:
-                        data[key] = value['$date']
+                    container[key] = parse_extended_date(value['$date'])
+                elif '$numberLong' in value:
+                    container[key] = int(value['$numberLong'])
                 else:
-                    preprocess_json_data(value)
+                    stack.append((value, field))
             elif isinstance(value, list):
-                for i, item in enumerate(value):
-                    preprocess_json_data(item)
-            elif isinstance(value, str):
-                try:
-                    parsed_date = datetime.fromisoformat(value)
-                    data[key] = parsed_date
-                except ValueError:
-                    pass
-    elif isinstance(data, list):
-        for item in data:
-            preprocess_json_data(item)
+                stack.append((value, field))
+    return document
 
-def process_json_file_and_load_to_mongo(filepath, collection_name):
+def preprocess_json_data(data):
+    if isinstance(data, list):
+        for item in data:
+            if isinstance(item, (dict, list)):
+                normalize_json_document(item)
+    elif isinstance(data, dict):
+        normalize_json_document(data)
+
+def iter_json_values(json_file, block_size=JSON_READ_BLOCK_SIZE):
+    """Incrementally parse a JSON file without loading it whole.
+
+    A top-level array yields its elements one at a time; anything else is read
+    as a stream of concatenated values, which covers a single object and NDJSON.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def refill():
+        nonlocal buffer, pos, eof
+        chunk = json_file.read(block_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            refill()
+
+    skip(' \t\r\n')
+    in_array = pos < len(buffer) and buffer[pos] == '['
+    if in_array:
+        pos += 1
+
+    while True:
+        skip(' \t\r\n,' if in_array else ' \t\r\n')
+        if pos >= len(buffer):
+            if in_array:
+                raise ValueError("Unexpected end of file inside top-level array")
+            return
+        if in_array and buffer[pos] == ']':
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+            # A value ending exactly at the buffer edge (e.g. a number) may be truncated
+            complete = end < len(buffer) or eof
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            refill()
+            continue
+        pos = end
+        yield value
+
+def iter_ndjson_values(json_file, errors):
+    """Yield one document per line, recording unparseable lines in errors instead of aborting."""
+    for line_number, line in enumerate(json_file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            errors.append({'line': line_number, 'error': str(e)})
+
+def upsert_operation(document, key_fields):
+    """Update the document matching document's key_fields values, or insert it if there is none.
+
+    Fields the new document doesn't have are kept; _id is only set when inserting.
+    """
+    update = {'$set': {field: value for field, value in document.items() if field != '_id'}}
+    if '_id' in document and '_id' not in key_fields:
+        update['$setOnInsert'] = {'_id': document['_id']}
+    return UpdateOne({field: document[field] for field in key_fields}, update, upsert=True)
+
+def insert_documents_batched(collection, documents, batch_size=MONGO_INSERT_BATCH_SIZE,
+                             learn_field_types=LEARN_JSON_FIELD_TYPES, progress=None, upsert_keys=None):
+    """Insert documents with bounded unordered insert_many calls. Returns (written, batches, failures, matched).
+
+    With upsert_keys, each batch is an unordered bulk_write of upserts on those fields instead,
+    and matched counts the documents that replaced fields of an existing one.
+    progress, if given, is called with the documents written after every batch.
+    """
+    inserted = 0
+    matched = 0
+    batches = 0
+    failures = []
+    batch = []
+    learned_date_fields = set() if learn_field_types else None
+    date_fields = None
+
+    def flush():
+        nonlocal inserted, matched, batches
+        batch_inserted = 0
+        try:
+            if upsert_keys:
+                result = collection.bulk_write([upsert_operation(doc, upsert_keys) for doc in batch], ordered=False)
+                batch_inserted = result.upserted_count + result.matched_count
+                matched += result.matched_count
+            else:
+                result = collection.insert_many(batch, ordered=False)
+                batch_inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            batch_inserted = e.details.get('nInserted', 0) + e.details.get('nUpserted', 0) + e.details.get('nMatched', 0)
+            matched += e.details.get('nMatched', 0)
+            failures.append({
+                'batch': batches,
+                'failed': len(write_errors),
+                'errors': [{'index': err.get('index'), 'error': err.get('errmsg')}
+                           for err in write_errors[:MAX_REPORTED_ERRORS]]
+            })
+        inserted += batch_inserted
+        batches += 1
+        batch.clear()
+        if progress:
+            progress(batch_inserted)
+
+    for document in documents:
+        if not isinstance(document, dict):
+            failures.append({'batch': batches, 'failed': 1,
+                             'errors': [{'error': f"Expected a JSON object, got {type(document).__name__}"}]})
+            continue
+        if upsert_keys and any(field not in document for field in upsert_keys):
+            failures.append({'batch': batches, 'failed': 1,
+                             'errors': [{'error': f"Document has no upsert key field(s) {', '.join(upsert_keys)}"}]})
+            continue
+        normalize_json_document(document, date_fields, learned_date_fields if date_fields is None else None)
+        batch.append(document)
+        if len(batch) >= batch_size:
+            flush()
+            if learned_date_fields is not None and date_fields is None:
+                date_fields = frozenset(learned_date_fields)
+    if batch:
+        flush()
+    return inserted, batches, failures, matched
+
+def ensure_key_index(collection, key_fields):
+    """Index the upsert key so each upsert finds its document without a collection scan."""
+    for info in collection.index_information().values():
+        if [field for field, _ in info['key']] == list(key_fields):
+            return None
+    return collection.create_index([(field, 1) for field in key_fields], name=index_advisor.index_name(key_fields))
+
+def process_json_file_and_load_to_mongo(filepath, collection_name, batch_size=MONGO_INSERT_BATCH_SIZE, progress=None,
+                                        write_mode='replace', key_fields=None):
+    """Load a JSON/NDJSON file into a collection.
+
+    'replace' drops the collection first; 'append' inserts alongside the existing documents;
+    'upsert' updates the documents matching key_fields and inserts the rest. The collection
+    is never emptied for append/upsert, so readers see each document old or new.
+    """
+    start_time = time.perf_counter()
     db = get_mongo_connection()
     collection = db[collection_name]
-    if collection_name in db.list_collection_names():
+    key_index = None
+    if write_mode == 'upsert':
+        if not key_fields:
+            raise ValueError("An upsert needs the key field(s) to match documents on")
+        key_index = ensure_key_index(collection, key_fields)
+    elif write_mode == 'replace' and collection_name in db.list_collection_names():
         collection.drop()
 
+    parse_errors = []
+
+    def parsed_documents(json_file):
+        if filepath.endswith(('.ndjson', '.jsonl')):
+            yield from iter_ndjson_values(json_file, parse_errors)
+            return
+        try:
+            yield from iter_json_values(json_file)
+        except ValueError as e:
+            # Malformed JSON ends the stream; documents parsed before it are still loaded
+            parse_errors.append({'error': str(e)})
+
     with open(filepath, 'r') as json_file:
-        data = json.load(json_file)
-    preprocess_json_data(data)
-    if isinstance(data, list):
-        collection.insert_many(data)
-    else:
-        collection.insert_one(data)
- 
+        inserted, batches, failures, matched = insert_documents_batched(
+            collection, parsed_documents(json_file), batch_size, progress=progress,
+            upsert_keys=key_fields if write_mode == 'upsert' else None)
+
+    elapsed = time.perf_counter() - start_time
+    result = {
+        'method': 'bulk_upsert' if write_mode == 'upsert' else 'insert_many',
+        'rows': inserted,
+        'failed_rows': sum(f['failed'] for f in failures) + len(parse_errors),
+        'batches': batches,
+        'batch_failures': failures,
+        'parse_errors': parse_errors[:MAX_REPORTED_ERRORS],
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(inserted / elapsed, 1) if elapsed > 0 else None
+    }
+    if write_mode == 'upsert':
+        result.update({'key': list(key_fields), 'matched_rows': matched, 'key_index_created': key_index})
+    return result
+
 # Route to explore MySQL databases and show tables
 @app.route('/api/explore', methods=['POST'])
 def explore():
     db_type = request.json.get('db_type', '').lower()
+    refresh = bool(request.json.get('refresh', False))
 
     if db_type == 'mysql':
         try:
-            connection = get_db_connection()  # Use your existing MySQL connection function
-            cursor = connection.cursor()
-            cursor.execute("SHOW TABLES")
-            tables = cursor.fetchall()
-
-            table_details = {}
-            for table in tables:
-                table_name = table[0]
-                cursor.execute(f"DESCRIBE {table_name}")
-                attributes = cursor.fetchall()
-                # Fetch sample data
-                cursor.execute(f"SELECT * FROM {table_name} LIMIT 5")
-                sample_data = cursor.fetchall()
-                columns = [desc[0] for desc in cursor.description]
-                
-                # Format the sample data
-                sample_data_formatted = []
-                for row in sample_data:
-                    formatted_row = {}
-                    for col, val in zip(columns, row):
-                        # Convert timedelta to string
-                        if isinstance(val, timedelta):
-                            formatted_row[col] = str(val)
-                        else:
-                            formatted_row[col] = val
-                    sample_data_formatted.append(formatted_row)
-
-                table_details[table_name] = {
-                    'attributes': attributes,
-                    'sample_data': sample_data_formatted
-                }
-
-            cursor.close()
-            connection.close()
-
+            table_details = catalog.explore('mysql', refresh=refresh)
             return jsonify({"db_type": "mysql", "tables": table_details})
 
         except Exception as e:
@@ -215,20 +1063,7 @@ def explore():
 
     elif db_type == 'mongodb':
         try:
-            db = get_mongo_connection()
-            collection_names = db.list_collection_names()
-            collection_details = {}
-
-            for collection_name in collection_names:
-                collection = db[collection_name]
-                attributes = list(collection.find_one().keys()) if collection.find_one() else []
-                sample_data = list(collection.find().limit(5))
-
-                collection_details[collection_name] = {
-                    'attributes': attributes,
-                    'sample_data': sample_data
-                }
-
+            collection_details = catalog.explore('mongodb', refresh=refresh)
             return jsonify({"db_type": "mongodb", "collections": collection_details})
 
         except Exception as e:
@@ -237,6 +1072,62 @@ def explore():
     else:
         return jsonify({"error": "Invalid database type specified."})
 
+# Uploaded files currently loaded into each table/collection, with their hash, schema and row count
+@app.route('/api/uploads', methods=['GET'])
+def get_uploads():
+    return jsonify(manifest.report()), 200
+
+@app.route('/api/catalog_stats', methods=['GET'])
+def get_catalog_stats():
+    return jsonify(catalog.catalog_stats()), 200
+
+@app.route('/api/query_cache_stats', methods=['GET'])
+def get_query_cache_stats():
+    return jsonify(query_cache.cache_stats()), 200
+
+@app.route('/api/translation_cache_stats', methods=['GET'])
+def get_translation_cache_stats():
+    return jsonify(translation_cache.cache_stats()), 200
+
+# Index advisor: recommendations, created indexes and their before/after latency
+@app.route('/api/index_advisor', methods=['GET'])
+def get_index_advisor():
+    return jsonify(index_advisor.report()), 200
+
+# Create a recommended index now: {"db_type": "mysql", "table": "sales", "columns": ["store_id"]}
+@app.route('/api/index_advisor/create', methods=['POST'])
+def create_advised_index():
+    data = request.json or {}
+    db_type = data.get('db_type', 'mysql').lower()
+    table = data.get('table')
+    columns = data.get('columns')
+    if db_type not in ('mysql', 'mongodb') or not table or not columns or not isinstance(columns, list):
+        return jsonify({'error': 'db_type, table and a list of columns are required'}), 400
+    if db_type == 'mysql':
+        columns = [column.lower() for column in columns]
+    try:
+        return jsonify(index_advisor.create_index(db_type, table, columns)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+# Prometheus scrape endpoint: per-stage and per-endpoint latency histograms plus pool gauges
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    pools = pool_stats()
+    body = metrics.render()
+    body += metrics.gauge_lines('pool_connections_in_use', "Connections currently checked out",
+                                [({'db': db_name}, stats['in_use']) for db_name, stats in pools.items()])
+    body += metrics.gauge_lines('cache_hit_rate', "Hit rate of the in-process caches since startup", [
+        ({'cache': 'query'}, query_cache.cache_stats()['hit_rate']),
+        ({'cache': 'translation'}, translation_cache.cache_stats()['hit_rate']),
+    ])
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+# Route to report connection pool sizing and checkout latency
+@app.route('/api/pool_stats', methods=['GET'])
+def get_pool_stats():
+    return jsonify(pool_stats()), 200
+
 # Route to fetch sample queries
 # @app.route('/api/sample_queries', methods=['GET'])
 # def sample_queries():
@@ -256,14 +1147,26 @@ def nl_to_sql():
     natural_query = data['query']
     try:
         # Convert natural language query to SQL
-        sql_query = natural_language_to_sql(natural_query)
-        
-        # Only print and return the query
-        print(f"Generated SQL Query: {sql_query}")
-        return jsonify({'sql_query': sql_query}), 200
+        sql_query = translation_cache.translate(natural_query)
+        logger.debug("Generated SQL Query: %s", sql_query)
+        return timed_jsonify({'sql_query': sql_query})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Batch variant of /api/nl_to_sql: {"queries": [...]} -> one result per question, in order
+@app.route('/api/nl_to_sql/batch', methods=['POST'])
+def nl_to_sql_batch():
+    data = request.json
+    if not data or not isinstance(data.get('queries'), list):
+        return jsonify({'error': 'Invalid request, queries must be a list'}), 400
+    queries = data['queries']
+    if len(queries) > translation_cache.MAX_BATCH_SIZE:
+        return jsonify({'error': f"At most {translation_cache.MAX_BATCH_SIZE} queries per batch"}), 413
+
+    results_list = translation_cache.translate_batch(queries)
+    failed = sum(1 for item in results_list if 'error' in item)
+    return timed_jsonify({'results': results_list, 'count': len(results_list), 'failed': failed})
+
 
 
 
@@ -272,30 +1175,105 @@ def nl_to_sql():
 def execute_query():
     user_query = request.json.get('query')
     db_type = request.json.get('db_type', 'mysql').lower()
+    # Optional delivery modes: stream='ndjson'|'sse', or page_size / cursor / order_key for paging
+    stream_format = request.json.get('stream')
+    page_size = request.json.get('page_size')
+    page_cursor = request.json.get('cursor')
+    order_key = request.json.get('order_key')
+    use_cache = not stream_format and request.json.get('cache', True)
+    # explain=true returns the Mongo pipeline and its winning plan instead of running it
+    explain = request.json.get('explain', False)
+    # format='rows'|'columns'|'bson'|'arrow', or negotiated from the Accept header
+    result_format = results.negotiate_format(request.json.get('format'), request.accept_mimetypes)
 
     if not user_query:
         return jsonify({'error': 'No query provided'}), 400
+    if stream_format and stream_format not in results.STREAM_FORMATS:
+        return jsonify({'error': f"Unsupported stream format: {stream_format}"}), 400
+    unavailable = results.format_unavailable(result_format)
+    if unavailable:
+        return jsonify({'error': unavailable}), 400 if result_format not in results.RESPONSE_FORMATS else 406
+
+    page = None
+    if page_size or page_cursor:
+        try:
+            page = results.page_state(user_query, page_size, page_cursor, order_key)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     
     if db_type == 'mysql':
+        def invalidate_catalog():
+            # DDL commits even when fetching fails, so any non-read statement may have changed the schema
+            if not catalog.is_read_only_sql(user_query):
+                catalog.invalidate('mysql')
+                query_cache.bump('mysql')
+                manifest.forget('mysql')
+
+        sql_query, params = results.paginate_sql(user_query, page) if page else (user_query, ())
+        cache_key = None
+        if use_cache:
+            tables = query_cache.sql_tables(user_query)
+            if tables:
+                cache_key = query_cache.make_key('mysql', query_cache.normalize_sql(sql_query), params)
+                cached = query_cache.get(cache_key)
+                if cached is not None:
+                    return timed_result_response(cached, result_format)
+                versions = query_cache.snapshot('mysql', tables)
+            else:
+                query_cache.record_uncacheable()
+
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor()  # Unbuffered: rows stay on the server until fetched
+        streaming = False
         try:
             # Run the query only when this endpoint is explicitly called
-            cursor.execute(user_query)
-            rows = cursor.fetchall()
-            conn.commit()
+            started = time.perf_counter()
+            with metrics.stage('cost_check'):
+                guarded_query, auto_limit = cost_guard.guard_sql(cursor, sql_query, params)
+            with metrics.stage('execute'):
+                cursor.execute(guarded_query, params)
+            if stream_format:
+                streaming = True
+                return Response(stream_with_context(results.stream_mysql_rows(conn, cursor, stream_format,
+                                                                              invalidate_catalog)),
+                                mimetype=results.STREAM_FORMATS[stream_format])
 
             headers = [desc[0] for desc in cursor.description] if cursor.description else []
-            result = []
-            for row in rows:
-                formatted_row = [str(item) if isinstance(item, timedelta) else item for item in row]
-                result.append(formatted_row)
-
-            return jsonify({'headers': headers, 'result': result}), 200
+            with metrics.stage('fetch'):
+                result, truncated = results.fetch_capped(cursor)
+                if truncated:
+                    results.abandon_mysql_result(conn)
+                conn.commit()
+            if catalog.is_read_only_sql(user_query):
+                index_advisor.record_sql(user_query, time.perf_counter() - started)
+
+            if page and page['k']:
+                key_index = headers.index(page['k'])
+                result, next_page = results.keyset_page(page, result, lambda row: row[key_index])
+            elif page:
+                next_page = results.next_cursor(page, result)
+
+            response = {'headers': headers, 'result': result}
+            if truncated:
+                response['truncated'] = True
+            if auto_limit:
+                response['auto_limit'] = auto_limit
+            if page:
+                response['next_cursor'] = next_page
+            if cache_key:
+                query_cache.put(cache_key, 'mysql', versions, response)
+            return timed_result_response(response, result_format)
+        except cost_guard.QueryTooExpensive as e:
+            return jsonify(e.to_dict()), 422
         except Exception as e:
+            if cost_guard.is_timeout(e):
+                return jsonify(cost_guard.timeout_response()), 422
             return jsonify({'error': str(e)}), 400
         finally:
-            conn.close()
+            if not streaming:
+                cursor.close()
+                conn.close()
+                invalidate_catalog()
     
     elif db_type == 'mongodb':
         # MongoDB Query Handling
@@ -303,51 +1281,78 @@ def execute_query():
         try:
             user_query = json.loads(user_query)  # Parse the input query
             collection_name = user_query.get('collection')
-            query = user_query.get('query', {})
-            projection = user_query.get('projection')  # Optional projection
-            sort = user_query.get('sort')  # Optional sort
-            limit = user_query.get('limit')  # Optional limit
-            skip = user_query.get('skip')  # Optional skip
-            aggregation = user_query.get('aggregation')  # Optional aggregation pipeline
-            lookup = user_query.get('lookup')  # Optional lookup
-            unwind = user_query.get('unwind')  # Optional unwind
-            group = user_query.get('group')  # Optional group
-
             collection = db[collection_name]
 
-            pipeline = aggregation if aggregation else []
-
-            if lookup:
-                pipeline.append({
-                    '$lookup': {
-                        'from': lookup.get('from'),
-                        'localField': lookup.get('localField'),
-                        'foreignField': lookup.get('foreignField'),
-                        'as': lookup.get('as')
-                    }
-                })
-            if unwind:
-                pipeline.append({'$unwind': unwind})
-            if group:
-                pipeline.append({'$group': group})
-            if query:
-                pipeline.append({'$match': query})
-            if projection:
-                pipeline.append({'$project': projection})
-            if sort:
-                pipeline.append({'$sort': sort})
-            if skip:
-                pipeline.append({'$skip': skip})
-            if limit:
-                pipeline.append({'$limit': limit})
-
-            documents = list(collection.aggregate(pipeline))
-
-            headers = list(documents[0].keys()) if documents else []
-            result = [list(doc.values()) for doc in documents]
-
-            return jsonify({'headers': headers, 'result': result}), 200
+            # query, projection, sort, limit, skip, aggregation, lookup, unwind and group are all optional
+            pipeline = mongo_pipeline.build_pipeline(user_query)
+            if page:
+                pipeline = results.paginate_pipeline(pipeline, page)
+
+            if explain:
+                with metrics.stage('execute'):
+                    plan = db.command('aggregate', collection_name, pipeline=pipeline, explain=True)
+                return Response(json_util.dumps({'pipeline': pipeline,
+                                                 'winning_plan': mongo_pipeline.winning_plan(plan),
+                                                 'explain': plan}),
+                                mimetype='application/json')
+
+            cache_key = None
+            if use_cache:
+                collections = query_cache.pipeline_collections(collection_name, pipeline)
+                if collections:
+                    cache_key = query_cache.make_key('mongodb', collection_name, pipeline)
+                    cached = query_cache.get(cache_key)
+                    if cached is not None:
+                        return timed_result_response(cached, result_format)
+                    versions = query_cache.snapshot('mongodb', collections)
+                else:
+                    query_cache.record_uncacheable()
+
+            with metrics.stage('cost_check'):
+                guarded_pipeline, auto_limit = cost_guard.guard_pipeline(db, collection_name, pipeline)
+
+            # The server-side cursor is read in batches instead of being listed up front
+            started = time.perf_counter()
+            with metrics.stage('execute'):
+                cursor = collection.aggregate(guarded_pipeline, batchSize=results.FETCH_SIZE,
+                                              **cost_guard.execution_options())
+            for output_collection in catalog.pipeline_output_collections(pipeline):
+                catalog.invalidate('mongodb', output_collection)
+                query_cache.bump('mongodb', output_collection)
+                manifest.forget('mongodb', output_collection)
+
+            if stream_format:
+                return Response(stream_with_context(results.stream_documents(cursor, stream_format)),
+                                mimetype=results.STREAM_FORMATS[stream_format])
+
+            with metrics.stage('fetch'):
+                documents, truncated = results.iterate_capped(cursor)
+                cursor.close()
+            index_advisor.record_pipeline(collection_name, pipeline, time.perf_counter() - started)
+
+            if page and page['k']:
+                documents, next_page = results.keyset_page(page, documents, lambda document: document.get(page['k']))
+            elif page:
+                next_page = results.next_cursor(page, documents)
+
+            # Documents needn't share keys, so every row is laid out on the union of them
+            headers, result = results.documents_to_rows(documents)
+
+            response = {'headers': headers, 'result': result}
+            if truncated:
+                response['truncated'] = True
+            if auto_limit:
+                response['auto_limit'] = auto_limit
+            if page:
+                response['next_cursor'] = next_page
+            if cache_key:
+                query_cache.put(cache_key, 'mongodb', versions, response)
+            return timed_result_response(response, result_format)
+        except cost_guard.QueryTooExpensive as e:
+            return jsonify(e.to_dict()), 422
         except Exception as e:
+            if cost_guard.is_timeout(e):
+                return jsonify(cost_guard.timeout_response()), 422
             return jsonify({'error': str(e)}), 400
 
     else:
@@ -391,14 +1396,14 @@ def chat():
     message = data['message']
     try:
         # Convert to SQL
-        sql_query = natural_language_to_sql(message)
+        sql_query = translation_cache.translate(message)
 
         # Check if no table is available
         if not get_last_uploaded_table():
             return jsonify({'response': 'Error: No table has been uploaded yet. Please upload a dataset first.'}), 400
 
         # Execute SQL
-        response = natural_language_to_sql(sql_query)
+        response = translation_cache.translate(sql_query)
 
         if 'error' in response:
             return jsonify({'response': f"SQL Execution Error: {response['error']}"})
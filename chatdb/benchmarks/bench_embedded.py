@@ -0,0 +1,131 @@
+"""Embedded SQLite backend vs. MySQL: CSV ingest throughput and query latency.
+
+Loads scaled copies of the CSV samples in uploads/ through the app's upload loader,
+then runs the SQL that natural_language_to_sql emits for benchmarks/nl_queries.txt on
+each backend. Reports rows/s, per-query p50/p95 and how many translated queries each
+backend accepts. MySQL (db.MYSQL_CONFIG) is skipped if no server is reachable. Run
+from the chatdb directory:
+    python benchmarks/bench_embedded.py [--scale S] [--repeat R] [--output results.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mysql.connector
+
+import app as chatdb_app
+import db
+import embedded
+from run_benchmarks import CORPUS, CSV_DATASETS, UPLOADS, best_of, percentiles, scale_csv
+from space import natural_language_to_sql
+from state import set_last_uploaded_table
+
+
+def translated_queries():
+    with open(CORPUS) as f:
+        questions = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    set_last_uploaded_table('sales')
+    queries = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for question in questions:
+            sql_query = natural_language_to_sql(question)
+            if sql_query and not sql_query.startswith('Error'):
+                queries.setdefault(sql_query, question)
+    return queries
+
+
+def use_backend(name):
+    """Point the upload loader at a backend; returns its connection factory, or None if unreachable."""
+    if name == 'sqlite':
+        connect = lambda allow_local_infile=False: embedded.get_connection()
+    else:
+        connect = db.get_db_connection
+        try:
+            connect().close()
+        except mysql.connector.Error as err:
+            logging.warning("MySQL unreachable, skipping it: %s", err)
+            return None
+    chatdb_app.get_db_connection = connect
+    chatdb_app.ENABLE_LOAD_DATA_INFILE = name == 'mysql'
+    return connect
+
+
+def run_query(connect, sql_query):
+    conn = connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql_query)
+        return len(cursor.fetchall())
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def bench_backend(name, csv_paths, queries, repeat):
+    connect = use_backend(name)
+    if connect is None:
+        return {'skipped': 'server unreachable'}
+    report = {'ingest': {}, 'queries': {}}
+    for table, (path, rows) in csv_paths.items():
+        seconds, result = best_of(lambda: chatdb_app.process_csv_file_and_load_to_db(path, table), repeat)
+        report['ingest'][table] = {'rows': rows, 'method': result['method'], 'seconds': round(seconds, 4),
+                                   'rows_per_sec': round(rows / seconds, 1)}
+    failed = 0
+    for sql_query, question in queries.items():
+        try:
+            returned = run_query(connect, sql_query)
+        except mysql.connector.Error as err:
+            failed += 1
+            report['queries'][question] = {'sql': sql_query, 'error': str(err)}
+            continue
+        samples = []
+        for _ in range(repeat):
+            seconds, _ = best_of(lambda: run_query(connect, sql_query), 1)
+            samples.append(seconds)
+        report['queries'][question] = {'sql': sql_query, 'rows': returned, **percentiles(samples)}
+    report['compatible'] = f"{len(queries) - failed}/{len(queries)}"
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=1, help='dataset scale-up (see run_benchmarks.copies_for)')
+    parser.add_argument('--repeat', type=int, default=5, help='loads and query runs per case')
+    parser.add_argument('--output', help='also write the report to this JSON file')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        embedded.EMBEDDED_PATH = os.path.join(workdir, 'embedded.sqlite3')
+        csv_paths = {}
+        for name in CSV_DATASETS:
+            path = os.path.join(workdir, f"x{args.scale}_{name}")
+            csv_paths[name.rsplit('.', 1)[0]] = (path, scale_csv(os.path.join(UPLOADS, name), path, args.scale))
+        queries = translated_queries()
+        report = {backend: bench_backend(backend, csv_paths, queries, args.repeat) for backend in ('sqlite', 'mysql')}
+
+    for backend, result in report.items():
+        if 'skipped' in result:
+            print(f"{backend}: skipped ({result['skipped']})")
+            continue
+        print(f"{backend}: {result['compatible']} translated queries ran")
+        for table, ingest in result['ingest'].items():
+            print(f"  ingest {table:12s} {ingest['rows_per_sec']:12.0f} rows/s ({ingest['method']})")
+        for question, query in result['queries'].items():
+            timing = f"{query['p50_ms']:10.3f} ms p50" if 'p50_ms' in query else f"{'failed':>17s}"
+            print(f"  {timing}  {question}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
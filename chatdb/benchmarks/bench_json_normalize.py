@@ -0,0 +1,103 @@
+"""Micro-benchmark: normalize_json_document vs. the original recursive preprocess_json_data.
+
+Run from the chatdb directory:
+    python benchmarks/bench_json_normalize.py [--copies N] [--repeat R]
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import normalize_json_document
+
+UPLOADS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads')
+DATASETS = ['orders.json', 'reviews.json', 'products.json', 'users.json', 'categories.json']
+
+
+# The recursive implementation this benchmark compares against
+def legacy_preprocess_json_data(data):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, dict):
+                if '$oid' in value:
+                    data[key] = value['$oid']
+                elif '$date' in value:
+                    try:
+                        data[key] = datetime.fromisoformat(value['$date'].replace("Z", "+00:00"))
+                    except ValueError:
+                        data[key] = value['$date']
+                else:
+                    legacy_preprocess_json_data(value)
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    legacy_preprocess_json_data(item)
+            elif isinstance(value, str):
+                try:
+                    parsed_date = datetime.fromisoformat(value)
+                    data[key] = parsed_date
+                except ValueError:
+                    pass
+    elif isinstance(data, list):
+        for item in data:
+            legacy_preprocess_json_data(item)
+
+
+def load_documents(copies):
+    documents = []
+    for name in DATASETS:
+        with open(os.path.join(UPLOADS, name)) as f:
+            data = json.load(f)
+        documents.extend(data if isinstance(data, list) else [data])
+    return documents * copies
+
+
+def best_time(fn, documents, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        batch = copy.deepcopy(documents)
+        start = time.perf_counter()
+        fn(batch)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--copies', type=int, default=200, help='times to replicate the sample documents')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per implementation; the best is kept')
+    args = parser.parse_args()
+
+    documents = load_documents(args.copies)
+    first_batch = len(documents) // args.copies
+
+    def normalize_all(batch):
+        for document in batch:
+            normalize_json_document(document)
+
+    def normalize_learned(batch):
+        learned = set()
+        for document in batch[:first_batch]:
+            normalize_json_document(document, learned_date_fields=learned)
+        date_fields = frozenset(learned)
+        for document in batch[first_batch:]:
+            normalize_json_document(document, date_fields)
+
+    results = {
+        'legacy_preprocess_json_data': best_time(legacy_preprocess_json_data, documents, args.repeat),
+        'normalize_json_document': best_time(normalize_all, documents, args.repeat),
+        'normalize_json_document (learned fields)': best_time(normalize_learned, documents, args.repeat),
+    }
+    baseline = results['legacy_preprocess_json_data']
+    print(f"{len(documents)} documents, best of {args.repeat}")
+    for name, seconds in results.items():
+        print(f"{name:45s} {seconds * 1000:9.2f} ms  {len(documents) / seconds:12.0f} docs/s  "
+              f"{baseline / seconds:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
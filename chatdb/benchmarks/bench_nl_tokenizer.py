@@ -0,0 +1,126 @@
+"""Throughput benchmark: phrase-trie tokenize_input vs. the original lookahead tokenizer.
+
+Runs both tokenizers (and the full natural_language_to_sql translation) over the
+questions in benchmarks/nl_queries.txt. Run from the chatdb directory:
+    python benchmarks/bench_nl_tokenizer.py [--repeat R]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from space import tokenize_input, natural_language_to_sql, comparison_words, sql_keywords
+from state import set_last_uploaded_table
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nl_queries.txt')
+
+
+# The original tokenizer this benchmark compares against (debug print removed)
+def legacy_tokenize_input(input_text):
+    import re
+
+    words = re.findall(r'"[^"]*"|\'[^\']*\'|\S+', input_text.lower())
+    tokens = []
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if i + 1 < len(words) and f"{word} {words[i + 1]}" in comparison_words:
+            tokens.append(f"{word} {words[i + 1]}")
+            i += 2
+            continue
+        elif word in ['>', '<', '=', '>=', '<=', '!=']:
+            tokens.append(word)
+            i += 1
+            continue
+        if word == "having" and i + 3 < len(words):
+            if words[i + 1] == "more" and words[i + 2] == "than":
+                tokens.extend(["HAVING", "COUNT", ">"])
+                next_token = "1" if words[i + 3] == "one" else words[i + 3]
+                tokens.append(next_token)
+                i += 4
+                continue
+        if word.startswith('"') or word.startswith("'"):
+            tokens.append(word.strip('"').strip("'"))
+            i += 1
+            continue
+        if i + 1 < len(words) and (
+            (word == "group" and words[i + 1] == "by") or
+            (word == "grouped" and words[i + 1] == "by")
+        ):
+            tokens.append("GROUP BY")
+            i += 2
+            continue
+        if i + 1 < len(words) and word in ["sorted", "sort", "order"] and words[i + 1] == "by":
+            tokens.append("ORDER BY")
+            i += 2
+            continue
+        if word in ["descending", "desc"]:
+            if i + 1 < len(words) and words[i + 1] in ["order", "in"]:
+                tokens.append("DESC")
+                i += 2
+            else:
+                tokens.append("DESC")
+                i += 1
+            continue
+        if word in ['first', 'top'] and i + 1 < len(words) and words[i + 1].isdigit():
+            tokens.append('LIMIT')
+            tokens.append(words[i + 1])
+            i += 2
+            continue
+        if i + 1 < len(words) and words[i + 1][0].isalpha() and word.endswith("."):
+            tokens.append(f"{word} {words[i + 1]}")
+            i += 2
+            continue
+        if word == "all" and (i + 1 >= len(words) or words[i + 1] not in sql_keywords):
+            i += 1
+            continue
+        if i + 1 < len(words) and f"{words[i]} {words[i + 1]}" == "more than":
+            tokens.append("HAVING")
+            tokens.append("COUNT")
+            i += 2
+            continue
+        tokens.append(word)
+        i += 1
+    return tokens
+
+
+def load_corpus():
+    with open(CORPUS) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def ops_per_sec(fn, corpus, repeat):
+    best = float('inf')
+    # The translator still prints debug output; keep it out of the measurement
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for question in corpus:
+                fn(question)
+            best = min(best, time.perf_counter() - start)
+    return len(corpus) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200, help='passes over the corpus; the best is kept')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    set_last_uploaded_table('sales')
+    results = {
+        'legacy_tokenize_input': ops_per_sec(legacy_tokenize_input, corpus, args.repeat),
+        'tokenize_input': ops_per_sec(tokenize_input, corpus, args.repeat),
+        'natural_language_to_sql': ops_per_sec(natural_language_to_sql, corpus, args.repeat),
+    }
+    print(f"{len(corpus)} questions, best of {args.repeat} passes")
+    for name, rate in results.items():
+        print(f"{name:30s} {rate:12.0f} ops/s")
+
+
+if __name__ == '__main__':
+    main()
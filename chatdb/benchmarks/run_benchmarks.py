@@ -0,0 +1,349 @@
+"""Offline benchmark suite: ingest throughput, translation ops/s and execute_query latency.
+
+Uses the sample datasets in uploads/ and deterministic scale-ups of them, with
+the app's embedded SQLite backend standing in for MySQL and an in-memory double
+for MongoDB (see standins.py), so it runs anywhere without database servers.
+Results are written as JSON so two runs can be compared. Run from the chatdb directory:
+
+    python benchmarks/run_benchmarks.py [--scales 1 10] [--output results.json]
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+"""
+import argparse
+import copy
+import csv
+import hashlib
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+CHATDB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CHATDB_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+import app as chatdb_app
+import embedded
+import results
+import translation_cache
+from space import natural_language_to_sql
+from standins import InMemoryMongo
+from state import set_last_uploaded_table
+
+UPLOADS = os.path.join(CHATDB_DIR, 'uploads')
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nl_queries.txt')
+CSV_DATASETS = ['sales.csv', 'courses.csv', 'enrollments.csv', 'students.csv']
+JSON_DATASETS = ['orders.json', 'reviews.json', 'products.json', 'users.json', 'categories.json']
+BASE_ROWS = 10000  # Scale 1 repeats each sample until it has at least this many rows
+
+# Queries timed against /api/execute_query once the scaled datasets are loaded
+MYSQL_QUERIES = {
+    'select_limit': "SELECT * FROM sales LIMIT 100",
+    'group_by': "SELECT product_category, SUM(transaction_qty * unit_price) AS revenue FROM sales "
+                "GROUP BY product_category ORDER BY revenue DESC",
+    'filtered_count': "SELECT store_location, COUNT(*) FROM sales WHERE unit_price > 3 GROUP BY store_location",
+    'full_scan': "SELECT * FROM sales",
+}
+MONGO_QUERIES = {
+    'match': {'collection': 'reviews', 'query': {'rating': {'$gte': 4}}},
+    'sort_limit': {'collection': 'orders', 'sort': {'totalAmount': -1}, 'limit': 10},
+    'group': {'collection': 'orders', 'group': {'_id': '$status', 'total': {'$sum': '$totalAmount'}}},
+}
+
+# execute_query cases repeated in each alternative response encoding (uncached)
+FORMAT_QUERIES = {'mysql': MYSQL_QUERIES['full_scan'], 'mongodb': json.dumps(MONGO_QUERIES['match'])}
+RESULT_FORMATS = ['columns', 'bson']
+
+# Lower is better for these result fields; higher is better for the rest
+LOWER_IS_BETTER = ('ms', 'seconds')
+
+
+# Synthetic scale-ups
+
+def copies_for(rows, scale):
+    return scale * max(1, math.ceil(BASE_ROWS / max(1, rows)))
+
+
+def scale_csv(source, destination, scale):
+    """Write copies of source's rows (see copies_for); an integer first column is offset so ids stay unique."""
+    with open(source, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    ids = [int(row[0]) for row in rows if row and row[0].isdigit()]
+    id_span = max(ids) + 1 if len(ids) == len(rows) else None
+    copies = copies_for(len(rows), scale)
+    with open(destination, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for copy_index in range(copies):
+            for row in rows:
+                if id_span and copy_index:
+                    row = [str(int(row[0]) + copy_index * id_span)] + row[1:]
+                writer.writerow(row)
+    return len(rows) * copies
+
+
+def _remap_oids(value, copy_index):
+    """Give every {"$oid"} a new id per copy, the same way in every dataset so references still join."""
+    if isinstance(value, dict):
+        if set(value) == {'$oid'}:
+            return {'$oid': hashlib.md5(f"{value['$oid']}:{copy_index}".encode()).hexdigest()[:24]}
+        return {key: _remap_oids(item, copy_index) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_remap_oids(item, copy_index) for item in value]
+    return value
+
+
+def scale_json(source, destination, scale, ndjson=False):
+    with open(source) as f:
+        documents = json.load(f)
+    scaled = list(documents)
+    for copy_index in range(1, copies_for(len(documents), scale)):
+        scaled.extend(_remap_oids(copy.deepcopy(doc), copy_index) for doc in documents)
+    with open(destination, 'w') as f:
+        if ndjson:
+            f.writelines(json.dumps(doc) + "\n" for doc in scaled)
+        else:
+            json.dump(scaled, f)
+    return len(scaled)
+
+
+# Measurements
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def nearest_rank(p):
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {
+        'p50_ms': round(nearest_rank(50) * 1000, 3),
+        'p95_ms': round(nearest_rank(95) * 1000, 3),
+        'p99_ms': round(nearest_rank(99) * 1000, 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+def best_of(fn, repeat):
+    """Run fn repeat times; return (best seconds, last return value)."""
+    best = float('inf')
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, value
+
+
+def install_standins(workdir):
+    embedded.EMBEDDED_PATH = os.path.join(workdir, 'embedded.sqlite3')
+    mongo = InMemoryMongo()
+    chatdb_app.get_db_connection = lambda allow_local_infile=False: embedded.get_connection()
+    results.get_db_connection = chatdb_app.get_db_connection
+    chatdb_app.get_mongo_connection = lambda: mongo
+    # SQLite can't run LOAD DATA LOCAL INFILE; time the executemany path
+    chatdb_app.ENABLE_LOAD_DATA_INFILE = False
+    return mongo
+
+
+def bench_csv_ingest(workdir, scales, repeat):
+    report = {}
+    for scale in scales:
+        for name in CSV_DATASETS:
+            path = os.path.join(workdir, f"x{scale}_{name}")
+            rows = scale_csv(os.path.join(UPLOADS, name), path, scale)
+            table = name.rsplit('.', 1)[0]
+            loaders = {
+                'memory': lambda: chatdb_app.process_csv_file_and_load_to_db(path, table),
+                'stream': lambda: chatdb_app.stream_csv_file_to_db(path, table),
+            }
+            for method, load in loaders.items():
+                seconds, result = best_of(load, repeat)
+                report[f"{table}/x{scale}/{method}"] = {
+                    'rows': rows,
+                    'loaded_rows': result['rows'],
+                    'seconds': round(seconds, 4),
+                    'rows_per_sec': round(rows / seconds, 1),
+                }
+    return report
+
+
+def bench_json_ingest(workdir, scales, repeat):
+    report = {}
+    for scale in scales:
+        for name in JSON_DATASETS:
+            collection = name.rsplit('.', 1)[0]
+            for fmt, ndjson in (('json', False), ('ndjson', True)):
+                path = os.path.join(workdir, f"x{scale}_{collection}.{fmt}")
+                documents = scale_json(os.path.join(UPLOADS, name), path, scale, ndjson)
+                seconds, result = best_of(
+                    lambda: chatdb_app.process_json_file_and_load_to_mongo(path, collection), repeat)
+                report[f"{collection}/x{scale}/{fmt}"] = {
+                    'documents': documents,
+                    'loaded_documents': result['rows'],
+                    'seconds': round(seconds, 4),
+                    'documents_per_sec': round(documents / seconds, 1),
+                }
+    return report
+
+
+def bench_translation(repeat):
+    with open(CORPUS) as f:
+        questions = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    set_last_uploaded_table('sales')
+
+    def translate_all(translate):
+        for question in questions:
+            translate(question)
+
+    report = {}
+    for name, translate in (('natural_language_to_sql', natural_language_to_sql),
+                            ('translation_cache_warm', translation_cache.translate)):
+        translate_all(translate)  # Warm-up, and fills the translation cache
+        seconds, _ = best_of(lambda: translate_all(translate), repeat)
+        report[name] = {'questions': len(questions), 'ops_per_sec': round(len(questions) / seconds, 1)}
+    return report
+
+
+def bench_execute_query(requests_per_query):
+    client = chatdb_app.app.test_client()
+    cases = [('mysql', name, query) for name, query in MYSQL_QUERIES.items()]
+    cases += [('mongodb', name, json.dumps(query)) for name, query in MONGO_QUERIES.items()]
+    report = {}
+    for db_type, name, query in cases:
+        for cached in (False, True):
+            payload = {'query': query, 'db_type': db_type, 'cache': cached}
+            response = client.post('/api/execute_query', json=payload)
+            if response.status_code != 200:
+                report[f"{db_type}/{name}"] = {'error': response.get_json()}
+                break
+            entry = time_requests(client, payload, requests_per_query)
+            entry['rows'] = len(response.get_json()['result'])
+            report[f"{db_type}/{name}/{'cached' if cached else 'uncached'}"] = entry
+    for db_type, query in FORMAT_QUERIES.items():
+        for result_format in RESULT_FORMATS:
+            payload = {'query': query, 'db_type': db_type, 'cache': False, 'format': result_format}
+            response = client.post('/api/execute_query', json=payload)
+            if response.status_code != 200:
+                report[f"{db_type}/format_{result_format}"] = {'error': response.get_json()}
+                continue
+            entry = time_requests(client, payload, requests_per_query)
+            entry['bytes'] = len(response.data)
+            report[f"{db_type}/format_{result_format}/uncached"] = entry
+    return report
+
+
+def time_requests(client, payload, requests):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.post('/api/execute_query', json=payload)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=CHATDB_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    with tempfile.TemporaryDirectory(prefix='chatdb-bench-') as workdir:
+        install_standins(workdir)
+        csv_report = bench_csv_ingest(workdir, args.scales, args.repeat)
+        json_report = bench_json_ingest(workdir, args.scales, args.repeat)
+        translation_report = bench_translation(args.repeat)
+        # execute_query runs against the largest scale, which is what the loaders left behind
+        query_report = bench_execute_query(args.requests)
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'scales': args.scales,
+            'base_rows': BASE_ROWS,
+            'repeat': args.repeat,
+            'requests_per_query': args.requests,
+            'stand_ins': {'mysql': 'embedded (sqlite3)', 'mongodb': 'standins.InMemoryMongo'},
+        },
+        'ingest_csv': csv_report,
+        'ingest_json': json_report,
+        'translation': translation_report,
+        'execute_query': query_report,
+    }
+
+
+def _leaves(report, prefix=''):
+    for key, value in report.items():
+        path = f"{prefix}/{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from _leaves(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(old_path, new_path, threshold):
+    """Print timing/throughput changes larger than threshold percent. Returns the number of regressions."""
+    with open(old_path) as f:
+        old = dict(_leaves({k: v for k, v in json.load(f).items() if k != 'meta'}))
+    with open(new_path) as f:
+        new = dict(_leaves({k: v for k, v in json.load(f).items() if k != 'meta'}))
+    regressions = 0
+    for path in sorted(old.keys() & new.keys()):
+        metric = path.rsplit('/', 1)[-1]
+        if not (metric.endswith(LOWER_IS_BETTER) or metric.endswith('_per_sec')) or not old[path]:
+            continue
+        change = (new[path] - old[path]) / old[path] * 100
+        worse = change > threshold if metric.endswith(LOWER_IS_BETTER) else change < -threshold
+        if abs(change) >= threshold:
+            regressions += worse
+            print(f"{'REGRESSION' if worse else 'improved':<10} {path:<60} {old[path]:>12} -> {new[path]:<12} "
+                  f"({change:+.1f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10],
+                        help="Copies of each sample dataset to ingest (default: 1 10)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per ingest/translation case; best is kept")
+    parser.add_argument('--requests', type=int, default=200, help="Timed requests per execute_query case")
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         'results.json'))
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="Compare two result files instead of running the suite")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="Percent change reported by --compare (default: 10)")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = run_suite(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    for section in ('ingest_csv', 'ingest_json', 'translation', 'execute_query'):
+        print(f"{section}:")
+        for case, numbers in report[section].items():
+            summary = ", ".join(f"{key}={value}" for key, value in numbers.items())
+            print(f"  {case:<45} {summary}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Offline stand-ins for the MongoDB server used by the benchmark suite.
+
+InMemoryMongo speaks enough of pymongo's Database/Collection API for the JSON loader
+and simple aggregation pipelines. MySQL is stood in for by the app's own embedded
+SQLite backend (embedded.py). Both measure the application's own work (parsing, type
+inference, batching, result encoding) rather than a real server's, so compare numbers
+between runs of the suite, not against production.
+"""
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+
+class _InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+
+class _DocumentCursor:
+    def __init__(self, documents):
+        self._documents = iter(documents)
+
+    def __iter__(self):
+        return self._documents
+
+    def __next__(self):
+        return next(self._documents)
+
+    def close(self):
+        pass
+
+
+def _get_path(document, path):
+    value = document
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+_COMPARISONS = {
+    '$eq': lambda value, operand: value == operand,
+    '$ne': lambda value, operand: value != operand,
+    '$gt': lambda value, operand: value is not None and value > operand,
+    '$gte': lambda value, operand: value is not None and value >= operand,
+    '$lt': lambda value, operand: value is not None and value < operand,
+    '$lte': lambda value, operand: value is not None and value <= operand,
+    '$in': lambda value, operand: value in operand,
+    '$nin': lambda value, operand: value not in operand,
+}
+
+
+def _matches(document, query):
+    for field, condition in query.items():
+        value = _get_path(document, field)
+        if isinstance(condition, dict) and condition and all(op in _COMPARISONS for op in condition):
+            if not all(_COMPARISONS[op](value, operand) for op, operand in condition.items()):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(document, projection):
+    included = [field for field, flag in projection.items() if flag]
+    if not included:
+        return {key: value for key, value in document.items() if projection.get(key, 1)}
+    projected = {'_id': document.get('_id')} if projection.get('_id', 1) else {}
+    for field in included:
+        projected[field] = _get_path(document, field)
+    return projected
+
+
+def _group(documents, spec):
+    groups = {}
+    key_expr = spec['_id']
+    for document in documents:
+        key = _get_path(document, key_expr[1:]) if isinstance(key_expr, str) else key_expr
+        state = groups.setdefault(key, {})
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            (op, expr), = accumulator.items()
+            value = _get_path(document, expr[1:]) if isinstance(expr, str) else expr
+            total, count = state.get(field, (0, 0))
+            state[field] = (total + (value or 0), count + 1)
+    results = []
+    for key, state in groups.items():
+        row = {'_id': key}
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            op = next(iter(accumulator))
+            total, count = state[field]
+            row[field] = total / count if op == '$avg' else total
+        results.append(row)
+    return results
+
+
+class InMemoryCollection:
+    def __init__(self, database, name):
+        self._database = database
+        self.name = name
+        self.documents = []
+
+    def insert_many(self, documents, ordered=True):
+        inserted_ids = []
+        for document in documents:
+            document.setdefault('_id', ObjectId())
+            self.documents.append(document)
+            inserted_ids.append(document['_id'])
+        self._database._collections[self.name] = self
+        return _InsertManyResult(inserted_ids)
+
+    def drop(self):
+        self.documents = []
+        self._database._collections.pop(self.name, None)
+
+    def find(self, query=None):
+        return _DocumentCursor([doc for doc in self.documents if _matches(doc, query or {})])
+
+    def estimated_document_count(self):
+        return len(self.documents)
+
+    def count_documents(self, query, limit=None, maxTimeMS=None):
+        count = sum(1 for doc in self.documents if _matches(doc, query))
+        return min(count, limit) if limit else count
+
+    def index_information(self):
+        return {'_id_': {'key': [('_id', 1)]}}
+
+    def aggregate(self, pipeline, batchSize=None, maxTimeMS=None):
+        """Supports $match, $project, $group ($sum/$avg), $sort, $skip and $limit."""
+        documents = self.documents
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name == '$match':
+                documents = [doc for doc in documents if _matches(doc, spec)]
+            elif name == '$project':
+                documents = [_project(doc, spec) for doc in documents]
+            elif name == '$group':
+                documents = _group(documents, spec)
+            elif name == '$sort':
+                documents = list(documents)
+                for field, direction in reversed(list(spec.items())):
+                    documents.sort(key=lambda doc: (_get_path(doc, field) is not None, _get_path(doc, field)),
+                                   reverse=direction < 0)
+            elif name == '$skip':
+                documents = documents[spec:]
+            elif name == '$limit':
+                documents = documents[:spec]
+            else:
+                raise NotImplementedError(f"InMemoryMongo does not support {name}")
+        return _DocumentCursor(list(documents))
+
+
+class InMemoryMongo:
+    """Stands in for the pymongo Database returned by db.get_mongo_connection()."""
+
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name):
+        return self._collections.get(name) or InMemoryCollection(self, name)
+
+    def list_collection_names(self):
+        return list(self._collections)
+
+    def command(self, name, *args, **kwargs):
+        raise OperationFailure(f"InMemoryMongo does not support the {name} command")
@@ -0,0 +1,238 @@
+# catalog.py
+# In-process schema/sample catalog behind /api/explore. Filled once, then only the
+# tables or collections invalidated by uploads (or writes) are re-read.
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+
+import mysql.connector
+
+from db import get_db_connection, get_mongo_connection
+
+SAMPLE_ROWS = 5
+EXPLORE_WORKERS = 4  # Tables described in parallel; each holds a pooled connection while it runs
+TABLE_TIMEOUT_SECONDS = 5.0  # A table slower than this is reported as timed out and retried next time
+EXPLORE_DEADLINE_SECONDS = 30.0  # Upper bound on one explore call, however many tables there are
+READ_ONLY_SQL_PREFIXES = ('select', 'show', 'describe', 'desc', 'explain', 'with')
+
+_lock = threading.Lock()
+_entries = {'mysql': {}, 'mongodb': {}}
+_loaded = {'mysql': False, 'mongodb': False}
+_stale = {'mysql': set(), 'mongodb': set()}
+_generation = {'mysql': 0, 'mongodb': 0}  # Bumped on every invalidation
+_stats = {'hits': 0, 'full_loads': 0, 'partial_refreshes': 0, 'timeouts': 0, 'errors': 0}
+_executor = ThreadPoolExecutor(max_workers=EXPLORE_WORKERS, thread_name_prefix='explore')
+
+
+def format_sample_row(columns, row):
+    formatted_row = {}
+    for col, val in zip(columns, row):
+        # Convert timedelta to string
+        if isinstance(val, timedelta):
+            formatted_row[col] = str(val)
+        else:
+            formatted_row[col] = val
+    return formatted_row
+
+
+def describe_mysql_table(cursor, table_name):
+    cursor.execute(f"DESCRIBE {table_name}")
+    attributes = cursor.fetchall()
+    # Fetch sample data; the server ends the read if it runs past the table timeout
+    cursor.execute(f"SELECT /*+ MAX_EXECUTION_TIME({int(TABLE_TIMEOUT_SECONDS * 1000)}) */ * "
+                   f"FROM {table_name} LIMIT {SAMPLE_ROWS}")
+    sample_data = cursor.fetchall()
+    columns = [desc[0] for desc in cursor.description]
+    return {
+        'attributes': attributes,
+        'sample_data': [format_sample_row(columns, row) for row in sample_data]
+    }
+
+
+def describe_mongo_collection(db, collection_name):
+    cursor = db[collection_name].find().limit(SAMPLE_ROWS).max_time_ms(int(TABLE_TIMEOUT_SECONDS * 1000))
+    sample_data = list(cursor)
+    return {
+        'attributes': list(sample_data[0].keys()) if sample_data else [],
+        'sample_data': sample_data
+    }
+
+
+def _fan_out(task, names):
+    """Run task(name) for every name on the explore pool.
+
+    Returns (details, failed): details maps names to task results, failed maps
+    names that raised or ran longer than TABLE_TIMEOUT_SECONDS to an error message.
+    A running task can't be stopped from here, so an overdue one is left to the
+    server-side timeout on its query and only its result is given up; tasks still
+    queued at the deadline are never started.
+    """
+    started = {}
+
+    def timed(name):
+        started[name] = time.monotonic()
+        return task(name)
+
+    futures = {_executor.submit(timed, name): name for name in names}
+    details = {}
+    failed = {}
+    deadline = time.monotonic() + EXPLORE_DEADLINE_SECONDS
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = futures[future]
+            try:
+                details[name] = future.result()
+            except Exception as e:
+                failed[name] = str(e)
+        now = time.monotonic()
+        for future in list(pending):
+            name = futures[future]
+            if name in started and now - started[name] > TABLE_TIMEOUT_SECONDS:
+                failed[name] = f"Timed out after {TABLE_TIMEOUT_SECONDS}s"
+                pending.discard(future)
+            elif now >= deadline:
+                state = 'not started' if future.cancel() else 'still running'
+                failed[name] = f"Timed out at the {EXPLORE_DEADLINE_SECONDS}s explore deadline ({state})"
+                pending.discard(future)
+    return details, failed
+
+
+def _describe_mysql_task(table_name):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        # The sample SELECT carries its own timeout; bound DESCRIBE's metadata-lock wait too
+        cursor.execute(f"SET SESSION lock_wait_timeout = {max(1, math.ceil(TABLE_TIMEOUT_SECONDS))}")
+        return describe_mysql_table(cursor, table_name)
+    except mysql.connector.errors.ProgrammingError as err:
+        if err.errno != 1146:  # ER_NO_SUCH_TABLE
+            raise
+        return None
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def _load_mysql(names=None):
+    """Describe every table (names=None) or just the given ones. Missing tables map to None."""
+    if names is None:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SHOW TABLES")
+            names = [table[0] for table in cursor.fetchall()]
+        finally:
+            cursor.close()
+            connection.close()
+    return _fan_out(_describe_mysql_task, names)
+
+
+def _load_mongodb(names=None):
+    db = get_mongo_connection()
+    existing = set(db.list_collection_names())
+    if names is None:
+        names = existing
+
+    def describe(name):
+        return describe_mongo_collection(db, name) if name in existing else None
+
+    return _fan_out(describe, names)
+
+
+_loaders = {'mysql': _load_mysql, 'mongodb': _load_mongodb}
+
+
+def explore(db_type, refresh=False):
+    """Return {name: {'attributes', 'sample_data'}} for db_type, reading the database only when needed.
+
+    Tables that failed or timed out are returned as {'error': ...} and retried on the next call.
+    """
+    with _lock:
+        generation = _generation[db_type]
+        full_load = refresh or not _loaded[db_type]
+        stale = set() if full_load else set(_stale[db_type])
+        if not full_load:
+            _stale[db_type].clear()
+
+    failed = {}
+    if full_load:
+        details, failed = _loaders[db_type]()
+        with _lock:
+            _entries[db_type] = {name: detail for name, detail in details.items() if detail is not None}
+            _loaded[db_type] = True
+            # Invalidations that raced with the load stay queued for the next call
+            if _generation[db_type] == generation:
+                _stale[db_type].clear()
+            _stats['full_loads'] += 1
+    elif stale:
+        try:
+            details, failed = _loaders[db_type](sorted(stale))
+        except Exception:
+            with _lock:
+                _stale[db_type].update(stale)
+            raise
+        with _lock:
+            for name, detail in details.items():
+                if detail is None:
+                    _entries[db_type].pop(name, None)
+                else:
+                    _entries[db_type][name] = detail
+            _stats['partial_refreshes'] += 1
+    else:
+        with _lock:
+            _stats['hits'] += 1
+
+    with _lock:
+        if failed:
+            _stale[db_type].update(failed)
+            _stats['timeouts'] += sum(1 for error in failed.values() if error.startswith('Timed out'))
+            _stats['errors'] += sum(1 for error in failed.values() if not error.startswith('Timed out'))
+        result = dict(_entries[db_type])
+    for name, error in failed.items():
+        result[name] = {'error': error}
+    return result
+
+
+def invalidate(db_type, name=None):
+    """Mark one table/collection stale, or the whole catalog for db_type when name is None."""
+    with _lock:
+        _generation[db_type] += 1
+        if name is None:
+            _loaded[db_type] = False
+        else:
+            _stale[db_type].add(name)
+
+
+def is_read_only_sql(sql_query):
+    stripped = sql_query.lstrip().lstrip('(').lower()
+    return stripped.startswith(READ_ONLY_SQL_PREFIXES)
+
+
+def pipeline_output_collections(pipeline):
+    """Collections written by $out/$merge stages of an aggregation pipeline."""
+    outputs = []
+    for stage in pipeline:
+        target = stage.get('$out') or stage.get('$merge')
+        if isinstance(target, dict):
+            target = target.get('into', target.get('coll'))
+        if isinstance(target, dict):
+            target = target.get('coll')
+        if isinstance(target, str):
+            outputs.append(target)
+    return outputs
+
+
+def catalog_stats():
+    with _lock:
+        stats = dict(_stats)
+        for db_type in _entries:
+            stats[db_type] = {
+                'loaded': _loaded[db_type],
+                'entries': len(_entries[db_type]),
+                'stale': sorted(_stale[db_type])
+            }
+    return stats
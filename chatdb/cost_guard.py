@@ -0,0 +1,261 @@
+# cost_guard.py
+# Keeps /api/execute_query from pinning a database thread and a worker for minutes. Before a
+# query runs, EXPLAIN (or Mongo's planner) estimates the rows it will examine; queries over the
+# budget are rejected, or given a LIMIT where that bounds the work. Every query also carries a
+# server-side execution timeout.
+import logging
+import math
+import os
+import re
+
+import mysql.connector
+from pymongo.errors import ExecutionTimeout, PyMongoError
+
+import mongo_pipeline
+
+logger = logging.getLogger(__name__)
+
+MAX_ESTIMATED_ROWS = int(os.environ.get('CHATDB_MAX_ESTIMATED_ROWS', 5000000))  # Budget; 0 skips the pre-check
+EXPENSIVE_QUERY_ACTION = os.environ.get('CHATDB_EXPENSIVE_QUERY_ACTION', 'limit')  # 'limit' or 'reject'
+AUTO_LIMIT_ROWS = int(os.environ.get('CHATDB_AUTO_LIMIT_ROWS', 1000))  # LIMIT added to over-budget queries
+MAX_EXECUTION_MS = int(os.environ.get('CHATDB_MAX_EXECUTION_MS', 30000))  # Server-side timeout; 0 for none
+ESTIMATE_TIMEOUT_MS = 1000  # Cap on the count that sizes an index-backed Mongo filter
+
+MYSQL_TIMEOUT_ERRNO = 3024  # ER_QUERY_TIMEOUT: maximum statement execution time exceeded
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_EXPLAINABLE_SQL = re.compile(r'^\s*(?:SELECT|WITH)\b', re.IGNORECASE)
+_SELECT = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+# MySQL reads its whole input before returning the first row of any of these, so a LIMIT doesn't bound the work
+_BLOCKING_SQL = re.compile(r'\b(?:GROUP\s+BY|ORDER\s+BY|DISTINCT|UNION|HAVING|WINDOW)\b|\bOVER\s*[(\w]|'
+                           r'\b(?:COUNT|SUM|AVG|MIN|MAX|GROUP_CONCAT|JSON_ARRAYAGG|JSON_OBJECTAGG|STD|STDDEV|'
+                           r'VARIANCE|BIT_AND|BIT_OR|BIT_XOR)\s*\(', re.IGNORECASE)
+_TRAILING_LIMIT = re.compile(r'\bLIMIT\s+(\d+)(?:\s*(?:,|\bOFFSET\b)\s*(\d+))?\s*$', re.IGNORECASE)
+# A LIMIT can't simply be appended to statements containing these
+_UNLIMITABLE_SQL = re.compile(r'\b(?:LIMIT|INTO|FOR\s+UPDATE|FOR\s+SHARE|LOCK\s+IN)\b', re.IGNORECASE)
+
+# Mongo stages that consume their whole input before emitting anything
+BLOCKING_STAGES = ('$sort', '$group', '$bucket', '$bucketAuto', '$facet', '$count', '$sortByCount',
+                   '$setWindowFields', '$out', '$merge', '$sample')
+INDEX_PLAN_STAGES = ('IXSCAN', 'COUNT_SCAN', 'IDHACK', 'DISTINCT_SCAN', 'EXPRESS_IXSCAN', 'EXPRESS_IDHACK')
+
+
+class QueryTooExpensive(Exception):
+    def __init__(self, estimated_rows):
+        super().__init__(f"Query is too expensive: about {estimated_rows:,} rows would be examined, over the "
+                         f"budget of {MAX_ESTIMATED_ROWS:,}. Filter on an indexed column or add a LIMIT.")
+        self.estimated_rows = estimated_rows
+
+    def to_dict(self):
+        return {'error': str(self), 'too_expensive': True, 'estimated_rows': self.estimated_rows,
+                'max_estimated_rows': MAX_ESTIMATED_ROWS}
+
+
+def is_timeout(error):
+    """True if error is the server ending a query at the execution timeout."""
+    if isinstance(error, ExecutionTimeout):
+        return True
+    return isinstance(error, mysql.connector.Error) and error.errno == MYSQL_TIMEOUT_ERRNO
+
+
+def timeout_response():
+    return {'error': f"Query was stopped after the {MAX_EXECUTION_MS} ms execution limit", 'too_expensive': True,
+            'max_execution_ms': MAX_EXECUTION_MS}
+
+
+def _bounded(examined, returned, needed):
+    """Rows examined when execution stops after `needed` output rows, if `returned` is the full output."""
+    if returned is None:
+        return examined
+    return min(examined, math.ceil(examined * needed / max(returned, 1)))
+
+
+def _over_budget(examined, limitable, bound):
+    """None if `examined` is within budget, else the LIMIT to add; raises QueryTooExpensive if none fits.
+
+    bound(n) is the estimate once execution stops after n output rows.
+    """
+    if not MAX_ESTIMATED_ROWS or examined <= MAX_ESTIMATED_ROWS:
+        return None
+    if EXPENSIVE_QUERY_ACTION == 'limit' and limitable and bound(AUTO_LIMIT_ROWS) <= MAX_ESTIMATED_ROWS:
+        logger.info("Limiting a query estimated to examine %d rows to %d rows", examined, AUTO_LIMIT_ROWS)
+        return {'limit': AUTO_LIMIT_ROWS, 'estimated_rows': examined}
+    raise QueryTooExpensive(examined)
+
+
+# MySQL
+
+def with_execution_timeout(sql_query):
+    """sql_query with a MAX_EXECUTION_TIME optimizer hint, if it is a SELECT without hints of its own."""
+    if not MAX_EXECUTION_MS or not _SELECT.match(sql_query) or '/*+' in sql_query:
+        return sql_query
+    return _SELECT.sub(f"SELECT /*+ MAX_EXECUTION_TIME({MAX_EXECUTION_MS}) */", sql_query, count=1)
+
+
+def estimate_mysql_rows(cursor, sql_query, params=()):
+    """(rows examined, rows returned) from EXPLAIN, or None if the server can't explain the query.
+
+    Within each SELECT the tables are read as nested loops: every table is scanned once per
+    row that survived the tables before it.
+    """
+    try:
+        cursor.execute(f"EXPLAIN {sql_query}", params)
+        columns = [desc[0].lower() for desc in cursor.description or []]
+        plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except mysql.connector.Error as err:
+        logger.debug("EXPLAIN failed, running without a cost estimate: %s", err)
+        return None
+    if not plan or 'rows' not in columns:
+        return None
+    examined = 0
+    returned = None
+    for select_id in dict.fromkeys(row.get('id') for row in plan):
+        loops = 1.0
+        for row in plan:
+            if row.get('id') == select_id:
+                rows = float(row.get('rows') or 1)
+                examined += loops * rows
+                loops *= rows * float(row.get('filtered') or 100) / 100
+        if returned is None:
+            returned = loops  # The first SELECT in the plan is the outermost one
+    return math.ceil(examined), math.ceil(returned or 0)
+
+
+def guard_sql(cursor, sql_query, params=()):
+    """The statement to run for sql_query: (sql, auto_limit), with auto_limit None unless a LIMIT was added.
+
+    Raises QueryTooExpensive if the estimate is over budget and a LIMIT wouldn't bound it.
+    """
+    if not MAX_ESTIMATED_ROWS or not _EXPLAINABLE_SQL.match(sql_query):
+        return with_execution_timeout(sql_query), None
+    estimate = estimate_mysql_rows(cursor, sql_query, params)
+    if estimate is None:
+        return with_execution_timeout(sql_query), None
+    examined, returned = estimate
+    text = _STRING_LITERAL.sub("''", sql_query).strip().rstrip(';')
+    streamable = not _BLOCKING_SQL.search(text)
+    limit = _TRAILING_LIMIT.search(text)
+    if streamable and limit:
+        # LIMIT n, m and LIMIT n OFFSET m both stop after n + m rows
+        examined = _bounded(examined, returned, int(limit.group(1)) + int(limit.group(2) or 0))
+    limitable = streamable and bool(_SELECT.match(text)) and not _UNLIMITABLE_SQL.search(text)
+    auto_limit = _over_budget(examined, limitable, lambda rows: _bounded(examined, returned, rows))
+    if auto_limit:
+        sql_query = f"{sql_query.strip().rstrip(';')} LIMIT {AUTO_LIMIT_ROWS}"
+    return with_execution_timeout(sql_query), auto_limit
+
+
+# MongoDB
+
+def execution_options():
+    """Keyword arguments that put the server-side timeout on an aggregate() call."""
+    return {'maxTimeMS': MAX_EXECUTION_MS} if MAX_EXECUTION_MS else {}
+
+
+def _plan_stages(plan):
+    stages = set()
+    stack = [plan]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            if isinstance(item.get('stage'), str):
+                stages.add(item['stage'])
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return stages
+
+
+def _find_plan_stages(db, collection_name, query, sort):
+    command = {'find': collection_name, 'filter': query or {}}
+    if sort:
+        command['sort'] = sort
+    try:
+        explain = db.command('explain', command, verbosity='queryPlanner')
+    except PyMongoError as err:
+        logger.debug("explain failed, assuming a collection scan: %s", err)
+        return set()
+    return _plan_stages(mongo_pipeline.winning_plan(explain))
+
+
+def _field_indexed(collection, field):
+    try:
+        indexes = collection.index_information().values()
+    except PyMongoError:
+        return False
+    return any(info['key'] and info['key'][0][0] == field for info in indexes)
+
+
+def estimate_mongo_docs(db, collection_name, pipeline):
+    """(documents examined, documents returned or None if unknown, index-backed leading $sort) for a pipeline."""
+    collection = db[collection_name]
+    total = collection.estimated_document_count()
+    position = 0
+    query = None
+    if pipeline and '$match' in pipeline[0]:
+        query = pipeline[0]['$match']
+        position = 1
+    sort = pipeline[position].get('$sort') if position < len(pipeline) else None
+
+    stages = _find_plan_stages(db, collection_name, query, sort) if query or sort else set()
+    indexed_sort = bool(sort) and bool(stages) and 'SORT' not in stages
+    examined = returned = total
+    if query:
+        if stages & set(INDEX_PLAN_STAGES):
+            # Index-backed: counting the matches is cheap, and stops once it is over budget anyway
+            try:
+                returned = collection.count_documents(query, limit=MAX_ESTIMATED_ROWS + 1,
+                                                      maxTimeMS=ESTIMATE_TIMEOUT_MS)
+            except PyMongoError:
+                returned = total
+            examined = returned
+        else:
+            returned = None  # A collection scan; how many documents match is unknown
+    for stage in pipeline:
+        lookup = stage.get('$lookup')
+        if lookup and lookup.get('from') and lookup.get('foreignField') and 'pipeline' not in lookup:
+            foreign = db[lookup['from']]
+            flowing = total if returned is None else returned
+            if _field_indexed(foreign, lookup['foreignField']):
+                examined += flowing
+            else:
+                examined += flowing * foreign.estimated_document_count()
+    return examined, returned, indexed_sort
+
+
+def guard_pipeline(db, collection_name, pipeline):
+    """The pipeline to run: (pipeline, auto_limit), with auto_limit None unless a $limit was added.
+
+    Raises QueryTooExpensive if the estimate is over budget and a $limit wouldn't bound it.
+    """
+    if not MAX_ESTIMATED_ROWS:
+        return pipeline, None
+    try:
+        examined, returned, indexed_sort = estimate_mongo_docs(db, collection_name, pipeline)
+    except PyMongoError as err:
+        logger.debug("Couldn't estimate the pipeline, running without a cost estimate: %s", err)
+        return pipeline, None
+
+    def blocking(index, stage):
+        name = next(iter(stage), None)
+        return name in BLOCKING_STAGES and not (name == '$sort' and indexed_sort and index <= 1)
+
+    streamable = True
+    needed = None
+    skipped = 0
+    for index, stage in enumerate(pipeline):
+        if blocking(index, stage):
+            streamable = False
+            break
+        if '$skip' in stage:
+            skipped += stage['$skip']
+        if '$limit' in stage:
+            needed = stage['$limit'] + skipped
+            break
+    if streamable and needed is not None:
+        examined = _bounded(examined, returned, needed)
+    limitable = streamable and needed is None and not any(blocking(i, stage) for i, stage in enumerate(pipeline))
+    auto_limit = _over_budget(examined, limitable, lambda rows: _bounded(examined, returned, rows))
+    if auto_limit:
+        pipeline = pipeline + [{'$limit': AUTO_LIMIT_ROWS}]
+    return pipeline, auto_limit
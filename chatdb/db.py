@@ -0,0 +1,242 @@
+# db.py
+# Process-wide database clients: a MySQL connection pool and one shared MongoClient.
+import os
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+from pymongo import MongoClient, monitoring
+from pymongo.errors import PyMongoError
+
+import embedded
+import metrics
+
+# Where CSV uploads are stored and queried: 'mysql', or 'sqlite' for the in-process embedded.py backend
+SQL_BACKEND = os.environ.get('CHATDB_SQL_BACKEND', 'mysql').lower()
+SQL_BACKENDS = ('mysql', 'sqlite')
+if SQL_BACKEND not in SQL_BACKENDS:
+    raise ValueError(f"CHATDB_SQL_BACKEND must be one of {', '.join(SQL_BACKENDS)}, not {SQL_BACKEND!r}")
+
+MYSQL_CONFIG = {
+    'host': "localhost",
+    'port': 3306,
+    'user': "root",
+    'password': "",
+    'database': "dsci551",
+    'auth_plugin': "mysql_native_password"
+}
+MYSQL_POOL_NAME = "chatdb"
+MYSQL_POOL_SIZE = 10  # mysql.connector caps this at 32
+MYSQL_POOL_WAIT_SECONDS = 5.0  # How long a request waits for a free connection before failing
+MYSQL_POOL_RETRY_INTERVAL = 0.01
+
+MONGO_URI = "mongodb://localhost:27017/"
+MONGO_DB_NAME = "chatdb"
+MONGO_MAX_POOL_SIZE = 50
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 5000  # Bounds how long a failed health check holds up callers
+MONGO_HEALTH_CHECK_SECONDS = 30  # Ping the shared client at most this often
+
+_client_lock = threading.Lock()  # Guards creating/replacing the pool and client
+_stats_lock = threading.Lock()  # Guards the counters; also taken from driver monitoring threads
+_mysql_pool = None
+_mongo_client = None
+_mongo_last_check = 0.0
+
+_mysql_stats = {
+    'checkouts': 0,
+    'waits': 0,
+    'timeouts': 0,
+    'in_use': 0,
+    'checkout_seconds_total': 0.0,
+    'checkout_seconds_max': 0.0
+}
+_mongo_stats = {
+    'reconnects': 0,
+    'health_check_failures': 0,
+    'checkouts': 0,
+    'checkout_failures': 0,
+    'in_use': 0,
+    'checkout_seconds_total': 0.0,
+    'checkout_seconds_max': 0.0
+}
+
+
+def _record_checkout(stats, seconds):
+    stats['checkouts'] += 1
+    stats['in_use'] += 1
+    stats['checkout_seconds_total'] += seconds
+    stats['checkout_seconds_max'] = max(stats['checkout_seconds_max'], seconds)
+
+
+class _PoolStatsConnection:
+    """Wraps a pooled connection so returning it to the pool updates the in-use gauge."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._released = False
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        with _stats_lock:
+            _mysql_stats['in_use'] -= 1
+        self._conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def get_mysql_pool():
+    global _mysql_pool
+    with _client_lock:
+        if _mysql_pool is None:
+            # The pool opens its connections eagerly, so it's created on first use
+            _mysql_pool = pooling.MySQLConnectionPool(
+                pool_name=MYSQL_POOL_NAME,
+                pool_size=MYSQL_POOL_SIZE,
+                pool_reset_session=True,
+                **MYSQL_CONFIG
+            )
+        return _mysql_pool
+
+
+def get_db_connection(allow_local_infile=False):
+    """Check out a MySQL connection; close() returns it to the pool.
+
+    Connections that may run LOAD DATA LOCAL INFILE are opened outside the pool so
+    that user queries never run on a connection allowed to read client files. With
+    the sqlite backend this is the thread's embedded connection instead.
+    """
+    if SQL_BACKEND == 'sqlite':
+        return embedded.get_connection()
+    if allow_local_infile:
+        return mysql.connector.connect(allow_local_infile=True, **MYSQL_CONFIG)
+
+    pool = get_mysql_pool()
+    start = time.perf_counter()
+    deadline = start + MYSQL_POOL_WAIT_SECONDS
+    waited = False
+    while True:
+        try:
+            # get_connection pings the connection and reconnects it if the server dropped it
+            conn = pool.get_connection()
+            break
+        except PoolError:
+            if time.perf_counter() >= deadline:
+                with _stats_lock:
+                    _mysql_stats['timeouts'] += 1
+                raise PoolError(f"No MySQL connection available after {MYSQL_POOL_WAIT_SECONDS}s "
+                                f"(pool size {MYSQL_POOL_SIZE})")
+            waited = True
+            time.sleep(MYSQL_POOL_RETRY_INTERVAL)
+
+    seconds = time.perf_counter() - start
+    with _stats_lock:
+        _record_checkout(_mysql_stats, seconds)
+        if waited:
+            _mysql_stats['waits'] += 1
+    metrics.observe_stage('mysql_checkout', seconds)
+    return _PoolStatsConnection(conn)
+
+
+class _MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Collects checkout counts and latency from the driver's own connection pool."""
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        seconds = getattr(event, 'duration', None) or 0.0
+        with _stats_lock:
+            _record_checkout(_mongo_stats, seconds)
+        # Listeners run on the thread that checked the connection out, so the request's endpoint is known
+        metrics.observe_stage('mongo_checkout', seconds)
+
+    def connection_check_out_failed(self, event):
+        with _stats_lock:
+            _mongo_stats['checkout_failures'] += 1
+
+    def connection_checked_in(self, event):
+        with _stats_lock:
+            _mongo_stats['in_use'] -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+
+def _new_mongo_client():
+    return MongoClient(MONGO_URI, maxPoolSize=MONGO_MAX_POOL_SIZE,
+                       serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                       event_listeners=[_MongoPoolListener()])
+
+
+def get_mongo_client():
+    """Return the shared MongoClient, replacing it if a periodic ping fails."""
+    global _mongo_client, _mongo_last_check
+    with _client_lock:
+        now = time.monotonic()
+        if _mongo_client is None:
+            _mongo_client = _new_mongo_client()
+            _mongo_last_check = now
+        elif now - _mongo_last_check > MONGO_HEALTH_CHECK_SECONDS:
+            _mongo_last_check = now
+            try:
+                _mongo_client.admin.command('ping')
+            except PyMongoError:
+                with _stats_lock:
+                    _mongo_stats['health_check_failures'] += 1
+                    _mongo_stats['reconnects'] += 1
+                _mongo_client.close()
+                _mongo_client = _new_mongo_client()
+        return _mongo_client
+
+
+def get_mongo_connection():
+    return get_mongo_client()[MONGO_DB_NAME]
+
+
+def _latency_summary(stats):
+    summary = dict(stats)
+    total = summary.pop('checkout_seconds_total')
+    summary['checkout_ms_avg'] = round(total / stats['checkouts'] * 1000, 3) if stats['checkouts'] else None
+    summary['checkout_ms_max'] = round(summary.pop('checkout_seconds_max') * 1000, 3)
+    return summary
+
+
+def pool_stats():
+    with _stats_lock:
+        mysql_summary = _latency_summary(_mysql_stats)
+        mongo_summary = _latency_summary(_mongo_stats)
+    mysql_summary.update({
+        'pool_size': MYSQL_POOL_SIZE,
+        'wait_timeout_seconds': MYSQL_POOL_WAIT_SECONDS,
+        'initialized': _mysql_pool is not None
+    })
+    mongo_summary.update({
+        'max_pool_size': MONGO_MAX_POOL_SIZE,
+        'health_check_seconds': MONGO_HEALTH_CHECK_SECONDS,
+        'initialized': _mongo_client is not None
+    })
+    mysql_summary['backend'] = SQL_BACKEND
+    return {'mysql': mysql_summary, 'mongodb': mongo_summary}
@@ -0,0 +1,257 @@
+# embedded.py
+# In-process SQLite backend for CSV uploads (CHATDB_SQL_BACKEND=sqlite). Tables live in a local
+# database file, so uploads load without a network round trip and queries run inside the worker.
+# EmbeddedConnection speaks the part of mysql.connector's connection/cursor API the app uses and
+# translates the MySQL-only statements it issues (SHOW/DESCRIBE, ALTER ... MODIFY, SET SESSION,
+# KILL QUERY, ON DUPLICATE KEY UPDATE, MAX_EXECUTION_TIME hints), so loaders, explore, execute_query and the index
+# advisor run unchanged on either backend.
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import errorcode
+
+EMBEDDED_PATH = os.environ.get('CHATDB_EMBEDDED_PATH', 'chatdb_embedded.sqlite3')
+EMBEDDED_BUSY_TIMEOUT_SECONDS = 30.0  # How long a writer waits its turn; concurrent ingest jobs share one writer lock
+EMBEDDED_CACHE_KIB = 256 * 1024  # Page cache per connection
+EMBEDDED_MMAP_BYTES = 1024 ** 3  # Reads are served from the memory-mapped file up to this size
+PROGRESS_CHECK_OPS = 10000  # SQLite VM instructions between execution-timeout checks
+TIMEOUT_ERRNO = 3024  # Reported as MySQL's ER_QUERY_TIMEOUT so callers handle both backends alike
+
+# MySQL statements with no SQLite equivalent that only tune the session or change declared types
+IGNORED_SQL = re.compile(r'^\s*(?:SET\s+SESSION|ALTER\s+TABLE\s+\S+\s+MODIFY\s+COLUMN)\b', re.IGNORECASE)
+SHOW_TABLES = re.compile(r'^\s*SHOW\s+TABLES\s*;?\s*$', re.IGNORECASE)
+DESCRIBE = re.compile(r'^\s*(?:DESCRIBE|DESC|SHOW\s+COLUMNS\s+FROM)\s+`?(\w+)`?\s*;?\s*$', re.IGNORECASE)
+SHOW_INDEX = re.compile(r'^\s*SHOW\s+INDEX\s+FROM\s+`?(\w+)`?\s*;?\s*$', re.IGNORECASE)
+SHOW_VARIABLES = re.compile(r'^\s*SHOW\s+(?:GLOBAL\s+|SESSION\s+)?VARIABLES\b', re.IGNORECASE)
+KILL_QUERY = re.compile(r'^\s*KILL\s+QUERY\s+(\d+)\s*;?\s*$', re.IGNORECASE)
+# Statements that declare column types
+CREATE_TABLE = re.compile(r'^\s*(?:CREATE\s+(?:TEMPORARY\s+)?TABLE|ALTER\s+TABLE\s+\S+\s+ADD\s+COLUMN)\b', re.IGNORECASE)
+DROP_TEMPORARY = re.compile(r'^(\s*DROP\s+)TEMPORARY\s+', re.IGNORECASE)
+ON_DUPLICATE_KEY = re.compile(r'\s+ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(.*)$', re.IGNORECASE | re.DOTALL)
+INSERT_SELECT = re.compile(r'^\s*INSERT\b.*\bSELECT\b', re.IGNORECASE | re.DOTALL)
+WHERE = re.compile(r'\bWHERE\b', re.IGNORECASE)
+VALUES_REFERENCE = re.compile(r'\bVALUES\((`?\w+`?)\)', re.IGNORECASE)
+CREATE_INDEX = re.compile(r'^\s*CREATE\s+INDEX\b', re.IGNORECASE)
+EXECUTION_HINT = re.compile(r'/\*\+\s*MAX_EXECUTION_TIME\((\d+)\)\s*\*/')
+# Text columns compare case-insensitively, like MySQL's default collation. The type is matched only
+# right after a column name that starts a definition, so a column named e.g. "text" is left alone.
+TEXT_COLUMN_TYPE = re.compile(r"((?:\(|,|\bADD\s+COLUMN)\s*(?:`[^`]+`|\w+)\s+)"
+                              r"(ENUM\((?:'(?:[^']|'')*',?)*\)|(?:VAR)?CHAR\(\d+\)|TEXT\b)(?!\s+COLLATE)",
+                              re.IGNORECASE)
+INDEX_PREFIX = re.compile(r'(`\w+`)\(\d+\)')  # TEXT prefix lengths; SQLite indexes whole values
+
+_local = threading.local()
+_connection_ids = itertools.count(1)
+_open_lock = threading.Lock()
+_open = {}  # connection_id -> sqlite3 connection, so KILL QUERY can interrupt another thread's query
+
+
+def _connect():
+    db = sqlite3.connect(EMBEDDED_PATH, timeout=EMBEDDED_BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+    # WAL lets queries read while an upload writes; NORMAL sync is safe under WAL
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("PRAGMA temp_store=MEMORY")
+    db.execute(f"PRAGMA cache_size=-{EMBEDDED_CACHE_KIB}")
+    db.execute(f"PRAGMA mmap_size={EMBEDDED_MMAP_BYTES}")
+    return db
+
+
+def get_connection():
+    """Check out this thread's embedded database; close() ends the checkout.
+
+    Each thread keeps one SQLite connection. Nested checkouts share it, and uncommitted
+    work is rolled back when the outermost one is closed, as when a pooled MySQL
+    connection is returned.
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _Session(_connect())
+        _local.session = session
+        with _open_lock:
+            _open[session.connection_id] = session.db
+    session.checkouts += 1
+    return EmbeddedConnection(session)
+
+
+def _error(err):
+    if isinstance(err, sqlite3.OperationalError) and str(err).startswith('no such table'):
+        return mysql.connector.errors.ProgrammingError(msg=str(err), errno=errorcode.ER_NO_SUCH_TABLE)
+    return mysql.connector.Error(msg=str(err))
+
+
+def translate(operation):
+    """SQLite form of a MySQL statement the app issues (placeholders are handled by the cursor)."""
+    if CREATE_TABLE.match(operation):
+        operation = TEXT_COLUMN_TYPE.sub(
+            lambda match: match.group(1) + ('TEXT' if match.group(2).upper().startswith('ENUM') else match.group(2))
+            + ' COLLATE NOCASE', operation)
+    elif CREATE_INDEX.match(operation):
+        operation = INDEX_PREFIX.sub(r'\1', operation)
+    operation = DROP_TEMPORARY.sub(r'\1', operation.rstrip().rstrip(';'))
+    duplicate_key = ON_DUPLICATE_KEY.search(operation)
+    if duplicate_key:
+        insert = operation[:duplicate_key.start()]
+        if INSERT_SELECT.match(insert) and not WHERE.search(insert):
+            insert += " WHERE true"  # Without it SQLite reads ON CONFLICT as part of a join
+        assignments = VALUES_REFERENCE.sub(r'excluded.\1', duplicate_key.group(1))
+        operation = f"{insert} ON CONFLICT DO UPDATE SET {assignments}"
+    return operation
+
+
+class EmbeddedCursor:
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection._db.cursor()
+        self._rows = None  # Rows of an emulated statement, served instead of the SQLite cursor's
+        self._description = None
+
+    @property
+    def description(self):
+        if self._rows is not None:
+            return self._description
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def _emulate(self, columns, rows):
+        self._description = [(name,) + (None,) * 6 for name in columns]
+        self._rows = iter(rows)
+
+    def _describe(self, table):
+        columns = self._connection._db.execute(f"PRAGMA table_info(`{table}`)").fetchall()
+        if not columns:
+            raise mysql.connector.errors.ProgrammingError(msg=f"Table '{table}' doesn't exist",
+                                                           errno=errorcode.ER_NO_SUCH_TABLE)
+        self._emulate(['Field', 'Type', 'Null', 'Key', 'Default', 'Extra'],
+                      [(name, sql_type, 'NO' if notnull else 'YES', 'PRI' if pk else '', default, '')
+                       for _, name, sql_type, notnull, default, pk in columns])
+
+    def _show_index(self, table):
+        db = self._connection._db
+        rows = []
+        for _, name, unique, *_ in db.execute(f"PRAGMA index_list(`{table}`)").fetchall():
+            for seq, _, column in db.execute(f"PRAGMA index_info(`{name}`)").fetchall():
+                rows.append((table, 0 if unique else 1, name, seq + 1, column))
+        self._emulate(['Table', 'Non_unique', 'Key_name', 'Seq_in_index', 'Column_name'], rows)
+
+    def _emulated(self, operation):
+        """Run operation if it is a MySQL statement SQLite lacks; returns whether it was one."""
+        if IGNORED_SQL.match(operation):
+            self._emulate([], [])
+        elif SHOW_TABLES.match(operation):
+            self._emulate(['Tables'], self._connection._db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name").fetchall())
+        elif SHOW_VARIABLES.match(operation):
+            self._emulate(['Variable_name', 'Value'], [])
+        elif DESCRIBE.match(operation):
+            self._describe(DESCRIBE.match(operation).group(1))
+        elif SHOW_INDEX.match(operation):
+            self._show_index(SHOW_INDEX.match(operation).group(1))
+        elif KILL_QUERY.match(operation):
+            with _open_lock:
+                target = _open.get(int(KILL_QUERY.match(operation).group(1)))
+            # A paused result on this thread's own connection isn't running, and closing its cursor ends it
+            if target is not None and target is not self._connection._db:
+                target.interrupt()
+            self._emulate([], [])
+        else:
+            return False
+        return True
+
+    def execute(self, operation, params=None):
+        self._rows = None
+        if self._emulated(operation):
+            return
+        hint = EXECUTION_HINT.search(operation)
+        if hint:
+            # Rows are produced while they are fetched, so the deadline stays set until the cursor is closed
+            deadline = time.monotonic() + int(hint.group(1)) / 1000
+            self._connection._session.deadline = deadline
+            self._connection._db.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_CHECK_OPS)
+        if params:
+            operation = operation.replace('%s', '?')
+        self._fetch(lambda: self._cursor.execute(translate(operation), tuple(params or ())))
+
+    def executemany(self, operation, seq_params):
+        self._fetch(lambda: self._cursor.executemany(translate(operation.replace('%s', '?')), seq_params))
+
+    def _fetch(self, fetch):
+        try:
+            return fetch()
+        except sqlite3.OperationalError as err:
+            deadline = self._connection._session.deadline
+            if deadline and str(err) == 'interrupted' and time.monotonic() > deadline:
+                raise mysql.connector.Error(msg="Query execution was interrupted, maximum statement execution "
+                                                "time exceeded", errno=TIMEOUT_ERRNO)
+            raise _error(err)
+        except sqlite3.Error as err:
+            raise _error(err)
+
+    def fetchone(self):
+        if self._rows is not None:
+            return next(self._rows, None)
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=1):
+        if self._rows is not None:
+            return list(itertools.islice(self._rows, size))
+        return self._fetch(lambda: self._cursor.fetchmany(size))
+
+    def fetchall(self):
+        if self._rows is not None:
+            return list(self._rows)
+        return self._fetch(self._cursor.fetchall)
+
+    def close(self):
+        self._cursor.close()
+        if self._connection._session.deadline:
+            self._connection._session.deadline = None
+            self._connection._db.set_progress_handler(None, 0)
+
+
+class _Session:
+    def __init__(self, db):
+        self.db = db
+        self.connection_id = next(_connection_ids)
+        self.checkouts = 0
+        self.deadline = None  # Execution deadline of the statement whose rows are being read
+
+
+class EmbeddedConnection:
+    def __init__(self, session):
+        self._session = session
+        self._db = session.db
+        self._closed = False
+        self.connection_id = session.connection_id
+
+    def cursor(self):
+        return EmbeddedCursor(self)
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def consume_results(self):
+        pass
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._session.checkouts -= 1
+        if not self._session.checkouts and self._db.in_transaction:
+            self._db.rollback()
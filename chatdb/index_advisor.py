@@ -0,0 +1,444 @@
+# index_advisor.py
+# Workload-driven index advisor. Records the columns/fields that executed queries and the
+# NL translator filter, group, join and sort on, recommends indexes once a candidate has been
+# used often enough, optionally creates them, and reports query latency before and after.
+import hashlib
+import logging
+import os
+import re
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+from pymongo.errors import PyMongoError
+
+from db import get_db_connection, get_mongo_connection
+
+logger = logging.getLogger(__name__)
+
+AUTO_CREATE_INDEXES = os.environ.get('CHATDB_AUTO_CREATE_INDEXES', 'false').lower() == 'true'
+INDEX_MIN_USES = 5  # Uses of a candidate before it is recommended (and auto-created)
+MAX_INDEX_COLUMNS = 3  # Widest composite index recommended
+MYSQL_TEXT_PREFIX = 64  # TEXT/BLOB columns are indexed on a prefix of this many characters
+LATENCY_SAMPLES = 50  # Recent latencies kept per query for the before/after report
+MAX_TRACKED_QUERIES = 1000
+INDEX_NAME_PREFIX = 'idx_chatdb_'
+INDEX_RETRY_SECONDS = 60  # Wait before auto-creating an index again after a failed build; doubles per failure
+INDEX_RETRY_MAX_SECONDS = 3600
+
+# Weight of one use of a column, by how much an index helps that kind of use
+USE_WEIGHTS = {'equality': 3, 'join': 3, 'range': 2, 'group': 1, 'sort': 1}
+
+_IDENTIFIER = r'`?[A-Za-z_][\w]*`?(?:\.`?[A-Za-z_][\w]*`?)?'
+_CLAUSE_END = r'(?=\bgroup\s+by\b|\border\s+by\b|\bhaving\b|\blimit\b|\bunion\b|\bwindow\b|\bfor\s+update\b|\)|;|$)'
+_WHERE = re.compile(r'\bwhere\b(.+?)' + _CLAUSE_END, re.IGNORECASE | re.DOTALL)
+_GROUP_BY = re.compile(r'\bgroup\s+by\b(.+?)(?=\bhaving\b|\border\s+by\b|\blimit\b|\)|;|$)', re.IGNORECASE | re.DOTALL)
+_ORDER_BY = re.compile(r'\border\s+by\b(.+?)(?=\blimit\b|\)|;|$)', re.IGNORECASE | re.DOTALL)
+_COMPARISON = re.compile(r'(' + _IDENTIFIER + r')\s*'
+                         r'(<=>|<>|!=|>=|<=|=|<|>|\blike\b|\bnot\s+in\b|\bin\b|\bbetween\b|\bis\b)', re.IGNORECASE)
+_FROM_TABLE = re.compile(r'\bfrom\s+(`?\w+`?)(?:\s+(?:as\s+)?(?!where\b|join\b|inner\b|left\b|right\b|cross\b|group\b|'
+                         r'order\b|limit\b|on\b)(\w+))?', re.IGNORECASE)
+_JOIN = re.compile(r'\bjoin\s+(`?\w+`?)(?:\s+(?:as\s+)?(?!on\b)(\w+))?\s+on\s+(' + _IDENTIFIER + r')\s*=\s*('
+                   + _IDENTIFIER + r')', re.IGNORECASE)
+_QUOTED = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_SQL_WORDS = {'and', 'or', 'not', 'null', 'true', 'false', 'is', 'in', 'like', 'between', 'exists', 'select'}
+EQUALITY_OPERATORS = {'=', '<=>', 'in', 'is'}
+MYSQL_NAME = re.compile(r'[A-Za-z0-9_$]{1,64}')
+MONGO_FIELD = re.compile(r'[A-Za-z0-9_][\w.-]*')
+
+_lock = threading.Lock()
+_uses = {}  # (db_type, table, column) -> {use kind: count}
+_composites = {}  # (db_type, table, (columns...)) -> count of queries filtering on all of them
+_queries = {}  # (db_type, fingerprint) -> tracked query
+_created = {}  # (db_type, table, (columns...)) -> creation record
+_failed = {}  # (db_type, table, (columns...)) -> last failed build, with when it may be retried
+_stats = {'recorded_queries': 0, 'recorded_translations': 0, 'indexes_created': 0, 'index_errors': 0}
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='index-advisor')  # One index build at a time
+_pending = set()
+_translation_backlog = deque(maxlen=10000)  # Appends are thread safe, so recording a translation takes no lock
+
+
+def _clean(name):
+    # Table names are kept as written (they can be case sensitive); MySQL column names are not
+    return name.strip().strip('`')
+
+
+def _strip_literals(sql_query):
+    return _QUOTED.sub("''", sql_query)
+
+
+def _aliases(sql_query):
+    """Map aliases and table names to table names; also returns the base (FROM) table."""
+    aliases = {}
+    base = None
+    for table, alias in _FROM_TABLE.findall(sql_query):
+        base = base or _clean(table)
+        aliases[_clean(table).lower()] = _clean(table)
+        if alias:
+            aliases[alias.lower()] = _clean(table)
+    for table, alias, _, _ in _JOIN.findall(sql_query):
+        aliases[_clean(table).lower()] = _clean(table)
+        if alias:
+            aliases[alias.lower()] = _clean(table)
+    return aliases, base
+
+
+def _resolve(column, aliases, base):
+    """(table, column) for a possibly qualified column reference."""
+    parts = [_clean(part) for part in column.split('.')]
+    if len(parts) == 2:
+        return aliases.get(parts[0].lower(), parts[0]), parts[1].lower()
+    return base, parts[0].lower()
+
+
+def _column_list(clause):
+    """Plain column references in a comma separated GROUP BY / ORDER BY list."""
+    columns = []
+    for item in clause.split(','):
+        words = item.split()
+        if words and re.fullmatch(_IDENTIFIER, words[0]) and words[0].lower() not in _SQL_WORDS:
+            columns.append(words[0])
+    return columns
+
+
+def sql_column_uses(sql_query):
+    """[(table, column, use kind)] for the columns a SELECT filters, joins, groups or sorts on."""
+    sql_query = _strip_literals(sql_query)
+    aliases, base = _aliases(sql_query)
+    if base is None:
+        return []
+    uses = []
+    for left, right in ((left, right) for _, _, left, right in _JOIN.findall(sql_query)):
+        uses.append(_resolve(left, aliases, base) + ('join',))
+        uses.append(_resolve(right, aliases, base) + ('join',))
+    for where in _WHERE.findall(sql_query):
+        for column, operator in _COMPARISON.findall(where):
+            if column.lower() in _SQL_WORDS or column[0].isdigit():
+                continue
+            kind = 'equality' if operator.lower() in EQUALITY_OPERATORS else 'range'
+            uses.append(_resolve(column, aliases, base) + (kind,))
+    for clause in _GROUP_BY.findall(sql_query):
+        uses.extend(_resolve(column, aliases, base) + ('group',) for column in _column_list(clause))
+    for clause in _ORDER_BY.findall(sql_query):
+        uses.extend(_resolve(column, aliases, base) + ('sort',) for column in _column_list(clause))
+    return uses
+
+
+def pipeline_field_uses(collection_name, pipeline):
+    """[(collection, field, use kind)] for the fields a pipeline's leading stages can use an index for."""
+    uses = []
+    for position, stage in enumerate(pipeline):
+        name, spec = next(iter(stage.items()))
+        if name == '$match' and position == 0:
+            for field, condition in spec.items():
+                if field.startswith('$'):
+                    continue
+                ranged = isinstance(condition, dict) and any(op in condition for op in ('$gt', '$gte', '$lt', '$lte'))
+                uses.append((collection_name, field, 'range' if ranged else 'equality'))
+        elif name == '$sort' and position <= 1:
+            uses.extend((collection_name, field, 'sort') for field in spec)
+        elif name == '$lookup' and spec.get('from') and spec.get('foreignField'):
+            # The lookup probes the joined collection by foreignField once per input document
+            uses.append((str(spec['from']), spec['foreignField'], 'join'))
+        elif name == '$group' and position == 0 and isinstance(spec.get('_id'), str) and spec['_id'].startswith('$'):
+            uses.append((collection_name, spec['_id'][1:], 'group'))
+    return uses
+
+
+def _add_uses(db_type, uses):
+    filtered = {}
+    for table, column, kind in uses:
+        if not table or not column or column == '*':
+            continue
+        counts = _uses.setdefault((db_type, table, column), {})
+        counts[kind] = counts.get(kind, 0) + 1
+        if kind in ('equality', 'range'):
+            filtered.setdefault(table, []).append((kind != 'equality', column))
+    # Equality columns first, then one range column: the most a composite index can serve
+    for table, columns in filtered.items():
+        ordered = []
+        for ranged, column in sorted(set(columns)):
+            if column not in ordered:
+                ordered.append(column)
+            if ranged:
+                break
+        if 1 < len(ordered) <= MAX_INDEX_COLUMNS:
+            key = (db_type, table, tuple(ordered))
+            _composites[key] = _composites.get(key, 0) + 1
+
+
+def _candidates(db_type, uses):
+    candidates = {(table, (column,)) for table, column, _ in uses if table and column and column != '*'}
+    filtered = {}
+    for table, column, kind in uses:
+        if kind in ('equality', 'range'):
+            filtered.setdefault(table, set()).add(column)
+    candidates |= {(table, columns) for (db, table, columns) in _composites
+                   if db == db_type and table in filtered and set(columns) <= filtered[table]}
+    return candidates
+
+
+def _score(db_type, table, columns):
+    if len(columns) > 1:
+        return _composites.get((db_type, table, columns), 0) * USE_WEIGHTS['equality']
+    counts = _uses.get((db_type, table, columns[0]), {})
+    return sum(USE_WEIGHTS[kind] * count for kind, count in counts.items())
+
+
+def _uses_count(db_type, table, columns):
+    if len(columns) > 1:
+        return _composites.get((db_type, table, columns), 0)
+    return sum(_uses.get((db_type, table, columns[0]), {}).values())
+
+
+def _covered(key, others):
+    """True if an index in others starts with key's columns on the same table."""
+    db_type, table, columns = key
+    return any(other[0] == db_type and other[1] == table and other[2][:len(columns)] == columns
+               for other in others)
+
+
+def record_query(db_type, query_text, uses, seconds):
+    """Record one executed query: the columns it used and how long it took."""
+    fingerprint = hashlib.sha1(" ".join(query_text.split()).encode()).hexdigest()[:16]
+    due = []
+    with _lock:
+        _drain_translations()
+        _stats['recorded_queries'] += 1
+        _add_uses(db_type, uses)
+        tracked = _queries.get((db_type, fingerprint))
+        if tracked is None:
+            if len(_queries) >= MAX_TRACKED_QUERIES:
+                _queries.pop(next(iter(_queries)))
+            tracked = _queries[(db_type, fingerprint)] = {
+                'query': query_text[:500],
+                'candidates': _candidates(db_type, uses),
+                'samples': deque(maxlen=LATENCY_SAMPLES),
+                'before': {},  # index key -> samples taken before it was created
+            }
+        else:
+            tracked['candidates'] |= _candidates(db_type, uses)
+        tracked['samples'].append(seconds)
+        if AUTO_CREATE_INDEXES:
+            # Widest first, so a composite index is built instead of the single-column ones it covers
+            for table, columns in sorted(tracked['candidates'], key=lambda item: -len(item[1])):
+                key = (db_type, table, columns)
+                if (not _covered(key, list(_created) + list(_pending))
+                        and _uses_count(db_type, table, columns) >= INDEX_MIN_USES
+                        and time.time() >= _failed.get(key, {}).get('retry_at', 0)):
+                    _pending.add(key)
+                    due.append(key)
+    for key in due:
+        _executor.submit(_create_in_background, *key)
+
+
+def record_sql(sql_query, seconds):
+    record_query('mysql', sql_query, sql_column_uses(sql_query), seconds)
+
+
+def record_pipeline(collection_name, pipeline, seconds):
+    record_query('mongodb', f"{collection_name}:{pipeline}", pipeline_field_uses(collection_name, pipeline), seconds)
+
+
+def record_translation(sql_query):
+    """Record the columns a translated question's SQL will filter, group and join on (not yet executed).
+
+    Called for every translation served, cached or not, so it only queues the SQL; it is
+    parsed the next time the advisor needs its counts.
+    """
+    if sql_query:
+        _translation_backlog.append(sql_query)
+
+
+def _drain_translations():
+    """Parse queued translations into use counts. Call with _lock held."""
+    while _translation_backlog:
+        _stats['recorded_translations'] += 1
+        _add_uses('mysql', sql_column_uses(_translation_backlog.popleft()))
+
+
+def index_name(columns, prefix=INDEX_NAME_PREFIX):
+    name = prefix + "_".join(columns)
+    if len(name) > 64:  # MySQL identifier limit
+        name = name[:55] + "_" + hashlib.sha1(name.encode()).hexdigest()[:8]
+    return name
+
+
+def _existing_mysql_indexes(cursor, table):
+    cursor.execute(f"SHOW INDEX FROM `{table}`")
+    names = [desc[0] for desc in cursor.description]
+    indexes = {}
+    for row in cursor.fetchall():
+        info = dict(zip(names, row))
+        indexes.setdefault(info['Key_name'], []).append((info['Seq_in_index'], info['Column_name'].lower()))
+    return [tuple(column for _, column in sorted(columns)) for columns in indexes.values()]
+
+
+def _create_mysql_index(table, columns):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # An existing index that starts with these columns already serves them
+        for existing in _existing_mysql_indexes(cursor, table):
+            if existing[:len(columns)] == columns:
+                return None
+        cursor.execute(f"SHOW COLUMNS FROM `{table}`")
+        types = {row[0].lower(): str(row[1]).lower() for row in cursor.fetchall()}
+        parts = []
+        for column in columns:
+            if column not in types:
+                raise ValueError(f"Unknown column {table}.{column}")
+            prefix = f"({MYSQL_TEXT_PREFIX})" if 'text' in types[column] or 'blob' in types[column] else ""
+            parts.append(f"`{column}`{prefix}")
+        name = index_name(columns)
+        cursor.execute(f"CREATE INDEX `{name}` ON `{table}` ({', '.join(parts)})")
+        conn.commit()
+        return name
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _create_mongo_index(collection_name, fields):
+    collection = get_mongo_connection()[collection_name]
+    for info in collection.index_information().values():
+        existing = tuple(field for field, _ in info['key'])
+        if existing[:len(fields)] == fields:
+            return None
+    return collection.create_index([(field, 1) for field in fields], name=index_name(fields))
+
+
+def create_index(db_type, table, columns):
+    """Create the index now. Returns its creation record; name is None if an existing index covers it."""
+    columns = tuple(columns)
+    pattern = MYSQL_NAME if db_type == 'mysql' else MONGO_FIELD
+    if not MYSQL_NAME.fullmatch(table) or not all(pattern.fullmatch(column) for column in columns):
+        raise ValueError("Invalid table or column name")
+    key = (db_type, table, columns)
+    started = time.perf_counter()
+    if db_type == 'mysql':
+        name = _create_mysql_index(table, columns)
+    else:
+        name = _create_mongo_index(table, columns)
+    record = {
+        'db_type': db_type,
+        'table': table,
+        'columns': list(columns),
+        'index_name': name,
+        'already_covered': name is None,
+        'build_seconds': round(time.perf_counter() - started, 3),
+        'created_at': time.time(),
+    }
+    with _lock:
+        _created[key] = record
+        _failed.pop(key, None)
+        _pending.discard(key)
+        if name:
+            _stats['indexes_created'] += 1
+        # Latency so far is the "before"; samples from now on are the "after"
+        for tracked in _queries.values():
+            if (table, columns) in tracked['candidates']:
+                tracked['before'][key] = list(tracked['samples'])
+                tracked['samples'].clear()
+    return record
+
+
+def _create_in_background(db_type, table, columns):
+    key = (db_type, table, columns)
+    try:
+        create_index(db_type, table, columns)
+    except Exception as e:
+        if isinstance(e, (mysql.connector.Error, PyMongoError, ValueError)):
+            logger.warning("Could not create index on %s %s: %s", table, list(columns), e)
+        else:
+            logger.exception("Unexpected error creating index on %s %s", table, list(columns))
+        with _lock:
+            attempts = _failed.get(key, {}).get('attempts', 0) + 1
+            delay = min(INDEX_RETRY_SECONDS * 2 ** (attempts - 1), INDEX_RETRY_MAX_SECONDS)
+            now = time.time()
+            _failed[key] = {'db_type': db_type, 'table': table, 'columns': list(columns), 'error': str(e),
+                            'attempts': attempts, 'failed_at': now, 'retry_at': now + delay}
+            _stats['index_errors'] += 1
+    finally:
+        # Whatever happened, the candidate is no longer being built and may be retried (after _failed's delay)
+        with _lock:
+            _pending.discard(key)
+
+
+def forget(db_type, table):
+    """The table/collection was reloaded (dropped and recreated), so its indexes are gone."""
+    table = table.lower()
+    with _lock:
+        for key in [key for key in _created if key[0] == db_type and key[1].lower() == table]:
+            del _created[key]
+        for key in [key for key in _failed if key[0] == db_type and key[1].lower() == table]:
+            del _failed[key]
+        for tracked in _queries.values():
+            for key in [key for key in tracked['before'] if key[0] == db_type and key[1].lower() == table]:
+                del tracked['before'][key]
+
+
+def _median_ms(samples):
+    return round(statistics.median(samples) * 1000, 3) if samples else None
+
+
+def recommendations():
+    """Candidates used at least INDEX_MIN_USES times and not yet created, best first."""
+    with _lock:
+        _drain_translations()
+        candidates = {(db_type, table, (column,)) for db_type, table, column in _uses}
+        candidates |= set(_composites)
+        due = [key for key in candidates if _uses_count(*key) >= INDEX_MIN_USES]
+        rows = []
+        for key in due:
+            uses = _uses_count(*key)
+            # Skip what an existing or a wider recommended index already serves
+            if _covered(key, _created) or _covered(key, [other for other in due if len(other[2]) > len(key[2])]):
+                continue
+            db_type, table, columns = key
+            rows.append({
+                'db_type': db_type,
+                'table': table,
+                'columns': list(columns),
+                'uses': uses,
+                'score': _score(*key),
+                'use_kinds': dict(_uses.get((db_type, table, columns[0]), {})) if len(columns) == 1 else
+                             {'composite_filter': uses},
+                'last_error': _failed[key]['error'] if key in _failed else None,
+            })
+    return sorted(rows, key=lambda row: (-row['score'], row['table'], row['columns']))
+
+
+def report():
+    """Recommendations, created indexes, failed builds and before/after latency of the queries they affect."""
+    with _lock:
+        created = [dict(record) for record in _created.values()]
+        failed = [dict(record) for record in _failed.values()]
+        impact = []
+        for (db_type, _), tracked in _queries.items():
+            for key, before in tracked['before'].items():
+                after = list(tracked['samples'])
+                before_ms = _median_ms(before)
+                after_ms = _median_ms(after)
+                impact.append({
+                    'query': tracked['query'],
+                    'index': {'db_type': key[0], 'table': key[1], 'columns': list(key[2])},
+                    'before_median_ms': before_ms,
+                    'after_median_ms': after_ms,
+                    'before_samples': len(before),
+                    'after_samples': len(after),
+                    'speedup': round(before_ms / after_ms, 2) if before_ms and after_ms else None,
+                })
+        stats = dict(_stats)
+    return {
+        'auto_create': AUTO_CREATE_INDEXES,
+        'min_uses': INDEX_MIN_USES,
+        'recommendations': recommendations(),
+        'created': created,
+        'failed': failed,
+        'impact': impact,
+        'stats': stats,
+    }
@@ -0,0 +1,218 @@
+# jobs.py
+# Background ingestion jobs: uploads are loaded on a small worker pool so requests return immediately.
+import logging
+import threading
+import time
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Concurrent loads; keep well below db.MYSQL_POOL_SIZE so queries still get connections
+INGEST_WORKERS = int(os.environ.get('CHATDB_INGEST_WORKERS', 4))
+MAX_FINISHED_JOBS = 200  # Finished jobs kept around for status lookups
+MAX_BATCHES = 200  # Multi-file uploads kept around for status lookups
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = {SUCCEEDED, FAILED, CANCELLED}
+# Files of a multi-file upload that never became a job
+SKIPPED = 'skipped'  # Already loaded
+REJECTED = 'rejected'  # Invalid type or options, or its table is already being loaded
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='ingest')
+_jobs = {}
+_batches = OrderedDict()  # batch_id -> per-file entries: an IngestJob, or a dict for files that weren't loaded
+_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class IngestJob:
+    def __init__(self, filename, target):
+        self.job_id = uuid.uuid4().hex
+        self.filename = filename
+        self.target = target
+        self.status = QUEUED
+        self.rows = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self._cancel_requested = threading.Event()
+
+    def report_progress(self, rows):
+        """Called by loaders after each batch; raises JobCancelled once a cancel was requested."""
+        self.rows += rows
+        if self._cancel_requested.is_set():
+            raise JobCancelled()
+
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_dict(self):
+        elapsed = self.elapsed()
+        return {
+            'job_id': self.job_id,
+            'filename': self.filename,
+            'target': self.target,
+            'status': self.status,
+            'rows': self.rows,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(self.rows / elapsed, 1) if elapsed > 0 else None,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+def _run(job, load, on_success):
+    with _lock:
+        if job.status != QUEUED:
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+    try:
+        job.result = load(progress=job.report_progress)
+        if job.result and 'rows' in job.result:
+            job.rows = job.result['rows']
+        if on_success:
+            on_success(job.result)
+        status = SUCCEEDED
+    except JobCancelled:
+        status = CANCELLED
+    except Exception as e:
+        job.error = str(e)
+        logger.exception("Ingest job %s for %s failed", job.job_id, job.filename)
+        status = FAILED
+    with _lock:
+        job.status = status
+        job.finished_at = time.time()
+
+
+def _prune_finished():
+    finished = [job for job in _jobs.values() if job.status in FINISHED_STATES]
+    finished.sort(key=lambda job: job.finished_at or 0)
+    for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job.job_id]
+
+
+def reserve_job(filename, target):
+    """Claim target for a new job, unless an unfinished job already holds it.
+
+    The check and the claim happen under one lock, so two uploads of the same table can't both
+    pass it. Returns (job, None) or (None, the job holding target). Start the job with start_job,
+    or give the claim back with release_job.
+    """
+    with _lock:
+        for job in _jobs.values():
+            if job.target == target and job.status not in FINISHED_STATES:
+                return None, job
+        _prune_finished()
+        job = IngestJob(filename, target)
+        _jobs[job.job_id] = job
+    return job, None
+
+
+def start_job(job, load, on_success=None):
+    """Queue load(progress=...) on the worker pool for a reserved job."""
+    job.future = _executor.submit(_run, job, load, on_success)
+    return job
+
+
+def release_job(job):
+    """Drop a reservation that was never started, e.g. because its file was already loaded."""
+    with _lock:
+        if job.future is None:
+            _jobs.pop(job.job_id, None)
+
+
+def wait_job(job, timeout=None):
+    """Block until the job has finished or timeout seconds have passed; returns whether it finished."""
+    if job.future:
+        wait([job.future], timeout)
+    with _lock:
+        return job.status in FINISHED_STATES
+
+
+def get_job(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs():
+    with _lock:
+        jobs = list(_jobs.values())
+    return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+
+def cancel_job(job_id):
+    """Request cancellation. Queued jobs never start; running jobs stop after their current batch."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        job._cancel_requested.set()
+        if job.status == QUEUED:
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            if job.future:
+                job.future.cancel()
+    return job
+
+
+def submit_batch(entries):
+    """Group the per-file entries of one multi-file upload; returns the batch id."""
+    batch_id = uuid.uuid4().hex
+    with _lock:
+        _batches[batch_id] = list(entries)
+        while len(_batches) > MAX_BATCHES:
+            _batches.popitem(last=False)
+    return batch_id
+
+
+def wait_batch(batch_id, timeout=None):
+    """Block until every job in the batch has finished or timeout seconds have passed; returns whether they all did."""
+    with _lock:
+        entries = list(_batches.get(batch_id, ()))
+    _, pending = wait([entry.future for entry in entries if isinstance(entry, IngestJob) and entry.future], timeout)
+    return not pending
+
+
+def batch_status(batch_id):
+    """Per-file results of a multi-file upload and their totals, or None for an unknown batch."""
+    with _lock:
+        entries = _batches.get(batch_id)
+        if entries is None:
+            return None
+        files = [entry.to_dict() if isinstance(entry, IngestJob) else dict(entry) for entry in entries]
+    counts = {}
+    for entry in files:
+        counts[entry['status']] = counts.get(entry['status'], 0) + 1
+    # Rejected files (e.g. a README inside an archive) show in the counts but don't fail the batch
+    if counts.get(QUEUED) or counts.get(RUNNING):
+        status = RUNNING
+    elif counts.get(FAILED) or counts.get(CANCELLED):
+        status = FAILED
+    else:
+        status = SUCCEEDED
+    return {
+        'batch_id': batch_id,
+        'status': status,
+        'counts': counts,
+        'rows': sum(entry['rows'] or 0 for entry in files if entry['status'] == SUCCEEDED),
+        'files': files
+    }
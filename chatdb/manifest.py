@@ -0,0 +1,104 @@
+# manifest.py
+# Which uploaded files each table/collection currently holds. Uploads are hashed while they
+# are written to disk, so re-sending a file whose contents are already loaded is answered from
+# here instead of reloading it. Entries are kept in a SQLite file (CHATDB_MANIFEST_PATH) shared
+# by every worker process on the host, and are dropped when a load fails or a query writes to
+# the table outside an upload.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+MANIFEST_PATH = os.environ.get('CHATDB_MANIFEST_PATH', 'chatdb_manifest.sqlite3')
+HASH_BLOCK_SIZE = 1024 * 1024  # Bytes read from the upload stream per hash update and disk write
+MAX_FILES_PER_TABLE = 100  # Appends/upserts remembered per table; the oldest are dropped beyond this
+
+_local = threading.local()  # sqlite3 connections can't be shared between threads
+
+
+def save_and_hash(stream, filepath):
+    """Copy an upload stream to filepath, hashing it on the way. Returns (sha256 hex digest, bytes)."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(filepath, 'wb') as out:
+        while True:
+            block = stream.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            out.write(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != MANIFEST_PATH:
+        conn = sqlite3.connect(MANIFEST_PATH, timeout=5.0, isolation_level=None)
+        # WAL lets readers in other processes proceed while one worker writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS loaded_files (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                     "db_type TEXT NOT NULL, table_key TEXT NOT NULL, name TEXT NOT NULL, file TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS loaded_files_table ON loaded_files (db_type, table_key, id)")
+        _local.conn = conn
+        _local.path = MANIFEST_PATH
+    return conn
+
+
+def loaded_file(db_type, name, sha256, write_mode):
+    """The record of this file if loading it again with write_mode would change nothing, else None.
+
+    That is the case when it was the last file loaded into the table/collection, with the same
+    write mode and without failed rows: a replace would reload the same rows and an upsert
+    rewrite them. Appends always load.
+    """
+    if write_mode == 'append':
+        return None
+    row = _connection().execute("SELECT file FROM loaded_files WHERE db_type = ? AND table_key = ? "
+                                "ORDER BY id DESC LIMIT 1", (db_type, name.lower())).fetchone()
+    if row is None:
+        return None
+    last = json.loads(row[0])
+    if last['sha256'] == sha256 and last['write_mode'] == write_mode and not last.get('failed_rows'):
+        return last
+    return None
+
+
+def record(db_type, name, upload, write_mode, result):
+    """Remember a finished load; upload holds the file's filename, sha256 and bytes."""
+    file_record = dict(upload, write_mode=write_mode, rows=result.get('rows'), failed_rows=result.get('failed_rows'),
+                       schema=result.get('column_types'), loaded_at=time.time())
+    conn = _connection()
+    # One write transaction, so concurrent workers recording the same table don't interleave
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if write_mode == 'replace':
+            conn.execute("DELETE FROM loaded_files WHERE db_type = ? AND table_key = ?", (db_type, name.lower()))
+        conn.execute("INSERT INTO loaded_files (db_type, table_key, name, file) VALUES (?, ?, ?, ?)",
+                     (db_type, name.lower(), name, json.dumps(file_record, default=str)))
+        conn.execute("DELETE FROM loaded_files WHERE db_type = ? AND table_key = ? AND id NOT IN "
+                     "(SELECT id FROM loaded_files WHERE db_type = ? AND table_key = ? ORDER BY id DESC LIMIT ?)",
+                     (db_type, name.lower(), db_type, name.lower(), MAX_FILES_PER_TABLE))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def forget(db_type, name=None):
+    """The table/collection (every one of db_type when name is None) may no longer match its files."""
+    if name is None:
+        _connection().execute("DELETE FROM loaded_files WHERE db_type = ?", (db_type,))
+    else:
+        _connection().execute("DELETE FROM loaded_files WHERE db_type = ? AND table_key = ?", (db_type, name.lower()))
+
+
+def report():
+    entries = {}
+    for db_type, table_key, name, file in _connection().execute(
+            "SELECT db_type, table_key, name, file FROM loaded_files ORDER BY db_type, table_key, id"):
+        entry = entries.setdefault((db_type, table_key), {'db_type': db_type, 'name': name, 'files': []})
+        entry['files'].append(json.loads(file))
+    return {'manifest_path': MANIFEST_PATH, 'loaded': list(entries.values())}
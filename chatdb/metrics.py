@@ -0,0 +1,106 @@
+# metrics.py
+# Per-stage latency histograms (translation, connection checkout, execution, fetch,
+# serialization, ...) and per-endpoint request timings, rendered in the Prometheus text format.
+import threading
+import time
+
+from flask import has_request_context, request
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = "chatdb"
+
+_lock = threading.Lock()
+_histograms = {}  # (metric, labels) -> [bucket counts..., +Inf count, sum]
+_help = {
+    'stage_seconds': "Time spent in one stage of handling a request",
+    'request_seconds': "Time from receiving a request to returning its response",
+}
+
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'background'
+
+
+def observe(metric, seconds, **labels):
+    """Add one observation to the histogram for metric and labels."""
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[index] += 1
+                break
+        else:
+            histogram[len(BUCKETS)] += 1
+        histogram[-1] += seconds
+
+
+def observe_stage(stage, seconds, endpoint=None):
+    observe('stage_seconds', seconds, stage=stage, endpoint=endpoint or _current_endpoint())
+
+
+class stage:
+    """Context manager timing a block as one stage of the current request.
+
+        with metrics.stage('execute'):
+            cursor.execute(sql_query)
+    """
+
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe_stage(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def render():
+    """All histograms in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        snapshot = {key: list(values) for key, values in _histograms.items()}
+    lines = []
+    for metric in sorted({metric for metric, _ in snapshot}):
+        name = f"{METRIC_PREFIX}_{metric}"
+        lines.append(f"# HELP {name} {_help.get(metric, metric)}")
+        lines.append(f"# TYPE {name} histogram")
+        for (series_metric, labels), values in sorted(snapshot.items()):
+            if series_metric != metric:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            cumulative += values[len(BUCKETS)]
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name, help_text, samples):
+    """Prometheus lines for a gauge; samples is a list of (labels dict, value)."""
+    full_name = f"{METRIC_PREFIX}_{name}"
+    lines = [f"# HELP {full_name} {help_text}", f"# TYPE {full_name} gauge"]
+    for labels, value in samples:
+        if value is not None:
+            lines.append(f"{full_name}{_format_labels(sorted(labels.items()))} {value}")
+    return "\n".join(lines) + "\n"
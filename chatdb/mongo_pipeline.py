@@ -0,0 +1,285 @@
+# mongo_pipeline.py
+# Builds the aggregation pipeline for a Mongo /api/execute_query request. Stages are ordered
+# so the server can use indexes: base-collection filters first, only the fields needed
+# carried into $lookup, and $sort directly followed by its $limit so it runs as a top-k sort.
+
+# Operators whose operands are not field paths, so a filter using them can't be reasoned about
+OPAQUE_OPERATORS = ('$expr', '$where', '$text', '$jsonSchema', '$function')
+# Operators that tell a missing field from a null one; $group turns a missing key field into _id: null
+MISSING_SENSITIVE_OPERATORS = ('$exists', '$type')
+WHOLE_DOCUMENT = '$$ROOT'
+
+
+def _root(path):
+    return path.split('.', 1)[0]
+
+
+def _filter_fields(condition):
+    """Root field names a $match condition reads, or None if it can't be determined."""
+    fields = set()
+    for key, value in condition.items():
+        if key in OPAQUE_OPERATORS:
+            return None
+        if key in ('$and', '$or', '$nor'):
+            for clause in value:
+                clause_fields = _filter_fields(clause)
+                if clause_fields is None:
+                    return None
+                fields |= clause_fields
+        elif key.startswith('$'):
+            return None
+        else:
+            fields.add(_root(key))
+    return fields
+
+
+def _expression_fields(expression, fields):
+    """Collect the root fields of "$field" references inside an aggregation expression.
+
+    References to the whole document ($$ROOT/$$CURRENT) are collected as WHOLE_DOCUMENT.
+    """
+    if isinstance(expression, str):
+        if expression.startswith(('$$ROOT', '$$CURRENT')):
+            fields.add(WHOLE_DOCUMENT)
+        elif expression.startswith('$') and not expression.startswith('$$'):
+            fields.add(_root(expression[1:]))
+    elif isinstance(expression, dict):
+        for value in expression.values():
+            _expression_fields(value, fields)
+    elif isinstance(expression, list):
+        for value in expression:
+            _expression_fields(value, fields)
+    return fields
+
+
+def _unwind_path(unwind):
+    path = unwind.get('path') if isinstance(unwind, dict) else unwind
+    return path[1:] if isinstance(path, str) and path.startswith('$') else path
+
+
+def _uses_operators(condition, operators):
+    if isinstance(condition, dict):
+        return any(key in operators or _uses_operators(value, operators) for key, value in condition.items())
+    if isinstance(condition, list):
+        return any(_uses_operators(value, operators) for value in condition)
+    return False
+
+
+def _field_reference(expression):
+    if isinstance(expression, str) and expression.startswith('$') and not expression.startswith('$$'):
+        return expression[1:]
+    return None
+
+
+def _group_key_source(group, key):
+    """The base-collection path that a filter key on $group's output reads, or None.
+
+    Only the group key maps back: "_id" when it is a plain "$field", or "_id.<name>"
+    when it is a document of them. Accumulator fields exist only after the group.
+    """
+    if key != '_id' and not key.startswith('_id.'):
+        return None
+    group_id = group.get('_id')
+    rest = key[len('_id.'):] if key != '_id' else ''
+    source = _field_reference(group_id)
+    if source is None and isinstance(group_id, dict) and rest:
+        name, _, rest = rest.partition('.')
+        source = _field_reference(group_id.get(name))
+    if source is None:
+        return None
+    return f"{source}.{rest}" if rest else source
+
+
+def _split_filter(query, derived):
+    """Split a filter into (conditions safe to run on the base collection, the rest).
+
+    A top-level condition stays in the late $match if it reads a field produced or
+    reshaped by $lookup/$unwind (the derived set) or can't be analysed.
+    """
+    early = {}
+    late = {}
+    for key, value in query.items():
+        fields = _filter_fields({key: value})
+        if fields is None or fields & derived:
+            late[key] = value
+        else:
+            early[key] = value
+    return early, late
+
+
+def _split_group_filter(query, group, derived):
+    """Split a filter on $group's output into (conditions rewritten to run before $group, the rest).
+
+    After $group a document holds only its key (_id) and accumulators. A condition on the
+    key reads the same value as one on the field the key is taken from, so it is moved
+    ahead of the group, which then never builds the groups it rejects. Conditions on
+    accumulators or on other fields ($group drops them, so they match as missing) stay
+    after it, as do $exists/$type tests on the key.
+    """
+    early = {}
+    late = {}
+    for key, value in query.items():
+        source = _group_key_source(group, key)
+        if (source is None or _root(source) in derived or _filter_fields({key: value}) is None
+                or _uses_operators(value, MISSING_SENSITIVE_OPERATORS)):
+            late[key] = value
+        else:
+            early[source] = value
+    return early, late
+
+
+def _is_inclusion(projection):
+    return all(value in (1, True) or (key == '_id' and value in (0, False)) for key, value in projection.items())
+
+
+def _keeps_fields(projection, fields):
+    """True if an inclusion projection passes every field in fields through unchanged."""
+    if not _is_inclusion(projection):
+        return False
+    kept = {_root(key) for key, value in projection.items() if value in (1, True)}
+    if projection.get('_id', 1) in (1, True):
+        kept.add('_id')
+    return fields <= kept
+
+
+def _sort_and_limit(sort, skip, limit):
+    """$sort/$skip/$limit with the limit widened to cover the skip and placed right after $sort."""
+    stages = []
+    if sort:
+        stages.append({'$sort': sort})
+    if limit:
+        stages.append({'$limit': limit + (skip or 0)})
+    if skip:
+        stages.append({'$skip': skip})
+    return stages
+
+
+def build_pipeline(spec):
+    """Aggregation pipeline for a parsed execute_query request.
+
+    A caller-supplied 'aggregation' pipeline is kept as written and the other options
+    are appended in their original order; otherwise stages are reordered as described
+    at the top of this module without changing the result. The query filters what the
+    pipeline produces, so with a group it applies to the grouped documents; only
+    conditions on the group key are moved ahead of $group (see _split_group_filter).
+    """
+    query = spec.get('query') or {}
+    projection = spec.get('projection')
+    sort = spec.get('sort')
+    limit = spec.get('limit')
+    skip = spec.get('skip')
+    lookup = spec.get('lookup')
+    unwind = spec.get('unwind')
+    group = spec.get('group')
+
+    lookup_stage = None
+    if lookup:
+        lookup_stage = {'$lookup': {
+            'from': lookup.get('from'),
+            'localField': lookup.get('localField'),
+            'foreignField': lookup.get('foreignField'),
+            'as': lookup.get('as')
+        }}
+
+    if spec.get('aggregation'):
+        pipeline = list(spec['aggregation'])
+        if lookup_stage:
+            pipeline.append(lookup_stage)
+        if unwind:
+            pipeline.append({'$unwind': unwind})
+        if group:
+            pipeline.append({'$group': group})
+        if query:
+            pipeline.append({'$match': query})
+        if projection:
+            pipeline.append({'$project': projection})
+        if sort:
+            pipeline.append({'$sort': sort})
+        if skip:
+            pipeline.append({'$skip': skip})
+        if limit:
+            pipeline.append({'$limit': limit})
+        return pipeline
+
+    # Fields that don't mean the same thing before the join/unwind as after it
+    derived = set()
+    if lookup:
+        derived.add(_root(lookup.get('as') or ''))
+    if unwind:
+        derived.add(_root(_unwind_path(unwind) or ''))
+
+    if group:
+        early_filter, late_filter = _split_group_filter(query, group, derived)
+    else:
+        early_filter, late_filter = _split_filter(query, derived)
+    pipeline = [{'$match': early_filter}] if early_filter else []
+
+    sort_fields = {_root(field) for field in (sort or {})}
+    # A computed or renaming projection may be what creates the sort keys, so sort after it as before
+    sort_after_projection = bool(sort) and bool(projection) and not _keeps_fields(projection, sort_fields)
+    # Nothing after the join changes which documents survive or their order: top-k before joining
+    reshaped = unwind or group or late_filter
+    top_k_first = (lookup_stage and not reshaped and not (sort_fields & derived)
+                   and not sort_after_projection)
+    if top_k_first:
+        pipeline.extend(_sort_and_limit(sort, skip, limit))
+
+    if lookup_stage:
+        pushdown = _pushdown_projection(lookup, unwind, group, late_filter, projection, sort)
+        if pushdown:
+            pipeline.append({'$project': pushdown})
+        pipeline.append(lookup_stage)
+    if unwind:
+        pipeline.append({'$unwind': unwind})
+    if group:
+        pipeline.append({'$group': group})
+    if late_filter:
+        pipeline.append({'$match': late_filter})
+    if not top_k_first and not sort_after_projection:
+        pipeline.extend(_sort_and_limit(sort, skip, limit))
+    if projection:
+        pipeline.append({'$project': projection})
+    if sort_after_projection:
+        pipeline.extend(_sort_and_limit(sort, skip, limit))
+    return pipeline
+
+
+def _pushdown_projection(lookup, unwind, group, late_filter, projection, sort):
+    """Inclusion projection of the base fields the stages after $lookup read, or None if unknown."""
+    needed = {_root(lookup.get('localField') or '')}
+    if unwind:
+        needed.add(_root(_unwind_path(unwind) or ''))
+    if group:
+        if WHOLE_DOCUMENT in _expression_fields(group, needed):
+            return None
+    else:
+        if not projection or not _is_inclusion(projection):
+            return None  # Exclusion or computed projections keep every other field
+        needed |= {_root(key) for key in projection}
+        needed |= {_root(key) for key in (sort or {})}
+    for key, value in late_filter.items():
+        fields = _filter_fields({key: value})
+        if fields is None:
+            return None
+        needed |= fields
+    # The join creates this field; every other one must come from the base collection
+    needed.discard(_root(lookup.get('as') or ''))
+    needed.discard('')
+    if not needed:
+        return None
+    return {field: 1 for field in sorted(needed)}
+
+
+def winning_plan(explain_output):
+    """The first queryPlanner.winningPlan in an aggregate explain, wherever the server nested it."""
+    stack = [explain_output]
+    while stack:
+        item = stack.pop(0)
+        if isinstance(item, dict):
+            planner = item.get('queryPlanner')
+            if isinstance(planner, dict) and 'winningPlan' in planner:
+                return planner['winningPlan']
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return None
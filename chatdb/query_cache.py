@@ -0,0 +1,171 @@
+# query_cache.py
+# LRU cache of /api/execute_query responses. Every entry remembers the version of each
+# table/collection it read; uploads and writes bump those versions so stale results are never served.
+import json
+import re
+import threading
+from collections import OrderedDict
+
+from results import encoded_size
+
+QUERY_CACHE_MAX_ENTRIES = 256
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+QUERY_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024  # Larger results are served but not cached
+
+# Results of these can differ between identical calls
+NONDETERMINISTIC_SQL = re.compile(
+    r'\b(now|sysdate|curdate|curtime|current_date|current_time|current_timestamp|rand|uuid|'
+    r'uuid_short|last_insert_id|connection_id|sleep|get_lock)\b', re.IGNORECASE)
+NONDETERMINISTIC_STAGES = ('$sample', '$out', '$merge', '$$NOW', '$$CLUSTER_TIME', '$rand')
+
+_FROM_CLAUSE = re.compile(
+    r'\bfrom\s+(.+?)(?=\bwhere\b|\bgroup\b|\border\b|\blimit\b|\bhaving\b|\bjoin\b|\binner\b|\bleft\b|'
+    r'\bright\b|\bselect\b|\bcross\b|\bnatural\b|\bstraight_join\b|\bunion\b|\bwindow\b|\bfor\b|\)|;|$)',
+    re.IGNORECASE | re.DOTALL)
+_JOIN_TABLE = re.compile(r'\bjoin\s+([`\w.]+)', re.IGNORECASE)
+_QUOTED_OR_SPACE = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")|\s+")
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (db_type, versions, value, size)
+_versions = {}  # (db_type, name) -> int
+_epochs = {'mysql': 0, 'mongodb': 0}  # Bumped when a write may have touched any table
+_stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'uncacheable': 0, 'too_large': 0}
+_size = 0
+
+
+def normalize_sql(sql_query):
+    """Collapse whitespace outside string literals and drop a trailing semicolon."""
+    def collapse(match):
+        return match.group(1) if match.group(1) else " "
+    return _QUOTED_OR_SPACE.sub(collapse, sql_query).strip().rstrip(';').strip()
+
+
+def _table_name(token):
+    token = token.strip().strip('`')
+    return token.rsplit('.', 1)[-1].strip('`').lower()
+
+
+def sql_tables(sql_query):
+    """Tables a SELECT reads, or None if the statement shouldn't be cached."""
+    stripped = sql_query.lstrip().lstrip('(').lower()
+    if not stripped.startswith(('select', 'with')) or NONDETERMINISTIC_SQL.search(sql_query):
+        return None
+    tables = set()
+    for clause in _FROM_CLAUSE.findall(sql_query):
+        for item in clause.split(','):
+            words = item.split()
+            if words and not words[0].startswith('('):
+                tables.add(_table_name(words[0]))
+    tables.update(_table_name(table) for table in _JOIN_TABLE.findall(sql_query))
+    return tables or None
+
+
+def pipeline_collections(collection_name, pipeline):
+    """Collections an aggregation reads, or None if it shouldn't be cached."""
+    text = json.dumps(pipeline, default=str)
+    if any(marker in text for marker in NONDETERMINISTIC_STAGES):
+        return None
+    collections = {collection_name.lower()}
+    stack = list(pipeline)
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            for key, value in item.items():
+                if key in ('$lookup', '$graphLookup') and isinstance(value, dict) and value.get('from'):
+                    collections.add(str(value['from']).lower())
+                elif key == '$unionWith':
+                    coll = value.get('coll') if isinstance(value, dict) else value
+                    if coll:
+                        collections.add(str(coll).lower())
+                stack.append(value)
+        elif isinstance(item, list):
+            stack.extend(item)
+    return collections
+
+
+def make_key(db_type, query_text, extra=None):
+    return json.dumps([db_type, query_text, extra], separators=(',', ':'), default=str)
+
+
+def snapshot(db_type, names):
+    """Current versions for names; pass the result to put() after running the query."""
+    with _lock:
+        return _epochs[db_type], {name: _versions.get((db_type, name), 0) for name in names}
+
+
+def _is_current(db_type, versions):
+    epoch, table_versions = versions
+    if epoch != _epochs[db_type]:
+        return False
+    return all(_versions.get((db_type, name), 0) == version for name, version in table_versions.items())
+
+
+def _remove(key):
+    global _size
+    _, _, _, size = _entries.pop(key)
+    _size -= size
+
+
+def get(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            _stats['misses'] += 1
+            return None
+        db_type, versions, value, _ = entry
+        if not _is_current(db_type, versions):
+            _remove(key)
+            _stats['stale'] += 1
+            _stats['misses'] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats['hits'] += 1
+        return value
+
+
+def put(key, db_type, versions, value):
+    global _size
+    size = encoded_size(value)
+    with _lock:
+        if size > QUERY_CACHE_MAX_ENTRY_BYTES:
+            _stats['too_large'] += 1
+            return
+        # A write that landed while the query ran makes its result stale already
+        if not _is_current(db_type, versions):
+            return
+        if key in _entries:
+            _remove(key)
+        _entries[key] = (db_type, versions, value, size)
+        _size += size
+        while len(_entries) > QUERY_CACHE_MAX_ENTRIES or _size > QUERY_CACHE_MAX_BYTES:
+            _remove(next(iter(_entries)))
+            _stats['evictions'] += 1
+
+
+def record_uncacheable():
+    with _lock:
+        _stats['uncacheable'] += 1
+
+
+def bump(db_type, name=None):
+    """Invalidate cached results that read name, or every result for db_type when name is None."""
+    with _lock:
+        if name is None:
+            _epochs[db_type] += 1
+        else:
+            key = (db_type, name.lower())
+            _versions[key] = _versions.get(key, 0) + 1
+
+
+def cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats.update({
+            'entries': len(_entries),
+            'bytes': _size,
+            'max_entries': QUERY_CACHE_MAX_ENTRIES,
+            'max_bytes': QUERY_CACHE_MAX_BYTES
+        })
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
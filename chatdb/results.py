@@ -0,0 +1,472 @@
+# results.py
+# Bounded result delivery for /api/execute_query: row/byte caps, cursor-token
+# pagination, streamed (NDJSON / server-sent events) responses and the negotiated
+# encodings of a complete result (row-major or columnar JSON, BSON, Arrow IPC).
+import base64
+import hashlib
+import json
+import re
+from datetime import date, datetime, time as datetime_time, timedelta
+from decimal import Decimal, InvalidOperation
+
+import mysql.connector
+from bson import ObjectId, encode as bson_encode
+from bson.codec_options import CodecOptions, TypeRegistry
+from bson.decimal128 import Decimal128
+from bson.errors import InvalidId
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # Optional: the standard json module is used instead
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # Optional: the arrow format is unavailable without it
+    pyarrow = None
+
+from db import get_db_connection
+
+MAX_RESULT_ROWS = 100000  # Hard cap on rows returned by one request, streamed or not
+MAX_RESULT_BYTES = 50 * 1024 * 1024  # Hard cap on encoded result size
+FETCH_SIZE = 1000  # Rows pulled from the server cursor at a time
+SIZE_SAMPLE_ROWS = 32  # Rows of a fetched batch encoded to estimate its size against MAX_RESULT_BYTES
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+STREAM_FORMATS = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+# Encodings of a complete result, chosen with the request's "format" field or its Accept header
+RESPONSE_FORMATS = {
+    'rows': 'application/json',  # {"headers": [...], "result": [[row], ...]}
+    'columns': 'application/json',  # {"headers": [...], "columns": [[column], ...]}
+    'bson': 'application/bson',  # Header document, then column batches (see encode_bson)
+    'arrow': 'application/vnd.apache.arrow.stream',  # Arrow IPC stream; needs pyarrow
+}
+DEFAULT_RESPONSE_FORMAT = 'rows'
+ACCEPT_FORMATS = {'application/json': 'rows', 'application/bson': 'bson',
+                  'application/vnd.apache.arrow.stream': 'arrow'}  # JSON first, so */* gets rows
+BSON_BATCH_ROWS = 10000  # Rows per BSON column batch, keeping each document well under 16 MB
+
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+def format_row(row):
+    return [str(item) if isinstance(item, timedelta) else item for item in row]
+
+
+def encoded_size(rows):
+    return len(json.dumps(rows, default=str))
+
+
+def estimated_size(rows):
+    """Approximate encoded_size(rows), from encoding an evenly spaced sample of SIZE_SAMPLE_ROWS of them.
+
+    The result is encoded for real once, in the response; the caps only need its rough size.
+    """
+    if len(rows) <= SIZE_SAMPLE_ROWS:
+        return encoded_size(rows)
+    step = len(rows) / SIZE_SAMPLE_ROWS
+    sample = [rows[int(i * step)] for i in range(SIZE_SAMPLE_ROWS)]
+    return encoded_size(sample) * len(rows) // SIZE_SAMPLE_ROWS
+
+
+def fetch_capped(cursor):
+    """fetchmany() until the result ends or a cap is hit. Returns (rows, truncated)."""
+    rows = []
+    size = 0
+    while True:
+        batch = cursor.fetchmany(FETCH_SIZE)
+        if not batch:
+            return rows, False
+        batch = [format_row(row) for row in batch]
+        size += estimated_size(batch)
+        rows.extend(batch)
+        if len(rows) >= MAX_RESULT_ROWS or size >= MAX_RESULT_BYTES:
+            return rows[:MAX_RESULT_ROWS], True
+
+
+def iterate_capped(iterable):
+    """Collect documents from a cursor until it ends or a cap is hit. Returns (documents, truncated)."""
+    documents = []
+    size = 0
+    for document in iterable:
+        documents.append(document)
+        if len(documents) % FETCH_SIZE == 0:
+            size += estimated_size(documents[-FETCH_SIZE:])
+            if size >= MAX_RESULT_BYTES:
+                return documents, True
+        if len(documents) >= MAX_RESULT_ROWS:
+            return documents, True
+    return documents, False
+
+
+def abandon_mysql_result(conn):
+    """Stop a partially read unbuffered result so the connection can go back to the pool."""
+    try:
+        killer = get_db_connection()
+        try:
+            cursor = killer.cursor()
+            cursor.execute(f"KILL QUERY {int(conn.connection_id)}")
+            cursor.close()
+        finally:
+            killer.close()
+    except mysql.connector.Error:
+        pass
+    try:
+        conn.consume_results()
+    except mysql.connector.Error:
+        pass
+
+
+# Pagination
+
+def _query_fingerprint(query_text):
+    normalized = " ".join(query_text.split())
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def _tag_cursor_value(value):
+    # Key values the drivers return that JSON lacks, tagged so decode_cursor restores the native type
+    if isinstance(value, ObjectId):
+        return {'$oid': str(value)}
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    if isinstance(value, Decimal):
+        return {'$dec': str(value)}
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, datetime_time):
+        return {'$time': value.isoformat()}
+    if isinstance(value, timedelta):
+        return {'$td': [value.days, value.seconds, value.microseconds]}
+    if isinstance(value, (bytes, bytearray)):
+        return {'$bin': base64.b64encode(value).decode()}
+    raise TypeError(f"Cannot page on a key of type {type(value).__name__}")
+
+
+CURSOR_TAGS = {
+    '$oid': ObjectId,
+    '$dec': Decimal,
+    '$datetime': datetime.fromisoformat,
+    '$date': date.fromisoformat,
+    '$time': datetime_time.fromisoformat,
+    '$td': lambda parts: timedelta(*parts),
+    '$bin': base64.b64decode,
+}
+
+
+def _untag_cursor_value(obj):
+    if len(obj) == 1:
+        tag, value = next(iter(obj.items()))
+        if tag in CURSOR_TAGS:
+            return CURSOR_TAGS[tag](value)
+    return obj
+
+
+def encode_cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state, default=_tag_cursor_value).encode()).decode()
+
+
+def decode_cursor(token, query_text):
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode()).decode(), object_hook=_untag_cursor_value)
+    except (ValueError, TypeError, InvalidId, InvalidOperation):
+        raise ValueError("Invalid cursor token")
+    if not isinstance(state, dict):
+        raise ValueError("Invalid cursor token")
+    if state.get('q') != _query_fingerprint(query_text):
+        raise ValueError("Cursor token was issued for a different query")
+    return state
+
+
+def page_state(query_text, page_size=None, token=None, order_key=None):
+    """Starting state for a page: the decoded token, or the first page for order_key/offset paging."""
+    if token:
+        state = decode_cursor(token, query_text)
+    else:
+        if order_key is not None and not IDENTIFIER.fullmatch(order_key):
+            raise ValueError(f"Invalid order_key: {order_key}")
+        state = {'q': _query_fingerprint(query_text), 'k': order_key, 'o': 0, 'l': None}
+    state['n'] = max(1, min(int(page_size or state.get('n') or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    return state
+
+
+def paginate_sql(sql_query, state):
+    """Wrap a SELECT so it returns one page. Keyset paging when an order key is set, offset paging otherwise.
+
+    A keyset page fetches one row more than the page size, for keyset_page() to trim it by.
+    """
+    inner = sql_query.strip().rstrip(';')
+    key = state['k']
+    if key:
+        where = f" WHERE `{key}` > %s" if state['l'] is not None else ""
+        params = (state['l'],) if state['l'] is not None else ()
+        return f"SELECT * FROM ({inner}) AS page{where} ORDER BY `{key}` LIMIT {state['n'] + 1}", params
+    return f"SELECT * FROM ({inner}) AS page LIMIT {state['n']} OFFSET {state['o']}", ()
+
+
+def paginate_pipeline(pipeline, state):
+    key = state['k']
+    if key:
+        stages = [{'$match': {key: {'$gt': state['l']}}}] if state['l'] is not None else []
+        return pipeline + stages + [{'$sort': {key: 1}}, {'$limit': state['n'] + 1}]
+    return pipeline + [{'$skip': state['o']}, {'$limit': state['n']}]
+
+
+def _cursor_after(state, count, last_key_value):
+    following = dict(state)
+    following['o'] = state['o'] + count
+    following['l'] = last_key_value
+    return encode_cursor(following)
+
+
+def next_cursor(state, rows, last_key_value=None):
+    """Token for the page after rows, or None when this was the last page."""
+    if len(rows) < state['n']:
+        return None
+    return _cursor_after(state, len(rows), last_key_value)
+
+
+def keyset_page(state, rows, key_of):
+    """(rows of the page, token for the next one or None) for rows fetched by a keyset page query.
+
+    The next page starts after the last key value, so a page must not end partway through a
+    run of rows sharing one value: the run is left for the next page and this one comes out
+    short. Raises ValueError when a single value (or NULL, which can't be paged past) fills the
+    whole page.
+    """
+    if len(rows) <= state['n']:
+        return rows, None
+    following = key_of(rows[state['n']])
+    end = state['n']
+    while end and key_of(rows[end - 1]) == following:
+        end -= 1
+    if not end or key_of(rows[end - 1]) is None:
+        raise ValueError(f"Cannot page on order_key '{state['k']}': one of its values fills a whole page of "
+                         f"{state['n']} rows. Use a larger page_size or a key with more distinct values.")
+    return rows[:end], _cursor_after(state, end, key_of(rows[end - 1]))
+
+
+# Streaming
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(payload):
+    return json.dumps(payload, default=_json_default)
+
+
+def _ndjson_line(payload):
+    return _dumps(payload) + "\n"
+
+
+def _sse_event(payload, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {_dumps(payload)}\n\n"
+
+
+def _encoder(stream_format):
+    if stream_format == 'sse':
+        return _sse_event
+    return lambda payload, event=None: _ndjson_line({event: payload} if event else payload)
+
+
+def stream_mysql_rows(conn, cursor, stream_format, on_close=None):
+    """Yield the open cursor's result as NDJSON/SSE, closing the connection when done.
+
+    Emits a headers record, one array per row and a final end record with the row
+    count and whether a cap cut the result short.
+    """
+    encode = _encoder(stream_format)
+    count = 0
+    size = 0
+    truncated = False
+    try:
+        headers = [desc[0] for desc in cursor.description] if cursor.description else []
+        yield encode(headers, 'headers')
+        while headers:
+            batch = cursor.fetchmany(FETCH_SIZE)
+            if not batch:
+                break
+            chunk = []
+            for row in batch:
+                line = encode(format_row(row))
+                count += 1
+                size += len(line)
+                chunk.append(line)
+                if count >= MAX_RESULT_ROWS or size >= MAX_RESULT_BYTES:
+                    truncated = True
+                    break
+            yield "".join(chunk)
+            if truncated:
+                abandon_mysql_result(conn)
+                break
+        conn.commit()
+        yield encode({'rows': count, 'truncated': truncated}, 'end')
+    finally:
+        cursor.close()
+        conn.close()
+        if on_close:
+            on_close()
+
+
+def stream_documents(documents, stream_format):
+    """Yield documents from a Mongo cursor as NDJSON/SSE, one JSON object each, then an end record."""
+    encode = _encoder(stream_format)
+    count = 0
+    size = 0
+    truncated = False
+    chunk = []
+    try:
+        for document in documents:
+            line = encode(document)
+            count += 1
+            size += len(line)
+            chunk.append(line)
+            if count >= MAX_RESULT_ROWS or size >= MAX_RESULT_BYTES:
+                truncated = True
+                break
+            if len(chunk) == FETCH_SIZE:
+                yield "".join(chunk)
+                chunk = []
+        yield "".join(chunk)
+        yield encode({'rows': count, 'truncated': truncated}, 'end')
+    finally:
+        close = getattr(documents, 'close', None)
+        if close:
+            close()
+
+
+# Response formats
+
+def documents_to_rows(documents):
+    """Align documents to one union schema: (headers in first-seen order, rows with None for missing keys)."""
+    headers = {}
+    for document in documents:
+        for key in document:
+            headers.setdefault(key, None)
+    headers = list(headers)
+    if all(len(document) == len(headers) and list(document) == headers for document in documents):
+        return headers, [list(document.values()) for document in documents]
+    return headers, [[document.get(key) for key in headers] for document in documents]
+
+
+def negotiate_format(requested, accept_mimetypes):
+    """The response format named by the request, else the best match for its Accept header."""
+    if requested:
+        return requested
+    best = accept_mimetypes.best_match(list(ACCEPT_FORMATS))
+    return ACCEPT_FORMATS.get(best, DEFAULT_RESPONSE_FORMAT)
+
+
+def format_unavailable(result_format):
+    """Why result_format can't be produced, or None if it can."""
+    if result_format not in RESPONSE_FORMATS:
+        return f"Unsupported format: {result_format}; expected one of {sorted(RESPONSE_FORMATS)}"
+    if result_format == 'arrow' and pyarrow is None:
+        return "The arrow format requires pyarrow, which is not installed"
+    return None
+
+
+def _columns(payload):
+    rows = payload['result']
+    if not rows:
+        return [[] for _ in payload['headers']]
+    return [list(column) for column in zip(*rows)]
+
+
+def _json_fallback(value):
+    # Same output as Flask's jsonify for the types it knows, plus Mongo's
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, datetime_time):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+                  if orjson else 0)
+
+
+def dumps_json(payload):
+    """Encode payload as JSON bytes, with orjson when it is installed."""
+    if orjson:
+        try:
+            return orjson.dumps(payload, default=_json_fallback, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            pass  # e.g. integers beyond 64 bits, which the json module handles
+    return json.dumps(payload, default=_json_fallback, sort_keys=True, separators=(',', ':')).encode()
+
+
+def _bson_fallback(value):
+    if isinstance(value, Decimal):
+        try:
+            return Decimal128(value)
+        except (InvalidOperation, ValueError):
+            return str(value)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+BSON_OPTIONS = CodecOptions(type_registry=TypeRegistry(fallback_encoder=_bson_fallback))
+
+
+def encode_bson(payload):
+    """A header document (headers, truncated, next_cursor, rows) followed by {"columns": [...]} batches.
+
+    Concatenated BSON documents, as mongodump writes them; bson.decode_all() reads the whole body.
+    """
+    meta = {key: value for key, value in payload.items() if key != 'result'}
+    meta['rows'] = len(payload['result'])
+    parts = [bson_encode(meta, codec_options=BSON_OPTIONS)]
+    rows = payload['result']
+    for start in range(0, len(rows), BSON_BATCH_ROWS):
+        batch = rows[start:start + BSON_BATCH_ROWS]
+        parts.append(bson_encode({'columns': [list(column) for column in zip(*batch)]}, codec_options=BSON_OPTIONS))
+    return b"".join(parts)
+
+
+def _arrow_array(values):
+    try:
+        return pyarrow.array(values)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, OverflowError):
+        # Mixed or unsupported types (ObjectId, nested documents with varying keys): send text
+        return pyarrow.array([None if value is None else str(value) for value in values], type=pyarrow.string())
+
+
+def encode_arrow(payload):
+    """Arrow IPC stream of the result; truncated/next_cursor travel as schema metadata."""
+    table = pyarrow.Table.from_arrays([_arrow_array(column) for column in _columns(payload)],
+                                      names=[str(header) for header in payload['headers']])
+    metadata = {key: json.dumps(value) for key, value in payload.items() if key not in ('headers', 'result')}
+    table = table.replace_schema_metadata(metadata or None)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_response(payload, result_format=DEFAULT_RESPONSE_FORMAT):
+    """Encode an execute_query payload ({'headers', 'result', ...}) in result_format. Returns (body, mimetype)."""
+    if result_format == 'columns':
+        columnar = {key: value for key, value in payload.items() if key != 'result'}
+        columnar['columns'] = _columns(payload)
+        body = dumps_json(columnar)
+    elif result_format == 'bson':
+        body = encode_bson(payload)
+    elif result_format == 'arrow':
+        body = encode_arrow(payload)
+    else:
+        body = dumps_json(payload)
+    return body, RESPONSE_FORMATS[result_format]
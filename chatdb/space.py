@@ -1,5 +1,10 @@
+import logging
+import re
+
 from state import get_last_uploaded_table
 
+logger = logging.getLogger(__name__)
+
 # Enhanced SQL keywords dictionary
 sql_keywords = {
     'get': 'SELECT', 'show': 'SELECT', 'display': 'SELECT', 'find': 'SELECT', 'list': 'SELECT',
@@ -47,78 +52,128 @@ ignore_words = {
 
 
 
-def tokenize_input(input_text):
-    """Enhanced tokenizer to process natural language SQL input."""
-    import re
+# Splits input into words while keeping quoted phrases intact
+WORD_PATTERN = re.compile(r'"[^"]*"|\'[^\']*\'|\S+')
+OPERATORS = {'>': '>', '<': '<', '=': '=', '>=': '>=', '<=': '<=', '!=': '!='}
+
+
+class Token(str):
+    """A token's text plus its kind and SQL meaning; compares and hashes like the plain string.
+
+    kind is one of 'keyword', 'aggregate', 'comparison', 'direction', 'number', 'literal' or 'word'.
+    Plain words use the class defaults so creating one costs no more than creating a str.
+    """
+    kind = 'word'
+    sql = None
+
+
+class NumberToken(Token):
+    kind = 'number'
+
+
+class LiteralToken(Token):
+    kind = 'literal'
+
+
+def make_token(text, kind, sql):
+    token = Token(text)
+    token.kind = kind
+    token.sql = sql
+    return token
 
-    # Split input into words and keep quoted phrases intact
-    words = re.findall(r'"[^"]*"|\'[^\']*\'|\S+', input_text.lower())
+
+def build_phrase_trie():
+    """Compile the keyword, aggregation and comparison phrases into a word-level trie.
+
+    Each node maps the next word to a child node; the None key holds the prebuilt Token
+    for a phrase that ends there. A phrase listed in several dictionaries keeps its first kind.
+    """
+    trie = {}
+
+    def add(phrase, kind, sql):
+        node = trie
+        for word in phrase.split():
+            node = node.setdefault(word, {})
+        node.setdefault(None, make_token(phrase, kind, sql))
+
+    for phrase, sql in sql_keywords.items():
+        add(phrase, 'keyword', sql)
+    add('sorted by', 'keyword', 'ORDER BY')
+    for phrase, sql in aggregation_words.items():
+        add(phrase, 'aggregate', sql)
+    for phrase, sql in comparison_words.items():
+        add(phrase, 'comparison', sql)
+    for operator, sql in OPERATORS.items():
+        add(operator, 'comparison', sql)
+    return trie
+
+
+PHRASE_TRIE = build_phrase_trie()
+HAVING_COUNT_TOKENS = [make_token("having", 'keyword', 'HAVING'), make_token("count", 'aggregate', 'COUNT'),
+                       make_token(">", 'comparison', '>')]
+DESC_TOKEN = make_token("desc", 'direction', 'DESC')
+LIMIT_TOKEN = make_token("limit", 'keyword', 'LIMIT')
+
+
+def match_phrase(words, i):
+    """Longest phrase in PHRASE_TRIE starting at words[i], as (end_index, token), or None."""
+    node = PHRASE_TRIE
+    match = None
+    j = i
+    while j < len(words) and words[j] in node:
+        node = node[words[j]]
+        j += 1
+        if None in node:
+            match = (j, node[None])
+    return match
+
+
+def tokenize_input(input_text):
+    """Tokenize natural language SQL input into typed Tokens in a single pass."""
+    words = WORD_PATTERN.findall(input_text.lower())
     tokens = []
     i = 0
 
     while i < len(words):
         word = words[i]
 
-        # Handle multi-word comparisons
-        if i + 1 < len(words) and f"{word} {words[i + 1]}" in comparison_words:
-            tokens.append(f"{word} {words[i + 1]}")  # Combine into one token
-            i += 2
-            continue
-        elif word in ['>', '<', '=', '>=', '<=', '!=']:  # Add direct operator handling
-            tokens.append(word)
-            i += 1
-            continue
-
-        if word == "having" and i + 3 < len(words):
-            if words[i + 1] == "more" and words[i + 2] == "than":
-                tokens.extend(["HAVING", "COUNT", ">"])
-                # Convert "one" to "1" if necessary
-                next_token = "1" if words[i + 3] == "one" else words[i + 3]
-                tokens.append(next_token)
-                i += 4
-                continue
-
         # Remove quotes from quoted phrases and treat them as single tokens
-        if word.startswith('"') or word.startswith("'"):
-            tokens.append(word.strip('"').strip("'"))
+        if word[0] in '"\'':
+            tokens.append(LiteralToken(word.strip('"').strip("'")))
             i += 1
             continue
 
-        if i + 1 < len(words) and (
-            (word == "group" and words[i + 1] == "by") or
-            (word == "grouped" and words[i + 1] == "by")
-        ):
-            tokens.append("GROUP BY")
-            i += 2
+        if word == "having" and i + 3 < len(words) and words[i + 1] == "more" and words[i + 2] == "than":
+            # Convert "one" to "1" if necessary
+            count_value = "1" if words[i + 3] == "one" else words[i + 3]
+            tokens.extend(HAVING_COUNT_TOKENS)
+            tokens.append(NumberToken(count_value))
+            i += 4
             continue
 
-
-        # Handle "order by" as a single token
-        if i + 1 < len(words) and word in ["sorted", "sort", "order"] and words[i + 1] == "by":
-            tokens.append("ORDER BY")
-            i += 2
-            continue
+        # Longest keyword/aggregation/comparison phrase, e.g. "greater than or equal to"
+        if word in PHRASE_TRIE:
+            match = match_phrase(words, i)
+            if match:
+                i, token = match
+                tokens.append(token)
+                continue
 
         # Handle "descending order" or "in DESC order" as DESC
-        if word in ["descending", "desc"]:
-            if i + 1 < len(words) and words[i + 1] in ["order", "in"]:
-                tokens.append("DESC")
-                i += 2
-            else:
-                tokens.append("DESC")
-                i += 1
+        if word in ("descending", "desc"):
+            tokens.append(DESC_TOKEN)
+            i += 2 if i + 1 < len(words) and words[i + 1] in ("order", "in") else 1
             continue
 
-        if word in ['first', 'top'] and i + 1 < len(words) and words[i + 1].isdigit():
-            tokens.append('LIMIT')  # Add LIMIT token
-            tokens.append(words[i + 1])  # Add the number as a separate token
-            i += 2  # Skip both "first" and the number
+        if word in ("first", "top") and i + 1 < len(words) and words[i + 1].isdigit():
+            tokens.append(LIMIT_TOKEN)
+            tokens.append(NumberToken(words[i + 1]))
+            i += 2
             continue
 
         # Combine unquoted multi-word names (e.g., "Dr. Smith")
         if i + 1 < len(words) and words[i + 1][0].isalpha() and word.endswith("."):
-            # Combine the current word with the next word
-            tokens.append(f"{word} {words[i + 1]}")
+            tokens.append(Token(f"{word} {words[i + 1]}"))
             i += 2
             continue
 
@@ -127,33 +182,25 @@ def tokenize_input(input_text):
             i += 1
             continue
 
-        if i + 1 < len(words) and f"{words[i]} {words[i + 1]}" == "more than":
-            tokens.append("HAVING")
-            tokens.append("COUNT")  # Default to COUNT for simplicity; expand logic if needed
-            i += 2
-            continue
-
-        # Handle column names with underscores
-        if "_" in word:
-            tokens.append(word)
-        else:
-            tokens.append(word)
-
-        i += 1  # Move to the next word
-        
+        tokens.append(NumberToken(word) if word.isdigit() else Token(word))
+        i += 1
 
-    print(f"Tokenized input: {tokens}")  # Debug log for final tokens
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Tokenized input: %s", tokens)
     return tokens
 
 
 
-def natural_language_to_sql(input_text):
-    """Convert natural language to SQL query."""
+def natural_language_to_sql(input_text, table_name=None):
+    """Convert natural language to SQL query against table_name (default: the session's last upload)."""
     tokens = tokenize_input(input_text)
+    # Checked once per call so disabled debug logging costs nothing per token
+    debug = logger.isEnabledFor(logging.DEBUG)
     
     # Initialize query components
     select_columns = []
-    table_name = get_last_uploaded_table()  # Placeholder function for table name
+    if table_name is None:
+        table_name = get_last_uploaded_table()
     where_conditions = []
     having_conditions = []
     order_by = []
@@ -181,13 +228,15 @@ def natural_language_to_sql(input_text):
 
     i = 0
     while i < len(tokens):
-        token = tokens[i].lower() if isinstance(tokens[i], str) else tokens[i]
+        token = tokens[i]
         
-        print(f"Processing Token: {token}")  # Debug: Current token
+        if debug:
+            logger.debug("Processing Token: %s", token)
         # Handle SQL keywords and clause transitions
-        if token in sql_keywords:
-            sql_keyword = sql_keywords[token]
-            print(f"Switching to Clause: {sql_keyword}")  # Correctly log the new clause
+        if token.kind == 'keyword':
+            sql_keyword = token.sql
+            if debug:
+                logger.debug("Switching to Clause: %s", sql_keyword)
             if sql_keyword in ['JOIN', 'INNER JOIN', 'LEFT JOIN', 'RIGHT JOIN']:
                 current_clause = 'JOIN'
                 current_join_type = sql_keyword
@@ -208,9 +257,10 @@ def natural_language_to_sql(input_text):
         
         # Handle different clauses
         if current_clause == 'SELECT':
-            print(f"Adding SELECT column: {token}")
-            if token in aggregation_words:
-                agg_function = aggregation_words[token]
+            if debug:
+                logger.debug("Adding SELECT column: %s", token)
+            if token.kind == 'aggregate':
+                agg_function = token.sql
                 if i + 1 < len(tokens):
                     agg_column = tokens[i + 1]
                     col_expr = f"{agg_function}({agg_column})"
@@ -222,7 +272,7 @@ def natural_language_to_sql(input_text):
                     continue
 
         
-            elif token not in sql_keywords and token != "select":
+            elif token != "select":
                 # Handle table.column notation
                 if '.' in token:
                     select_columns.append(token)
@@ -230,19 +280,18 @@ def natural_language_to_sql(input_text):
                     select_columns.append(token)
         
         elif current_clause == 'JOIN':
-            if token not in sql_keywords:
-                current_join_table = token
-                joins.append({
-                    'type': current_join_type or 'JOIN',
-                    'table': token,
-                    'condition': None
-                })
+            current_join_table = token
+            joins.append({
+                'type': current_join_type or 'JOIN',
+                'table': token,
+                'condition': None
+            })
         
         elif current_clause == 'ON':
             if not current_join_condition:
                 current_join_condition = token
-            elif token in comparison_words:
-                comparison = comparison_words[token]
+            elif token.kind == 'comparison':
+                comparison = token.sql
                 if i + 1 < len(tokens):
                     joins[-1]['condition'] = f"{current_join_condition} {comparison} {tokens[i+1]}"
                     i += 2
@@ -250,18 +299,20 @@ def natural_language_to_sql(input_text):
                     continue
         
         elif current_clause == 'GROUP BY':
-            if token not in sql_keywords and token not in ['group', 'by']:
+            if token not in ('group', 'by'):
                 group_by.append(token)
                 
         elif current_clause == 'LIMIT':
             try:
                 if token.isdigit():
                     limit = int(token)
-                    print(f"Setting LIMIT to: {limit}")  # Debug statement
+                    if debug:
+                        logger.debug("Setting LIMIT to: %s", limit)
                 else:
                     # Reset to SELECT and process the token as a column
                     current_clause = 'SELECT'
-                    print(f"Skipping invalid LIMIT value: {token}. Switching back to SELECT.")
+                    if debug:
+                        logger.debug("Skipping invalid LIMIT value: %s. Switching back to SELECT.", token)
                     select_columns.append(token)  # Treat as a column in SELECT
                 i += 1
             except ValueError:
@@ -298,27 +349,21 @@ def natural_language_to_sql(input_text):
         
 
         elif current_clause == 'WHERE':
-            if token not in sql_keywords:
-                column = token
-                if i + 1 < len(tokens):
-                    # Handle both natural language and direct operators
-                    comparison = None
-                    value_index = i + 2
-                    
-                    if tokens[i + 1] in comparison_words:
-                        comparison = comparison_words[tokens[i + 1]]
-                    elif tokens[i + 1] in ['>', '<', '=', '>=', '<=', '!=']:
-                        comparison = tokens[i + 1]
-                    
-                    if comparison:
-                        value = tokens[value_index]
-                        # Only quote non-numeric values
-                        if not value.isdigit():
-                            value = f"'{value}'"
-                        
-                        where_conditions.append(f"{column} {comparison} {value}")
-                        i += 3  # Skip past column, comparison, and value
-                        continue
+            column = token
+            if i + 1 < len(tokens):
+                # Natural language comparisons and direct operators are both 'comparison' tokens
+                comparison = tokens[i + 1].sql if tokens[i + 1].kind == 'comparison' else None
+                value_index = i + 2
+
+                if comparison:
+                    value = tokens[value_index]
+                    # Only quote non-numeric values
+                    if not value.isdigit():
+                        value = f"'{value}'"
+
+                    where_conditions.append(f"{column} {comparison} {value}")
+                    i += 3  # Skip past column, comparison, and value
+                    continue
         i += 1
 
     # if having_conditions:
@@ -377,11 +422,13 @@ def natural_language_to_sql(input_text):
     if limit is not None:
         query_parts.append(f"LIMIT {limit}")
 
-    print(f" SQL Query: {query_parts}")
+    if debug:
+        logger.debug("SQL Query parts: %s", query_parts)
     query_parts = [part.strip(",") for part in query_parts if part.strip(",")]
 
 
     # Join all parts into the final SQL query
     sql_query = " ".join(query_parts).replace(",,", ",")
-    print(f"Final SQL Query: {sql_query}")
+    if debug:
+        logger.debug("Final SQL Query: %s", sql_query)
     return sql_query
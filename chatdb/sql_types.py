@@ -0,0 +1,337 @@
+# sql_types.py
+# Right-sized MySQL column types for CSV uploads: the smallest integer type that fits,
+# DECIMAL for fixed-point numbers, DATE/DATETIME/TIME for date-like text, ENUM for
+# low-cardinality strings and sized CHAR/VARCHAR for the rest. widen_sql_type() merges
+# the type a sample chose with the type a later chunk needs, so streamed loads stay correct.
+import math
+import re
+import unicodedata
+
+import pandas as pd
+
+# Smallest first: (type, min, max, decimal digits)
+INTEGER_TYPES = [
+    ('TINYINT', -2 ** 7, 2 ** 7 - 1, 3),
+    ('SMALLINT', -2 ** 15, 2 ** 15 - 1, 5),
+    ('MEDIUMINT', -2 ** 23, 2 ** 23 - 1, 7),
+    ('INT', -2 ** 31, 2 ** 31 - 1, 10),
+    ('BIGINT', -2 ** 63, 2 ** 63 - 1, 19),
+]
+INTEGER_RANK = {name: rank for rank, (name, _, _, _) in enumerate(INTEGER_TYPES)}
+INTEGER_DIGITS = {name: digits for name, _, _, digits in INTEGER_TYPES}
+INTEGER_BYTES = {'TINYINT': 1, 'SMALLINT': 2, 'MEDIUMINT': 3, 'INT': 4, 'BIGINT': 8}
+
+DECIMAL_MAX_SCALE = 6  # Floats needing more fractional digits than this are stored as DOUBLE
+DECIMAL_MAX_PRECISION = 30
+ENUM_MAX_VALUES = 32  # Strings with at most this many distinct values can become an ENUM...
+ENUM_MAX_RATIO = 0.05  # ...if that is at most this fraction of the non-null values
+ENUM_MIN_ROWS = 200  # Too few rows to tell whether a column is low-cardinality
+CHAR_MAX_LENGTH = 16  # Fixed-length strings up to this length are stored as CHAR
+VARCHAR_SIZES = (16, 32, 64, 128, 255)  # Declared VARCHAR lengths; longer strings become TEXT
+ROW_WIDTH_SAMPLE_ROWS = 10000  # Rows used to average string lengths for the row width estimate
+
+# strptime formats for date-like text and the shape a value must have to be tried against each
+TEMPORAL_FORMATS = {
+    'DATE': [('%Y-%m-%d', r'\d{4}-\d{1,2}-\d{1,2}'), ('%m/%d/%Y', r'\d{1,2}/\d{1,2}/\d{4}'),
+             ('%Y/%m/%d', r'\d{4}/\d{1,2}/\d{1,2}')],
+    'DATETIME': [('%Y-%m-%d %H:%M:%S', r'\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{2}:\d{2}'),
+                 ('%Y-%m-%dT%H:%M:%S', r'\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{2}:\d{2}'),
+                 ('%Y-%m-%d %H:%M', r'\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{2}'),
+                 ('%m/%d/%Y %H:%M:%S', r'\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{2}:\d{2}'),
+                 ('%m/%d/%Y %H:%M', r'\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{2}')],
+    'TIME': [('%H:%M:%S', r'\d{1,2}:\d{2}:\d{2}'), ('%H:%M', r'\d{1,2}:\d{2}')],
+}
+# Formats MySQL parses itself; text in any other format is rewritten before it is inserted
+NATIVE_FORMATS = {'%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%H:%M:%S', '%H:%M'}
+TEMPORAL_OUTPUT = {'DATE': '%Y-%m-%d', 'DATETIME': '%Y-%m-%d %H:%M:%S', 'TIME': '%H:%M:%S'}
+TEMPORAL_SHAPE = re.compile(r'\d{1,4}[-/:]\d{1,2}')  # How every date-like value starts
+# Width of each non-string type when a column has to fall back to text
+TEXT_WIDTH = {'BOOLEAN': 5, 'DOUBLE': 24, 'DATE': 10, 'DATETIME': 19, 'TIME': 8}
+
+_SIZED = re.compile(r'^(CHAR|VARCHAR)\((\d+)\)$')
+_DECIMAL = re.compile(r'^DECIMAL\((\d+),(\d+)\)$')
+_ENUM_VALUE = re.compile(r"'((?:[^']|'')*)'")
+_DISPLAY_WIDTH = re.compile(r'^(TINYINT|SMALLINT|MEDIUMINT|INT|INTEGER|BIGINT)(?:\(\d+\))?(?: UNSIGNED)?(?: ZEROFILL)?$')
+# Types an existing table may report that these helpers know under another name
+DESCRIBED_ALIASES = {'TINYINT(1)': 'BOOLEAN', 'BOOL': 'BOOLEAN', 'INTEGER': 'INT', 'FLOAT': 'DOUBLE', 'REAL': 'DOUBLE',
+                     'TIMESTAMP': 'DATETIME', 'TINYTEXT': 'TEXT', 'MEDIUMTEXT': 'TEXT', 'LONGTEXT': 'TEXT'}
+
+
+# Type strings
+
+def enum_type(values):
+    # Sorted so ORDER BY on the column (which uses ENUM positions) stays alphabetical
+    return "ENUM(" + ",".join("'" + value.replace("'", "''") + "'" for value in sorted(values)) + ")"
+
+
+def enum_values(sql_type):
+    return [value.replace("''", "'") for value in _ENUM_VALUE.findall(sql_type[5:-1])]
+
+
+def _collation_key(value):
+    """value as MySQL's default case- and accent-insensitive collation compares it."""
+    decomposed = unicodedata.normalize('NFKD', value.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def enum_members_distinct(values):
+    """False if two values are the same ENUM member to MySQL (e.g. 'NY' and 'ny'), which CREATE TABLE rejects."""
+    return len({_collation_key(value) for value in values}) == len(values)
+
+
+def from_described_type(described):
+    """Type string for a column type as DESCRIBE reports it, e.g. "int(11)" -> 'INT'."""
+    if isinstance(described, bytes):
+        described = described.decode()
+    if described.lower().startswith('enum('):
+        return 'ENUM(' + described[5:]  # Keep the members' case
+    sql_type = described.upper().strip()
+    if sql_type in DESCRIBED_ALIASES:
+        return DESCRIBED_ALIASES[sql_type]
+    integer = _DISPLAY_WIDTH.match(sql_type)
+    if integer:
+        return DESCRIBED_ALIASES.get(integer.group(1), integer.group(1))
+    return sql_type.replace(', ', ',')
+
+
+def varchar_type(length):
+    for size in VARCHAR_SIZES:
+        if length <= size:
+            return f"VARCHAR({size})"
+    return 'TEXT'
+
+
+def decimal_type(integer_digits, scale):
+    precision = max(1, integer_digits) + scale
+    return f"DECIMAL({precision},{scale})" if precision <= DECIMAL_MAX_PRECISION else 'DOUBLE'
+
+
+def integer_type(minimum, maximum):
+    for name, low, high, _ in INTEGER_TYPES:
+        if low <= minimum and maximum <= high:
+            return name
+    return decimal_type(len(str(int(max(abs(minimum), abs(maximum))))), 0)
+
+
+def text_width(sql_type):
+    """Longest string needed to hold any value of sql_type as text."""
+    if sql_type in INTEGER_DIGITS:
+        return INTEGER_DIGITS[sql_type] + 1
+    decimal = _DECIMAL.match(sql_type)
+    if decimal:
+        return int(decimal.group(1)) + 2
+    sized = _SIZED.match(sql_type)
+    if sized:
+        return int(sized.group(2))
+    if sql_type.startswith('ENUM('):
+        return max((len(value) for value in enum_values(sql_type)), default=1)
+    if sql_type == 'TEXT':
+        return math.inf
+    return TEXT_WIDTH.get(sql_type, 255)
+
+
+def is_string_type(sql_type):
+    return sql_type == 'TEXT' or sql_type.startswith(('CHAR(', 'VARCHAR(', 'ENUM('))
+
+
+# Inference
+
+def temporal_format(values, sql_type):
+    """The TEMPORAL_FORMATS[sql_type] format that every value is a valid date/time in, or None.
+
+    The shapes don't overlap, so the first value decides which format is checked.
+    """
+    fmt, shape = _format_of(values.iloc[0], sql_type)
+    if fmt and values.str.fullmatch(shape).all() and pd.to_datetime(values, format=fmt, errors='coerce').notna().all():
+        return fmt
+    return None
+
+
+def _format_of(value, sql_type):
+    for fmt, shape in TEMPORAL_FORMATS[sql_type]:
+        if re.fullmatch(shape, value):
+            return fmt, shape
+    return None, None
+
+
+def _temporal_type(values):
+    if not re.match(TEMPORAL_SHAPE, values.iloc[0]) or values.str.len().max() > 19:
+        return None
+    for sql_type in TEMPORAL_FORMATS:
+        if temporal_format(values, sql_type):
+            return sql_type
+    return None
+
+
+def _decimal_scale(values):
+    for scale in range(1, DECIMAL_MAX_SCALE + 1):
+        scaled = values * 10 ** scale
+        if ((scaled - scaled.round()).abs() < 1e-6).all():
+            return scale
+    return None
+
+
+def _string_type(values, strict):
+    temporal = _temporal_type(values)
+    if temporal:
+        return temporal
+    lengths = values.str.len()
+    longest = int(lengths.max())
+    if longest > VARCHAR_SIZES[-1]:
+        return 'TEXT'
+    distinct = values.unique()
+    # MySQL strips trailing spaces from ENUM members and CHAR values, so those keep VARCHAR
+    padded = longest == 0 or values.str.endswith(' ').any()
+    if not padded and len(distinct) <= ENUM_MAX_VALUES and enum_members_distinct(distinct) and (
+            not strict or (len(values) >= ENUM_MIN_ROWS and len(distinct) <= len(values) * ENUM_MAX_RATIO)):
+        return enum_type(distinct)
+    if not padded and longest <= CHAR_MAX_LENGTH and int(lengths.min()) == longest:
+        return f"CHAR({longest})"
+    return varchar_type(longest)
+
+
+def infer_sql_type(series, strict=True):
+    """Smallest SQL type that holds every non-null value of series, or None if there are none.
+
+    strict=False is for checking later chunks against an existing type: it allows an ENUM
+    whenever the values would fit one, and widen_sql_type() decides whether to keep it.
+    """
+    values = series.dropna()
+    if values.empty:
+        return None
+    if pd.api.types.is_bool_dtype(values):
+        return 'BOOLEAN'
+    if pd.api.types.is_integer_dtype(values):
+        return integer_type(int(values.min()), int(values.max()))
+    if pd.api.types.is_float_dtype(values):
+        # Columns with missing values parse as float even when every value is whole
+        if (values % 1 == 0).all():
+            return integer_type(int(values.min()), int(values.max()))
+        scale = _decimal_scale(values)
+        if scale is None:
+            return 'DOUBLE'
+        return decimal_type(len(str(int(values.abs().max()))), scale)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return 'DATETIME'
+    return _string_type(values.astype(str), strict)
+
+
+# Widening
+
+def _numeric_parts(sql_type):
+    """(integer digits, scale) for exact numeric types, or None."""
+    if sql_type == 'BOOLEAN':
+        return 1, 0
+    if sql_type in INTEGER_DIGITS:
+        return INTEGER_DIGITS[sql_type], 0
+    decimal = _DECIMAL.match(sql_type)
+    if decimal:
+        precision, scale = int(decimal.group(1)), int(decimal.group(2))
+        return precision - scale, scale
+    return None
+
+
+def _widen_strings(current, observed):
+    if current == 'TEXT' or observed == 'TEXT':
+        return 'TEXT'
+    if current.startswith('ENUM(') and observed.startswith('ENUM('):
+        values = set(enum_values(current)) | set(enum_values(observed))
+        if len(values) <= ENUM_MAX_VALUES and enum_members_distinct(values):
+            return enum_type(values)
+        return varchar_type(max(len(value) for value in values))
+    current_sized = _SIZED.match(current)
+    if current_sized and current_sized.group(1) == 'CHAR':
+        length = int(current_sized.group(2))
+        lengths = ({len(value) for value in enum_values(observed)} if observed.startswith('ENUM(')
+                   else {text_width(observed)} if observed.startswith('CHAR(') else None)
+        if lengths == {length}:
+            return current
+    return varchar_type(max(text_width(current), text_width(observed)))
+
+
+def widen_sql_type(current, observed):
+    """Narrowest type that holds values of both current and observed."""
+    if observed is None or observed == current:
+        return current
+    if is_string_type(current) or is_string_type(observed):
+        if not is_string_type(current):
+            current = varchar_type(text_width(current))
+        if not is_string_type(observed):
+            observed = varchar_type(text_width(observed))
+        return _widen_strings(current, observed)
+    if {current, observed} == {'DATE', 'DATETIME'}:
+        return 'DATETIME'
+    if 'DOUBLE' in (current, observed):
+        other = observed if current == 'DOUBLE' else current
+        if other == 'DOUBLE' or _numeric_parts(other):
+            return 'DOUBLE'
+    current_parts = _numeric_parts(current)
+    observed_parts = _numeric_parts(observed)
+    if current_parts and observed_parts:
+        if current in INTEGER_RANK and observed in INTEGER_RANK:
+            return max(current, observed, key=INTEGER_RANK.get)
+        if current_parts[1] == 0 and observed_parts[1] == 0 and 'BOOLEAN' in (current, observed):
+            return observed if current == 'BOOLEAN' else current
+        return decimal_type(max(current_parts[0], observed_parts[0]), max(current_parts[1], observed_parts[1]))
+    # Dates, times and numbers mixed in one column: keep the text
+    return varchar_type(max(text_width(current), text_width(observed)))
+
+
+# Conversion and sizing
+
+def convert_for_insert(series, sql_type):
+    """Values MySQL accepts for sql_type: date-like text is rewritten in ISO form.
+
+    The values must already fit sql_type (inference or widening checked them).
+    """
+    if sql_type not in TEMPORAL_FORMATS or not pd.api.types.is_string_dtype(series):
+        return series
+    values = series.dropna()
+    fmt = _format_of(str(values.iloc[0]), sql_type)[0] if not values.empty else None
+    if fmt is None or fmt in NATIVE_FORMATS:
+        return series
+    parsed = pd.to_datetime(series.astype(str).where(series.notna()), format=fmt, errors='coerce')
+    return parsed.dt.strftime(TEMPORAL_OUTPUT[sql_type]).astype(object).where(parsed.notna(), None)
+
+
+def mysql_date_format(python_format):
+    """strptime format to the STR_TO_DATE equivalent (minutes and seconds use different letters)."""
+    return python_format.replace('%M', '%i').replace('%S', '%s')
+
+
+def _decimal_bytes(digits):
+    leftover = [0, 1, 1, 2, 2, 3, 3, 4, 4, 4]
+    return digits // 9 * 4 + leftover[digits % 9]
+
+
+def storage_bytes(sql_type, average_length=0.0):
+    """Estimated InnoDB bytes for one value of sql_type (utf8mb4 strings, mostly ASCII)."""
+    if sql_type in INTEGER_BYTES:
+        return INTEGER_BYTES[sql_type]
+    decimal = _DECIMAL.match(sql_type)
+    if decimal:
+        precision, scale = int(decimal.group(1)), int(decimal.group(2))
+        return _decimal_bytes(precision - scale) + _decimal_bytes(scale)
+    fixed = {'BOOLEAN': 1, 'FLOAT': 4, 'DOUBLE': 8, 'DATE': 3, 'DATETIME': 5, 'TIME': 3}
+    if sql_type in fixed:
+        return fixed[sql_type]
+    if sql_type.startswith('ENUM('):
+        return 1 if len(enum_values(sql_type)) < 256 else 2
+    sized = _SIZED.match(sql_type)
+    if sized and sized.group(1) == 'CHAR':
+        return int(sized.group(2))
+    # VARCHAR/TEXT: the data plus a 1-2 byte length prefix
+    max_bytes = int(sized.group(2)) * 4 if sized else 65535
+    return average_length + (1 if max_bytes <= 255 else 2)
+
+
+def estimate_row_width(df, column_types):
+    """Estimated bytes per row of the table for df's data, including the NULL bitmap."""
+    width = math.ceil(len(column_types) / 8)
+    for col, sql_type in column_types.items():
+        average_length = 0.0
+        if is_string_type(sql_type) and col in df:
+            values = df[col].head(ROW_WIDTH_SAMPLE_ROWS).dropna()
+            average_length = float(values.astype(str).str.len().mean()) if not values.empty else 0.0
+        width += storage_bytes(sql_type, average_length)
+    return round(width, 1)
@@ -1,10 +1,127 @@
 # state.py
-_last_uploaded_table = None  # Using underscore to indicate "private" variable
+# Per-session conversation state (currently the last uploaded table), kept in a pluggable store.
+# The in-memory store is per process; the SQLite store is shared by every worker process on a host.
+# Any object with the same get/set methods can be installed with set_store().
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 
-def set_last_uploaded_table(table_name):
-    global _last_uploaded_table
-    _last_uploaded_table = table_name
+from flask import g, has_request_context
 
-def get_last_uploaded_table():
-    global _last_uploaded_table
-    return _last_uploaded_table
\ No newline at end of file
+STATE_BACKEND = os.environ.get('CHATDB_STATE_BACKEND', 'memory')  # 'memory' or 'sqlite'
+STATE_PATH = os.environ.get('CHATDB_STATE_PATH', 'chatdb_state.sqlite3')  # SQLite store location
+SESSION_HEADER = 'X-ChatDB-Session'  # API clients name their session with this header...
+SESSION_COOKIE = 'chatdb_session'  # ...browsers get a cookie
+DEFAULT_SESSION = 'default'  # Used outside requests, e.g. scripts and benchmarks
+SESSION_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+MAX_MEMORY_SESSIONS = 10000  # Least recently used sessions are dropped beyond this
+SESSION_TTL_SECONDS = 7 * 24 * 3600  # SQLite rows untouched for this long are pruned
+
+LAST_UPLOADED_TABLE = 'last_uploaded_table'
+
+
+class MemoryStateStore:
+    """Sessions in a dict guarded by a lock; only shared by threads of one process."""
+
+    def __init__(self, max_sessions=MAX_MEMORY_SESSIONS):
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._max_sessions = max_sessions
+
+    def get(self, session_id, key):
+        with self._lock:
+            values = self._sessions.get(session_id)
+            if values is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return values.get(key)
+
+    def set(self, session_id, key, value):
+        with self._lock:
+            self._sessions.setdefault(session_id, {})[key] = value
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last=False)
+
+
+class SQLiteStateStore:
+    """Sessions in a SQLite file, so every worker process on the host sees the same state."""
+
+    def __init__(self, path=STATE_PATH, ttl_seconds=SESSION_TTL_SECONDS):
+        self._path = path
+        self._ttl_seconds = ttl_seconds
+        self._local = threading.local()  # sqlite3 connections can't be shared between threads
+        self._last_prune = 0.0
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS session_state (session_id TEXT NOT NULL, key TEXT NOT NULL, "
+                         "value TEXT, updated_at REAL NOT NULL, PRIMARY KEY (session_id, key))")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5.0, isolation_level=None)
+            # WAL lets readers in other processes proceed while one worker writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id, key):
+        row = self._connection().execute("SELECT value FROM session_state WHERE session_id = ? AND key = ?",
+                                         (session_id, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, session_id, key, value):
+        now = time.time()
+        conn = self._connection()
+        conn.execute("INSERT INTO session_state (session_id, key, value, updated_at) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT (session_id, key) DO UPDATE SET value = excluded.value, "
+                     "updated_at = excluded.updated_at",
+                     (session_id, key, json.dumps(value), now))
+        if now - self._last_prune > 3600:
+            self._last_prune = now
+            conn.execute("DELETE FROM session_state WHERE updated_at < ?", (now - self._ttl_seconds,))
+
+
+_backends = {'memory': MemoryStateStore, 'sqlite': SQLiteStateStore}
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if STATE_BACKEND not in _backends:
+                raise ValueError(f"Unknown CHATDB_STATE_BACKEND {STATE_BACKEND!r}; expected one of {sorted(_backends)}")
+            _store = _backends[STATE_BACKEND]()
+        return _store
+
+
+def set_store(store):
+    """Install a different store, e.g. one backed by Redis for state shared across hosts."""
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def valid_session_id(session_id):
+    return isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+
+def current_session_id():
+    """The session of the request being handled (set by the app from header or cookie), else DEFAULT_SESSION."""
+    if has_request_context():
+        return g.get('session_id') or DEFAULT_SESSION
+    return DEFAULT_SESSION
+
+
+def set_last_uploaded_table(table_name, session_id=None):
+    get_store().set(session_id or current_session_id(), LAST_UPLOADED_TABLE, table_name)
+
+
+def get_last_uploaded_table(session_id=None):
+    return get_store().get(session_id or current_session_id(), LAST_UPLOADED_TABLE)
@@ -0,0 +1,40 @@
+# Shared setup for the chatdb tests. The app imports its modules flat from the chatdb
+# directory and picks its SQL backend when db.py is imported, so both are arranged here,
+# before any test module imports the app: SQL runs on the embedded SQLite backend, in a
+# scratch directory removed when the run ends, and MongoDB on the benchmarks' in-memory stand-in.
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+CHATDB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CHATDB_DIR)
+sys.path.insert(0, os.path.join(CHATDB_DIR, 'benchmarks'))  # standins.InMemoryMongo runs pipelines without a server
+
+WORKDIR = tempfile.mkdtemp(prefix='chatdb-tests-')
+os.environ['CHATDB_SQL_BACKEND'] = 'sqlite'
+os.environ['CHATDB_EMBEDDED_PATH'] = os.path.join(WORKDIR, 'embedded.sqlite3')
+os.environ['CHATDB_MANIFEST_PATH'] = os.path.join(WORKDIR, 'manifest.sqlite3')
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Flask test client saving uploads under tmp_path."""
+    import app as chatdb_app
+    monkeypatch.setitem(chatdb_app.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    return chatdb_app.app.test_client()
+
+
+@pytest.fixture
+def sql_connection():
+    """A connection to the embedded database, as get_db_connection() hands it to the app."""
+    from db import get_db_connection
+    conn = get_db_connection()
+    yield conn
+    conn.close()
@@ -0,0 +1,129 @@
+import mysql.connector
+import pytest
+
+import cost_guard
+from cost_guard import QueryTooExpensive
+
+
+class ExplainCursor:
+    """Answers EXPLAIN with a fixed MySQL plan of (id, rows, filtered) rows."""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.executed = []
+        self.description = [('id',), ('rows',), ('filtered',)]
+
+    def execute(self, statement, params=()):
+        self.executed.append(statement)
+
+    def fetchall(self):
+        return self.plan
+
+
+@pytest.fixture(autouse=True)
+def budget(monkeypatch):
+    monkeypatch.setattr(cost_guard, 'MAX_ESTIMATED_ROWS', 1000)
+    monkeypatch.setattr(cost_guard, 'EXPENSIVE_QUERY_ACTION', 'limit')
+    monkeypatch.setattr(cost_guard, 'AUTO_LIMIT_ROWS', 10)
+    monkeypatch.setattr(cost_guard, 'MAX_EXECUTION_MS', 500)
+
+
+@pytest.mark.parametrize('examined, returned, needed, expected', [
+    (1000, None, 10, 1000),  # Output size unknown: no saving
+    (1000, 100, 10, 100),
+    (1000, 100, 500, 1000),  # Never more than the whole query
+    (1000, 0, 1, 1000),
+    (999, 1000, 1, 1),
+])
+def test_bounded(examined, returned, needed, expected):
+    assert cost_guard._bounded(examined, returned, needed) == expected
+
+
+def test_within_budget_is_left_alone():
+    assert cost_guard._over_budget(1000, True, lambda rows: 0) is None
+
+
+def test_over_budget_gets_a_limit_when_it_bounds_the_work():
+    assert cost_guard._over_budget(5000, True, lambda rows: rows * 50) == {'limit': 10, 'estimated_rows': 5000}
+
+
+@pytest.mark.parametrize('limitable, bound', [(False, lambda rows: 0), (True, lambda rows: 5000)])
+def test_over_budget_is_rejected_when_no_limit_fits(limitable, bound):
+    with pytest.raises(QueryTooExpensive) as excinfo:
+        cost_guard._over_budget(5000, limitable, bound)
+    assert excinfo.value.to_dict()['estimated_rows'] == 5000
+
+
+def test_reject_action_never_limits(monkeypatch):
+    monkeypatch.setattr(cost_guard, 'EXPENSIVE_QUERY_ACTION', 'reject')
+    with pytest.raises(QueryTooExpensive):
+        cost_guard._over_budget(5000, True, lambda rows: 0)
+
+
+def test_zero_budget_skips_the_check(monkeypatch):
+    monkeypatch.setattr(cost_guard, 'MAX_ESTIMATED_ROWS', 0)
+    assert cost_guard._over_budget(10 ** 9, False, lambda rows: 10 ** 9) is None
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT * FROM t", "SELECT /*+ MAX_EXECUTION_TIME(500) */ * FROM t"),
+    ("select a from t", "SELECT /*+ MAX_EXECUTION_TIME(500) */ a from t"),
+    ("SELECT /*+ NO_INDEX(t) */ * FROM t", "SELECT /*+ NO_INDEX(t) */ * FROM t"),
+    ("UPDATE t SET a = 1", "UPDATE t SET a = 1"),
+])
+def test_with_execution_timeout(sql, expected):
+    assert cost_guard.with_execution_timeout(sql) == expected
+
+
+def test_is_timeout():
+    assert cost_guard.is_timeout(mysql.connector.Error(errno=cost_guard.MYSQL_TIMEOUT_ERRNO))
+    assert not cost_guard.is_timeout(mysql.connector.Error(errno=1146))
+    assert not cost_guard.is_timeout(ValueError())
+
+
+def test_guard_sql_adds_limit_to_streamable_select():
+    cursor = ExplainCursor([(1, 100000, 1.0)])
+    sql, auto_limit = cost_guard.guard_sql(cursor, "SELECT * FROM big WHERE note = 'x';")
+    assert cursor.executed == ["EXPLAIN SELECT * FROM big WHERE note = 'x';"]
+    assert sql == "SELECT /*+ MAX_EXECUTION_TIME(500) */ * FROM big WHERE note = 'x' LIMIT 10"
+    assert auto_limit == {'limit': 10, 'estimated_rows': 100000}
+
+
+def test_guard_sql_counts_nested_loop_joins():
+    # 100 outer rows, each probing 50 inner rows: 100 + 100 * 50 examined
+    cursor = ExplainCursor([(1, 100, 100.0), (1, 50, 100.0)])
+    with pytest.raises(QueryTooExpensive) as excinfo:
+        cost_guard.guard_sql(cursor, "SELECT a, COUNT(*) FROM t JOIN u USING (k) GROUP BY a")
+    assert excinfo.value.estimated_rows == 5100
+
+
+def test_guard_sql_trusts_an_existing_limit():
+    cursor = ExplainCursor([(1, 100000, 100.0)])
+    sql, auto_limit = cost_guard.guard_sql(cursor, "SELECT * FROM big LIMIT 5")
+    assert auto_limit is None
+    assert sql.endswith("LIMIT 5")
+
+
+def test_guard_sql_rejects_blocking_query():
+    cursor = ExplainCursor([(1, 100000, 100.0)])
+    with pytest.raises(QueryTooExpensive):
+        cost_guard.guard_sql(cursor, "SELECT * FROM big ORDER BY created LIMIT 5")
+
+
+def test_guard_sql_skips_statements_it_cannot_explain():
+    cursor = ExplainCursor([(1, 100000, 100.0)])
+    assert cost_guard.guard_sql(cursor, "DELETE FROM big") == ("DELETE FROM big", None)
+    assert cursor.executed == []
+
+
+def test_guard_sql_on_sqlite_runs_hinted_query(sql_connection):
+    cursor = sql_connection.cursor()
+    cursor.execute("DROP TABLE IF EXISTS guarded")
+    cursor.execute("CREATE TABLE guarded (id INT, name VARCHAR(20))")
+    cursor.execute("INSERT INTO guarded VALUES (1, 'a'), (2, 'b')")
+    # SQLite's EXPLAIN lists bytecode, not row estimates, so only the timeout hint is added
+    sql, auto_limit = cost_guard.guard_sql(cursor, "SELECT name FROM guarded ORDER BY id")
+    assert auto_limit is None
+    assert sql == "SELECT /*+ MAX_EXECUTION_TIME(500) */ name FROM guarded ORDER BY id"
+    cursor.execute(sql)
+    assert [row[0] for row in cursor.fetchall()] == ['a', 'b']
@@ -0,0 +1,25 @@
+import io
+
+import pytest
+
+import embedded
+
+
+@pytest.mark.parametrize('statement, expected', [
+    ("CREATE TABLE reviews (id TINYINT, text VARCHAR(64))",
+     "CREATE TABLE reviews (id TINYINT, text VARCHAR(64) COLLATE NOCASE)"),
+    ("CREATE TABLE t (Text TEXT, n DECIMAL(3,2))", "CREATE TABLE t (Text TEXT COLLATE NOCASE, n DECIMAL(3,2))"),
+    ("CREATE TABLE t (e ENUM('a, b TEXT','c'), text INT)", "CREATE TABLE t (e TEXT COLLATE NOCASE, text INT)"),
+    ("ALTER TABLE t ADD COLUMN text CHAR(3)", "ALTER TABLE t ADD COLUMN text CHAR(3) COLLATE NOCASE"),
+])
+def test_text_columns_compare_case_insensitively(statement, expected):
+    assert embedded.translate(statement) == expected
+
+
+def test_csv_with_text_column_loads(client):
+    response = client.post('/api/upload', data={'file': (io.BytesIO(b"id,text\n1,Good\n2,bad\n"), 'reviews.csv'),
+                                                'wait': 'true'})
+    assert response.status_code == 200, response.json
+    response = client.post('/api/execute_query', json={'query': "SELECT id FROM reviews WHERE text = 'GOOD'"})
+    assert response.status_code == 200, response.json
+    assert response.json['result'] == [[1]]
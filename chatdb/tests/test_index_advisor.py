@@ -0,0 +1,72 @@
+import mysql.connector
+import pytest
+
+import index_advisor
+
+QUERY = "SELECT * FROM adv WHERE region = 'west'"
+KEY = ('mysql', 'adv', ('region',))
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    """Fresh advisor state with auto-creation on; returns the index builds it schedules."""
+    for name in ('_uses', '_composites', '_queries', '_created', '_failed'):
+        monkeypatch.setattr(index_advisor, name, {})
+    monkeypatch.setattr(index_advisor, '_pending', set())
+    monkeypatch.setattr(index_advisor, 'AUTO_CREATE_INDEXES', True)
+    builds = []
+    monkeypatch.setattr(index_advisor._executor, 'submit', lambda function, *key: builds.append(key))
+    return builds
+
+
+def run_queries(count):
+    for _ in range(count):
+        index_advisor.record_sql(QUERY, 0.01)
+
+
+def fail_build(monkeypatch):
+    def refuse(table, columns):
+        raise mysql.connector.Error(msg="Lock wait timeout exceeded")
+    monkeypatch.setattr(index_advisor, '_create_mysql_index', refuse)
+    index_advisor._create_in_background(*KEY)
+
+
+def test_candidate_is_built_once_due(submitted):
+    run_queries(index_advisor.INDEX_MIN_USES)
+    assert submitted == [KEY]
+    run_queries(1)
+    assert submitted == [KEY]  # Still pending
+
+
+def test_failed_build_is_retried_after_a_delay(submitted, monkeypatch):
+    run_queries(index_advisor.INDEX_MIN_USES)
+    fail_build(monkeypatch)
+    [recommended] = index_advisor.recommendations()
+    assert recommended['columns'] == ['region'] and 'Lock wait' in recommended['last_error']
+    assert index_advisor.report()['failed'][0]['attempts'] == 1
+
+    run_queries(1)
+    assert submitted == [KEY]  # Backing off
+    index_advisor._failed[KEY]['retry_at'] = 0
+    run_queries(1)
+    assert submitted == [KEY, KEY]
+
+
+def test_retry_delay_doubles(submitted, monkeypatch):
+    fail_build(monkeypatch)
+    first = index_advisor._failed[KEY]
+    fail_build(monkeypatch)
+    second = index_advisor._failed[KEY]
+    assert second['attempts'] == 2
+    assert second['retry_at'] - second['failed_at'] == pytest.approx(2 * (first['retry_at'] - first['failed_at']))
+
+
+def test_success_and_reload_clear_the_failure(submitted, monkeypatch):
+    fail_build(monkeypatch)
+    index_advisor.forget('mysql', 'ADV')
+    assert index_advisor._failed == {}
+    fail_build(monkeypatch)
+    monkeypatch.setattr(index_advisor, '_create_mysql_index', lambda table, columns: 'idx_chatdb_region')
+    index_advisor._create_in_background(*KEY)
+    assert index_advisor._failed == {}
+    assert index_advisor._created[KEY]['index_name'] == 'idx_chatdb_region'
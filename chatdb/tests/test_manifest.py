@@ -0,0 +1,98 @@
+import hashlib
+import io
+
+import pytest
+
+import manifest
+
+
+@pytest.fixture(autouse=True)
+def manifest_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, 'MANIFEST_PATH', str(tmp_path / 'manifest.sqlite3'))
+
+
+def upload(sha256, filename='sales.csv'):
+    return {'filename': filename, 'sha256': sha256, 'bytes': 10}
+
+
+def loaded(rows=2, failed_rows=0):
+    return {'rows': rows, 'failed_rows': failed_rows, 'column_types': {'id': 'TINYINT'}}
+
+
+@pytest.mark.parametrize('write_mode', ['replace', 'upsert'])
+def test_reload_of_last_file_is_found(write_mode):
+    manifest.record('mysql', 'Sales', upload('aa'), write_mode, loaded())
+    found = manifest.loaded_file('mysql', 'sales', 'aa', write_mode)
+    assert found['sha256'] == 'aa' and found['rows'] == 2 and found['schema'] == {'id': 'TINYINT'}
+
+
+def test_append_always_loads():
+    manifest.record('mysql', 'sales', upload('aa'), 'append', loaded())
+    assert manifest.loaded_file('mysql', 'sales', 'aa', 'append') is None
+
+
+@pytest.mark.parametrize('sha256, write_mode, db_type', [
+    ('bb', 'replace', 'mysql'), ('aa', 'upsert', 'mysql'), ('aa', 'replace', 'mongodb'),
+])
+def test_other_contents_mode_or_database_loads(sha256, write_mode, db_type):
+    manifest.record('mysql', 'sales', upload('aa'), 'replace', loaded())
+    assert manifest.loaded_file(db_type, 'sales', sha256, write_mode) is None
+
+
+def test_only_the_last_file_counts():
+    manifest.record('mysql', 'sales', upload('aa'), 'upsert', loaded())
+    manifest.record('mysql', 'sales', upload('bb'), 'upsert', loaded())
+    assert manifest.loaded_file('mysql', 'sales', 'aa', 'upsert') is None
+    assert manifest.loaded_file('mysql', 'sales', 'bb', 'upsert') is not None
+
+
+def test_load_with_failed_rows_is_not_skipped():
+    manifest.record('mysql', 'sales', upload('aa'), 'replace', loaded(failed_rows=3))
+    assert manifest.loaded_file('mysql', 'sales', 'aa', 'replace') is None
+
+
+def test_replace_resets_file_list():
+    manifest.record('mysql', 'sales', upload('aa', 'a.csv'), 'append', loaded())
+    manifest.record('mysql', 'sales', upload('bb', 'b.csv'), 'append', loaded())
+    manifest.record('mysql', 'sales', upload('cc', 'c.csv'), 'replace', loaded())
+    [entry] = manifest.report()['loaded']
+    assert [file['filename'] for file in entry['files']] == ['c.csv']
+
+
+def test_file_list_is_capped(monkeypatch):
+    monkeypatch.setattr(manifest, 'MAX_FILES_PER_TABLE', 3)
+    for n in range(5):
+        manifest.record('mysql', 'sales', upload(str(n)), 'append', loaded())
+    [entry] = manifest.report()['loaded']
+    assert [file['sha256'] for file in entry['files']] == ['2', '3', '4']
+
+
+def test_forget():
+    manifest.record('mysql', 'sales', upload('aa'), 'replace', loaded())
+    manifest.record('mysql', 'stock', upload('bb'), 'replace', loaded())
+    manifest.record('mongodb', 'sales', upload('cc'), 'replace', loaded())
+    manifest.forget('mysql', 'SALES')
+    assert [(entry['db_type'], entry['name']) for entry in manifest.report()['loaded']] == [
+        ('mongodb', 'sales'), ('mysql', 'stock')]
+    manifest.forget('mysql')
+    assert [entry['db_type'] for entry in manifest.report()['loaded']] == ['mongodb']
+
+
+def test_save_and_hash(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, 'HASH_BLOCK_SIZE', 4)
+    data = b"id,name\n1,a\n2,b\n"
+    path = tmp_path / 'copy.csv'
+    assert manifest.save_and_hash(io.BytesIO(data), str(path)) == (hashlib.sha256(data).hexdigest(), len(data))
+    assert path.read_bytes() == data
+
+
+def test_upload_of_loaded_file_is_skipped(client):
+    def post(**form):
+        data = {'file': (io.BytesIO(b"id,name\n1,a\n"), 'mf_upload.csv'), 'wait': 'true', **form}
+        response = client.post('/api/upload', data=data)
+        assert response.status_code == 200, response.json
+        return response.json
+
+    assert not post().get('skipped')
+    assert post()['message'] == 'File already loaded'
+    assert not post(force='true').get('skipped')
@@ -0,0 +1,81 @@
+import pytest
+
+from mongo_pipeline import build_pipeline
+from standins import InMemoryMongo
+
+SALES = [
+    {'_id': 1, 'category': 'toys', 'region': 'west', 'amount': 5},
+    {'_id': 2, 'category': 'toys', 'region': 'east', 'amount': 7},
+    {'_id': 3, 'category': 'books', 'region': 'west', 'amount': 2},
+    {'_id': 4, 'category': 'books', 'region': 'west', 'amount': 4},
+    {'_id': 5, 'category': 'games', 'region': 'east', 'amount': 9},
+]
+GROUP = {'_id': '$category', 'total': {'$sum': '$amount'}}
+
+
+def run(pipeline):
+    database = InMemoryMongo()
+    database['sales'].insert_many([dict(document) for document in SALES])
+    return sorted(database['sales'].aggregate(pipeline), key=lambda document: str(document['_id']))
+
+
+def as_written(spec):
+    """The stages in request order: group, then the query on what it produced."""
+    pipeline = [{'$group': spec['group']}] if 'group' in spec else []
+    if spec.get('query'):
+        pipeline.append({'$match': spec['query']})
+    if spec.get('sort'):
+        pipeline.append({'$sort': spec['sort']})
+    return pipeline
+
+
+def test_base_filter_runs_first_and_limit_follows_sort():
+    pipeline = build_pipeline({'query': {'region': 'west'}, 'sort': {'amount': -1}, 'skip': 1, 'limit': 2})
+    assert pipeline == [{'$match': {'region': 'west'}}, {'$sort': {'amount': -1}}, {'$limit': 3}, {'$skip': 1}]
+
+
+def test_group_key_filter_moves_ahead_of_group():
+    pipeline = build_pipeline({'group': GROUP, 'query': {'_id': 'toys'}})
+    assert pipeline == [{'$match': {'category': 'toys'}}, {'$group': GROUP}]
+
+
+def test_compound_group_key_filter_maps_to_its_field():
+    group = {'_id': {'c': '$category', 'r': '$region'}, 'n': {'$sum': 1}}
+    pipeline = build_pipeline({'group': group, 'query': {'_id.c': 'books'}})
+    assert pipeline == [{'$match': {'category': 'books'}}, {'$group': group}]
+
+
+@pytest.mark.parametrize('query', [
+    {'region': 'west'},  # $group drops the field, so this matches no group
+    {'total': {'$gt': 6}},  # Accumulators exist only after the group
+    {'_id': {'$exists': True}},  # A missing key field still forms the _id: null group
+])
+def test_other_group_filters_stay_after_group(query):
+    pipeline = build_pipeline({'group': GROUP, 'query': query})
+    assert pipeline == [{'$group': GROUP}, {'$match': query}]
+
+
+@pytest.mark.parametrize('query', [
+    {'_id': 'toys'},
+    {'_id': {'$in': ['books', 'games']}},
+    {'region': 'west'},
+    {'total': {'$gt': 6}},
+    {'_id': {'$ne': 'toys'}, 'total': {'$lt': 9}},
+])
+def test_group_results_match_request_order(query):
+    spec = {'group': GROUP, 'query': query}
+    assert run(build_pipeline(spec)) == run(as_written(spec))
+
+
+def test_filter_on_joined_field_stays_after_lookup():
+    spec = {'lookup': {'from': 'orders', 'localField': 'order_id', 'foreignField': '_id', 'as': 'order'},
+            'unwind': '$order', 'query': {'order.status': 'open', 'region': 'west'}}
+    pipeline = build_pipeline(spec)
+    assert pipeline[0] == {'$match': {'region': 'west'}}
+    assert pipeline[-1] == {'$match': {'order.status': 'open'}}
+
+
+def test_caller_aggregation_is_kept_as_written():
+    aggregation = [{'$match': {'region': 'west'}}, {'$group': GROUP}]
+    pipeline = build_pipeline({'aggregation': aggregation, 'query': {'total': {'$gt': 1}}, 'limit': 1})
+    assert pipeline == aggregation + [{'$match': {'total': {'$gt': 1}}}, {'$limit': 1}]
@@ -0,0 +1,70 @@
+import io
+
+import pytest
+
+import query_cache
+
+
+def cache(db_type, query_text, tables, value):
+    key = query_cache.make_key(db_type, query_text)
+    query_cache.put(key, db_type, query_cache.snapshot(db_type, tables), value)
+    return key
+
+
+@pytest.mark.parametrize('sql_query, tables', [
+    ("SELECT * FROM Orders o JOIN `shop`.`customers` c ON o.cid = c.id WHERE o.total > 5", {'orders', 'customers'}),
+    ("select a from t1, t2 where t1.x = t2.x", {'t1', 't2'}),
+    ("SELECT NOW(), id FROM orders", None),
+    ("DELETE FROM orders", None),
+])
+def test_sql_tables(sql_query, tables):
+    assert query_cache.sql_tables(sql_query) == tables
+
+
+def test_normalize_sql_keeps_literals():
+    assert query_cache.normalize_sql("SELECT  *\n FROM t WHERE name = 'a  b' ;") == "SELECT * FROM t WHERE name = 'a  b'"
+
+
+def test_bump_invalidates_only_results_that_read_the_table():
+    orders = cache('mysql', 'SELECT * FROM qc_orders', {'qc_orders'}, {'result': [[1]]})
+    joined = cache('mysql', 'SELECT * FROM qc_orders JOIN qc_items', {'qc_orders', 'qc_items'}, {'result': [[2]]})
+    items = cache('mysql', 'SELECT * FROM qc_items', {'qc_items'}, {'result': [[3]]})
+    query_cache.bump('mysql', 'QC_Orders')
+    assert query_cache.get(orders) is None
+    assert query_cache.get(joined) is None
+    assert query_cache.get(items) == {'result': [[3]]}
+
+
+def test_epoch_bump_invalidates_every_result_of_the_backend():
+    sql_key = cache('mysql', 'SELECT * FROM qc_epoch', {'qc_epoch'}, {'result': []})
+    mongo_key = cache('mongodb', 'qc_epoch:[]', {'qc_epoch'}, {'result': []})
+    query_cache.bump('mysql')
+    assert query_cache.get(sql_key) is None
+    assert query_cache.get(mongo_key) == {'result': []}
+
+
+def test_result_of_a_query_overtaken_by_a_write_is_not_cached():
+    key = query_cache.make_key('mysql', 'SELECT * FROM qc_race')
+    versions = query_cache.snapshot('mysql', {'qc_race'})
+    query_cache.bump('mysql', 'qc_race')  # A load finished while the query ran
+    query_cache.put(key, 'mysql', versions, {'result': [[1]]})
+    assert query_cache.get(key) is None
+
+
+def test_upload_invalidates_cached_query(client):
+    def upload(data):
+        response = client.post('/api/upload', data={'file': (io.BytesIO(data), 'qc_upload.csv'), 'wait': 'true'})
+        assert response.status_code == 200, response.json
+
+    def count():
+        response = client.post('/api/execute_query', json={'query': 'SELECT COUNT(*) FROM qc_upload'})
+        assert response.status_code == 200, response.json
+        return response.json['result'][0][0]
+
+    upload(b"id,name\n1,a\n2,b\n")
+    assert count() == 2
+    hits = query_cache.cache_stats()['hits']
+    assert count() == 2
+    assert query_cache.cache_stats()['hits'] == hits + 1
+    upload(b"id,name\n1,a\n2,b\n3,c\n")
+    assert count() == 3
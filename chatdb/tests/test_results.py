@@ -0,0 +1,133 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+import pytest
+from bson import ObjectId
+
+import results
+
+QUERY = "SELECT * FROM ledger"
+
+
+@pytest.mark.parametrize('last_key', [
+    None, 7, 2.5, 'k', Decimal('12.50'), date(2024, 1, 2), datetime(2024, 1, 2, 3, 4, 5, 6), time(1, 2, 3),
+    timedelta(days=-1, seconds=5, microseconds=7), b'\x00\xff', ObjectId(),
+])
+def test_cursor_round_trip_keeps_key_type(last_key):
+    state = results.page_state(QUERY, page_size=2, order_key='id')
+    token = results.next_cursor(state, [[1], [2]], last_key)
+    decoded = results.decode_cursor(token, QUERY)
+    assert decoded['l'] == last_key
+    assert type(decoded['l']) is type(last_key)
+    assert decoded['o'] == 2 and decoded['n'] == 2 and decoded['k'] == 'id'
+
+
+def test_last_page_has_no_cursor():
+    state = results.page_state(QUERY, page_size=3)
+    assert results.next_cursor(state, [[1], [2]]) is None
+
+
+@pytest.mark.parametrize('token', ['not-a-token', results.encode_cursor([1]), results.encode_cursor({'$oid': 'x'})])
+def test_invalid_cursor_is_rejected(token):
+    with pytest.raises(ValueError, match="Invalid cursor token"):
+        results.decode_cursor(token, QUERY)
+
+
+def test_cursor_is_bound_to_its_query():
+    token = results.encode_cursor(results.page_state(QUERY, page_size=2))
+    with pytest.raises(ValueError, match="different query"):
+        results.decode_cursor(token, "SELECT * FROM other")
+
+
+def test_keyset_page_ends_between_key_values():
+    state = results.page_state(QUERY, page_size=4, order_key='g')
+    rows = [[1, 'a'], [2, 'b'], [3, 'b'], [4, 'c'], [5, 'c']]  # One row more than the page
+    page, token = results.keyset_page(state, rows, lambda row: row[1])
+    assert page == rows[:3]  # The run of 'c' straddles the page end and goes to the next page
+    following = results.decode_cursor(token, QUERY)
+    assert following['l'] == 'b' and following['o'] == 3
+
+
+def test_keyset_page_last_page_has_no_cursor():
+    state = results.page_state(QUERY, page_size=4, order_key='g')
+    rows = [[1, 'a'], [2, 'a'], [3, 'b'], [4, 'b']]
+    assert results.keyset_page(state, rows, lambda row: row[1]) == (rows, None)
+
+
+@pytest.mark.parametrize('keys', [['a', 'a', 'a'], [None, None, 'a']])
+def test_keyset_page_rejects_a_value_filling_the_page(keys):
+    state = results.page_state(QUERY, page_size=2, order_key='g')
+    with pytest.raises(ValueError, match="fills a whole page"):
+        results.keyset_page(state, [[key] for key in keys], lambda row: row[0])
+
+
+def test_invalid_order_key_is_rejected():
+    with pytest.raises(ValueError):
+        results.page_state(QUERY, order_key='id; DROP TABLE ledger')
+
+
+def read_pages(client, query, page_size=2, **paging):
+    rows = []
+    cursor = None
+    while True:
+        response = client.post('/api/execute_query', json=dict(paging, query=query, page_size=page_size, cursor=cursor,
+                                                                cache=False))
+        assert response.status_code == 200, response.json
+        rows.extend(response.json['result'])
+        cursor = response.json.get('next_cursor')
+        if not cursor:
+            return rows
+
+
+@pytest.fixture
+def ledger(sql_connection):
+    cursor = sql_connection.cursor()
+    cursor.execute("DROP TABLE IF EXISTS ledger")
+    cursor.execute("CREATE TABLE ledger (id INT, amount DECIMAL(6,2), day DATE, grp TINYINT)")
+    cursor.executemany("INSERT INTO ledger VALUES (%s, %s, %s, %s)",
+                       [(i, f"{i * 1.25:.2f}", f"2024-01-{i:02d}", i // 3) for i in range(1, 8)])
+    sql_connection.commit()
+    cursor.close()
+
+
+@pytest.mark.parametrize('paging', [
+    {}, {'order_key': 'amount'}, {'order_key': 'day'},
+    {'order_key': 'grp', 'page_size': 4},  # Runs of 3 equal values straddle page ends
+])
+def test_paging_returns_every_row_once(client, ledger, paging):
+    rows = read_pages(client, QUERY, **paging)
+    assert sorted(row[0] for row in rows) == list(range(1, 8))
+
+
+def test_paging_on_key_with_long_runs_is_rejected(client, ledger):
+    paging = {'query': QUERY, 'page_size': 2, 'order_key': 'grp', 'cache': False}
+    first = client.post('/api/execute_query', json=paging)
+    assert [row[3] for row in first.json['result']] == [0, 0]
+    response = client.post('/api/execute_query', json=dict(paging, cursor=first.json['next_cursor']))
+    assert response.status_code == 400
+    assert "fills a whole page" in response.json['error']
+
+
+def test_estimated_size_scales_a_sample():
+    rows = [[i, 'x' * 10] for i in range(1000, 3000)]
+    assert results.estimated_size(rows) == pytest.approx(results.encoded_size(rows), rel=0.01)
+    assert results.estimated_size(rows[:5]) == results.encoded_size(rows[:5])
+
+
+class RowCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+def test_fetch_capped_stops_at_byte_cap(monkeypatch):
+    monkeypatch.setattr(results, 'FETCH_SIZE', 100)
+    monkeypatch.setattr(results, 'MAX_RESULT_BYTES', 5000)
+    rows = [(i, 'y' * 20) for i in range(1000)]
+    fetched, truncated = results.fetch_capped(RowCursor(rows))
+    assert truncated
+    assert len(fetched) % 100 == 0 and 5000 <= results.encoded_size(fetched) < 5000 + 100 * 40
+    assert results.fetch_capped(RowCursor(rows[:50])) == ([list(row) for row in rows[:50]], False)
@@ -0,0 +1,60 @@
+import pytest
+
+from space import LiteralToken, NumberToken, Token, tokenize_input
+
+
+def kinds(text):
+    return [(str(token), token.kind, token.sql) for token in tokenize_input(text)]
+
+
+def test_tokens_compare_like_strings():
+    tokens = tokenize_input("show price")
+    assert tokens == ['show', 'price']
+    assert all(isinstance(token, Token) for token in tokens)
+
+
+def test_quoted_phrase_is_one_literal():
+    tokens = tokenize_input('show rows where city = "New York"')
+    assert isinstance(tokens[-1], LiteralToken)
+    assert tokens[-1] == 'new york'
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("price greater than or equal to 5", ('greater than or equal to', 'comparison', '>=')),
+    ("price >= 5", ('>=', 'comparison', '>=')),
+    ("price greater than 5", ('greater than', 'comparison', '>')),
+])
+def test_longest_comparison_phrase_wins(text, expected):
+    assert kinds(text)[1] == expected
+
+
+def test_having_more_than_one():
+    assert kinds("customers having more than one order") == [
+        ('customers', 'word', None), ('having', 'keyword', 'HAVING'), ('count', 'aggregate', 'COUNT'),
+        ('>', 'comparison', '>'), ('1', 'number', None), ('order', 'word', None),
+    ]
+
+
+@pytest.mark.parametrize('text', ["top 5 sales", "first 5 sales"])
+def test_top_n_becomes_limit(text):
+    assert kinds(text)[:2] == [('limit', 'keyword', 'LIMIT'), ('5', 'number', None)]
+
+
+@pytest.mark.parametrize('text', ["sales descending order", "sales desc"])
+def test_descending_becomes_desc(text):
+    assert kinds(text)[-1] == ('desc', 'direction', 'DESC')
+
+
+def test_all_dropped_outside_sql_context():
+    assert tokenize_input("show all rows") == ['show', 'rows']
+
+
+def test_digits_are_number_tokens():
+    tokens = tokenize_input("price 42 abc")
+    assert isinstance(tokens[1], NumberToken)
+    assert tokens[1].kind == 'number'
+    assert tokens[2].kind == 'word' and tokens[2].sql is None
+
+
+def test_abbreviated_name_is_one_token():
+    assert tokenize_input("courses by dr. smith")[-1] == 'dr. smith'
@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+
+import sql_types
+
+
+@pytest.mark.parametrize('values, expected', [
+    ([1, 2, 300], 'SMALLINT'),
+    ([-1, 70000], 'MEDIUMINT'),
+    ([1.0, None, 5.0], 'TINYINT'),  # Whole floats with gaps are integers
+    ([1.25, 3.5], 'DECIMAL(3,2)'),
+    ([True, False], 'BOOLEAN'),
+    (['2024-01-02', '2023-12-31'], 'DATE'),
+    (['12:30:00'], 'TIME'),
+    (['abc', 'defg'], 'VARCHAR(16)'),
+    (['a', 'b'] * 200, "ENUM('a','b')"),
+    (['x' * 300], 'TEXT'),
+    ([None, None], None),
+])
+def test_infer_sql_type(values, expected):
+    assert sql_types.infer_sql_type(pd.Series(values)) == expected
+
+
+def test_infer_sql_type_lenient_enum():
+    # Too few rows to call the column low-cardinality, unless checking a later chunk
+    values = pd.Series(['a', 'b'] * 10)
+    assert not sql_types.infer_sql_type(values).startswith('ENUM(')
+    assert sql_types.infer_sql_type(values, strict=False) == "ENUM('a','b')"
+
+
+@pytest.mark.parametrize('values, expected', [
+    (['NY', 'ny'] * 200, 'CHAR(2)'),
+    (['Yes', 'yes', 'No'] * 200, 'VARCHAR(16)'),
+    (['resume', 'résumé'] * 200, 'CHAR(6)'),
+])
+def test_no_enum_when_members_collide_under_collation(values, expected):
+    # MySQL's default collation treats these as one member and CREATE TABLE rejects the ENUM
+    assert sql_types.infer_sql_type(pd.Series(values)) == expected
+
+
+@pytest.mark.parametrize('current, observed, expected', [
+    ('INT', None, 'INT'),
+    ('TINYINT', 'INT', 'INT'),
+    ('BOOLEAN', 'TINYINT', 'TINYINT'),
+    ('INT', 'DECIMAL(5,2)', 'DECIMAL(12,2)'),
+    ('DECIMAL(5,2)', 'DOUBLE', 'DOUBLE'),
+    ('DATE', 'DATETIME', 'DATETIME'),
+    ('DATE', 'INT', 'VARCHAR(16)'),
+    ('INT', 'VARCHAR(16)', 'VARCHAR(16)'),
+    ("ENUM('a','b')", "ENUM('c')", "ENUM('a','b','c')"),
+    ("ENUM('NY','CA')", "ENUM('ny')", 'VARCHAR(16)'),
+    ('CHAR(3)', 'CHAR(3)', 'CHAR(3)'),
+    ('CHAR(3)', 'VARCHAR(32)', 'VARCHAR(32)'),
+    ('VARCHAR(255)', 'TEXT', 'TEXT'),
+])
+def test_widen_sql_type(current, observed, expected):
+    assert sql_types.widen_sql_type(current, observed) == expected
+
+
+@pytest.mark.parametrize('current, observed', [
+    ('TINYINT', 'BIGINT'), ('INT', 'DECIMAL(5,2)'), ('DATE', 'VARCHAR(32)'), ("ENUM('a')", 'TEXT'),
+])
+def test_widen_sql_type_is_symmetric(current, observed):
+    assert sql_types.widen_sql_type(current, observed) == sql_types.widen_sql_type(observed, current)
+
+
+def test_loaded_table_has_inferred_types(tmp_path, sql_connection):
+    import app as chatdb_app
+    path = tmp_path / 'typed.csv'
+    path.write_text("id,price,day,name\n1,1.25,2024-01-02,ann\n2,3.5,2023-12-31,bob\n")
+    chatdb_app.process_csv_file_and_load_to_db(str(path), 'typed_sample')
+    cursor = sql_connection.cursor()
+    cursor.execute("DESCRIBE typed_sample")
+    described = {row[0]: row[1].upper() for row in cursor.fetchall()}
+    assert described['id'] == 'TINYINT'
+    assert described['price'] == 'DECIMAL(3,2)'
+    assert described['day'] == 'DATE'
+    cursor.execute("SELECT name FROM typed_sample WHERE day = '2024-01-02'")
+    assert cursor.fetchall() == [('ann',)]
+    cursor.close()
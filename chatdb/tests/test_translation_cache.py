@@ -0,0 +1,45 @@
+from collections import OrderedDict
+
+import pytest
+
+import translation_cache
+
+
+@pytest.fixture
+def ask(monkeypatch):
+    """Returns ask(question, table): translate() with table as the current one, counting real translations."""
+    monkeypatch.setattr(translation_cache, '_entries', OrderedDict())
+    monkeypatch.setattr(translation_cache, '_versions', {})
+    translated = []
+
+    def natural_language_to_sql(text, table_name):
+        translated.append(table_name)
+        return f"SELECT * FROM {table_name}"
+    monkeypatch.setattr(translation_cache, 'natural_language_to_sql', natural_language_to_sql)
+
+    def ask(question, table_name):
+        monkeypatch.setattr(translation_cache, 'get_last_uploaded_table', lambda: table_name)
+        return translation_cache.translate(question)
+    ask.translated = translated
+    return ask
+
+
+def test_repeated_question_is_served_from_cache(ask):
+    assert ask("show all rows", 'sales') == "SELECT * FROM sales"
+    assert ask("Show  ALL rows", 'sales') == "SELECT * FROM sales"
+    assert ask.translated == ['sales']
+
+
+def test_tables_differing_in_case_keep_their_own_sql(ask):
+    assert ask("show all rows", 'Sales') == "SELECT * FROM Sales"
+    assert ask("show all rows", 'sales') == "SELECT * FROM sales"
+    assert translation_cache.translate_batch(["show all rows"]) == [{'sql_query': "SELECT * FROM sales"}]
+
+
+def test_bump_invalidates_every_case_of_the_name(ask):
+    ask("show all rows", 'Sales')
+    ask("show all rows", 'sales')
+    translation_cache.bump('SALES')
+    ask("show all rows", 'Sales')
+    ask("show all rows", 'sales')
+    assert ask.translated == ['Sales', 'sales', 'Sales', 'sales']
@@ -0,0 +1,177 @@
+# translation_cache.py
+# LRU cache in front of space.natural_language_to_sql. Entries are keyed by the normalized
+# question, the table it was asked against and that table's schema version; re-uploading
+# the table bumps its version so older translations are never served. Translations are
+# recorded with the index advisor here in the app process, whether they were cached,
+# translated in this thread or in a worker process.
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import index_advisor
+import metrics
+from space import natural_language_to_sql
+from state import get_last_uploaded_table
+
+TRANSLATION_CACHE_MAX_ENTRIES = 1024
+MAX_BATCH_SIZE = 10000  # Questions accepted by one batch request
+BATCH_PARALLEL_THRESHOLD = 200  # Smaller batches are translated in-process; shipping them to workers costs more
+BATCH_CHUNK_SIZE = 100  # Questions sent to a worker process at a time
+TRANSLATE_WORKERS = os.cpu_count() or 1
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # (text, table, version) -> SQL
+_versions = {}  # lowercased table name -> int
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def normalize_question(input_text):
+    """The tokenizer lowercases and splits on whitespace, so neither changes the translation."""
+    return " ".join(input_text.lower().split())
+
+
+def _key(text, table_name):
+    # The SQL names the table as given, and table names can be case-sensitive (MySQL on Linux), so
+    # "Sales" and "sales" get entries of their own; a re-upload of either bumps both (see bump())
+    return text, table_name, _versions.get(table_name.lower() if table_name else None, 0)
+
+
+def translate(input_text):
+    """natural_language_to_sql(input_text), served from the cache when the same question was already asked."""
+    text = normalize_question(input_text)
+    table_name = get_last_uploaded_table()
+    with _lock:
+        key = _key(text, table_name)
+        sql_query = _entries.get(key)
+        if sql_query is not None:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            index_advisor.record_translation(sql_query)
+            return sql_query
+        _stats['misses'] += 1
+
+    with metrics.stage('translate'):
+        sql_query = natural_language_to_sql(text, table_name)
+    index_advisor.record_translation(sql_query)
+
+    with _lock:
+        # Don't cache if the table was re-uploaded while translating
+        if _key(text, table_name) == key:
+            _entries[key] = sql_query
+            while len(_entries) > TRANSLATION_CACHE_MAX_ENTRIES:
+                _entries.popitem(last=False)
+                _stats['evictions'] += 1
+    return sql_query
+
+
+def _translate_item(text, table_name):
+    try:
+        return natural_language_to_sql(text, table_name), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _translate_chunk(table_name, texts):
+    """Runs in a worker process, which can't see the request's session, so the table is passed in."""
+    return [_translate_item(text, table_name) for text in texts]
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: the app process holds DB clients and worker threads
+            _pool = ProcessPoolExecutor(max_workers=TRANSLATE_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _translate_many(table_name, texts):
+    if len(texts) < BATCH_PARALLEL_THRESHOLD or TRANSLATE_WORKERS < 2:
+        return [_translate_item(text, table_name) for text in texts]
+    chunks = [texts[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(texts), BATCH_CHUNK_SIZE)]
+    try:
+        futures = [_get_pool().submit(_translate_chunk, table_name, chunk) for chunk in chunks]
+        return [item for future in futures for item in future.result()]
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool next time and finish this batch here
+        _reset_pool()
+        return [_translate_item(text, table_name) for text in texts]
+
+
+def translate_batch(questions):
+    """Translate a list of questions. Returns one {'sql_query'} or {'error'} dict per question, in order.
+
+    Cached and repeated questions are translated once; the rest go to a process
+    pool when there are at least BATCH_PARALLEL_THRESHOLD of them.
+    """
+    table_name = get_last_uploaded_table()
+    results = [None] * len(questions)
+    pending = {}  # normalized text -> indexes of questions still to translate
+    with _lock:
+        for index, question in enumerate(questions):
+            if not isinstance(question, str):
+                results[index] = {'error': 'Each query must be a string'}
+                continue
+            text = normalize_question(question)
+            sql_query = _entries.get(_key(text, table_name))
+            if sql_query is not None:
+                _entries.move_to_end(_key(text, table_name))
+                _stats['hits'] += 1
+                results[index] = {'sql_query': sql_query}
+            else:
+                _stats['misses'] += 1
+                pending.setdefault(text, []).append(index)
+        keys = {text: _key(text, table_name) for text in pending}
+
+    texts = list(pending)
+    with metrics.stage('translate'):
+        translated = _translate_many(table_name, texts)
+
+    with _lock:
+        for text, (sql_query, error) in zip(texts, translated):
+            for index in pending[text]:
+                results[index] = {'sql_query': sql_query} if error is None else {'error': error}
+            if error is None and _key(text, table_name) == keys[text]:
+                _entries[keys[text]] = sql_query
+        while len(_entries) > TRANSLATION_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats['evictions'] += 1
+    for result in results:
+        if 'sql_query' in result:
+            index_advisor.record_translation(result['sql_query'])
+    return results
+
+
+def bump(table_name):
+    """Invalidate cached translations for table_name, e.g. after it was re-uploaded."""
+    name = table_name.lower()
+    with _lock:
+        _versions[name] = _versions.get(name, 0) + 1
+        stale = [key for key in _entries if key[1] and key[1].lower() == name]
+        for key in stale:
+            del _entries[key]
+        _stats['invalidations'] += len(stale)
+
+
+def cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats.update({'entries': len(_entries), 'max_entries': TRANSLATION_CACHE_MAX_ENTRIES,
+                      'workers': TRANSLATE_WORKERS, 'pool_started': _pool is not None})
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats